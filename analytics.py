@@ -0,0 +1,195 @@
+'''
+Group spending analytics on a columnar copy of a group's items.
+
+GroupColumns keeps one row per share (payer -> splitter, amount in minor units) and one
+row per item (total, creation time from the push id). summarize() aggregates them with
+NumPy grouped operations (bincount / unique / argpartition) when NumPy is installed and
+with plain dicts otherwise; both give identical results. NumPy is imported on the first
+summary, so workers that never serve analytics never load it.
+
+GroupAnalytics caches columns and summary per group, validated by the ETag of
+groupItemIndex/{gid}: the index changes on every item create / delete (from any worker),
+so an unchanged group costs one conditional read and a changed one only fetches new items.
+'''
+import heapq
+import threading
+from datetime import datetime, timezone
+from push_ids import push_id_timestamp
+from split_logic import from_minor, to_minor
+from ttl_cache import TTLCache, MISSING
+
+DAY_MS = 86_400_000
+
+_np = None  # numpy module, False when not installed; imported on the first summary, not at app import
+
+
+def _numpy():
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:  # optional: the pure-Python path gives the same numbers, just slower
+            _np = False
+    return _np or None
+
+
+class GroupColumns:
+    """Parallel lists of one group's items; copy() before changing a cached instance."""
+    __slots__ = ("members", "names", "share_item", "share_payer", "share_splitter", "share_amount",
+                 "item_ids", "item_names", "item_payer", "item_amount", "item_ts")
+
+    def __init__(self):
+        self.members = {}  # uid -> column index
+        self.names = {}
+        self.share_item, self.share_payer, self.share_splitter, self.share_amount = [], [], [], []
+        self.item_ids, self.item_names, self.item_payer, self.item_amount, self.item_ts = [], [], [], [], []
+
+    def copy(self):
+        other = GroupColumns()
+        other.members, other.names = dict(self.members), dict(self.names)
+        for name in self.__slots__[2:]: setattr(other, name, list(getattr(self, name)))
+        return other
+
+    def _member(self, uid, name=None):
+        if name: self.names.setdefault(uid, name)
+        return self.members.setdefault(uid, len(self.members))
+
+    def extend(self, items):
+        for item in items:
+            if not item or not item.get("itemPayer"): continue
+            payer_names = item.get("itemPayerNames") or []
+            splitter_names = item.get("itemSpliterNames") or []
+            payer = self._member(item["itemPayer"][0], payer_names[0] if payer_names else None)
+            total = 0
+            for i, (uid, value) in enumerate(zip(item.get("itemSpliter") or [], item.get("itemSpliterValue") or [])):
+                units = to_minor(value)
+                self.share_item.append(item.get("itemId"))
+                self.share_payer.append(payer)
+                self.share_splitter.append(self._member(uid, splitter_names[i] if i < len(splitter_names) else None))
+                self.share_amount.append(units)
+                total += units
+            self.item_ids.append(item.get("itemId"))
+            self.item_names.append(item.get("itemName", ""))
+            self.item_payer.append(payer)
+            self.item_amount.append(total)
+            self.item_ts.append(push_id_timestamp(item.get("itemId")) or 0)
+
+    def remove(self, item_ids):
+        keep = [i for i, item_id in enumerate(self.share_item) if item_id not in item_ids]
+        for name in ("share_item", "share_payer", "share_splitter", "share_amount"):
+            column = getattr(self, name)
+            setattr(self, name, [column[i] for i in keep])
+        keep = [i for i, item_id in enumerate(self.item_ids) if item_id not in item_ids]
+        for name in ("item_ids", "item_names", "item_payer", "item_amount", "item_ts"):
+            column = getattr(self, name)
+            setattr(self, name, [column[i] for i in keep])
+
+
+def _day(day):
+    return datetime.fromtimestamp(day * 86400, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _aggregate_numpy(c, top):
+    np = _numpy()
+    n = len(c.members)
+    payer = np.asarray(c.share_payer, dtype=np.int64)
+    splitter = np.asarray(c.share_splitter, dtype=np.int64)
+    amount = np.asarray(c.share_amount, dtype=np.int64)
+    # float64 weights are exact for sums below 2**53 paise
+    paid = np.bincount(payer, weights=amount, minlength=n).astype(np.int64)
+    share = np.bincount(splitter, weights=amount, minlength=n).astype(np.int64)
+
+    totals = np.asarray(c.item_amount, dtype=np.int64)
+    stamps = np.asarray(c.item_ts, dtype=np.int64)
+    dated = stamps > 0
+    days, day_index = np.unique(stamps[dated] // DAY_MS, return_inverse=True)
+    per_day = np.bincount(day_index, weights=totals[dated], minlength=len(days)).astype(np.int64)
+    months, month_index = np.unique(days.astype("datetime64[D]").astype("datetime64[M]"), return_inverse=True)
+    per_month = np.bincount(month_index, weights=per_day, minlength=len(months)).astype(np.int64)
+
+    k = min(top, len(totals))
+    largest = np.empty(0, dtype=np.int64)
+    if k:
+        # O(n) selection of the k-th largest; ties at the boundary go to the oldest items
+        kth = np.partition(totals, len(totals) - k)[len(totals) - k]
+        above = np.flatnonzero(totals > kth)
+        largest = np.concatenate((above, np.flatnonzero(totals == kth)[:k - len(above)]))
+        largest = largest[np.lexsort((largest, -totals[largest]))]
+    return (paid.tolist(), share.tolist(), [(_day(int(d)), int(v)) for d, v in zip(days, per_day)],
+            [(str(m), int(v)) for m, v in zip(months, per_month)], [int(i) for i in largest], int(totals.sum()))
+
+
+def _aggregate_python(c, top):
+    n = len(c.members)
+    paid, share = [0] * n, [0] * n
+    for payer, splitter, units in zip(c.share_payer, c.share_splitter, c.share_amount):
+        paid[payer] += units
+        share[splitter] += units
+    per_day = {}
+    for units, stamp in zip(c.item_amount, c.item_ts):
+        if stamp > 0: per_day[stamp // DAY_MS] = per_day.get(stamp // DAY_MS, 0) + units
+    daily = [(_day(d), per_day[d]) for d in sorted(per_day)]
+    per_month = {}
+    for date, units in daily: per_month[date[:7]] = per_month.get(date[:7], 0) + units
+    largest = heapq.nsmallest(top, range(len(c.item_amount)), key=lambda i: (-c.item_amount[i], i))
+    return paid, share, daily, sorted(per_month.items()), largest, sum(c.item_amount)
+
+
+def summarize(columns, top=10, use_numpy=True):
+    """Per-member paid / share / net, daily and monthly spend, and the `top` largest items."""
+    aggregate = _aggregate_numpy if use_numpy and _numpy() else _aggregate_python
+    paid, share, daily, monthly, largest, total = aggregate(columns, top)
+    members = {uid: {"name": columns.names.get(uid, ""), "paid": from_minor(paid[i]), "share": from_minor(share[i]),
+                     "net": from_minor(paid[i] - share[i])} for uid, i in columns.members.items()}
+    uids = list(columns.members)
+    return {"itemCount": len(columns.item_ids), "totalSpend": from_minor(total), "members": members,
+            "daily": [{"date": d, "amount": from_minor(v)} for d, v in daily],
+            "monthly": [{"month": m, "amount": from_minor(v)} for m, v in monthly],
+            "largest": [{"itemId": columns.item_ids[i], "itemName": columns.item_names[i],
+                         "amount": from_minor(columns.item_amount[i]), "payerId": uids[columns.item_payer[i]],
+                         "createdAt": columns.item_ts[i] or None} for i in largest],
+            "engine": "numpy" if aggregate is _aggregate_numpy else "python"}
+
+
+class GroupAnalytics:
+    """Per-group analytics cache in front of a repository (see module docstring)."""
+    def __init__(self, repo, max_groups=256, top=50, page_size=500):
+        self.repo = repo
+        self.top = top
+        self.page_size = page_size
+        self._cache = TTLCache(max_groups, float("inf"))  # gid -> (index etag, columns, summary)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.rebuilds = 0
+        self.incremental = 0
+
+    def summary(self, group_id):
+        """The group's summary, with at most `top` largest items."""
+        entry = self._cache.get_stale(group_id)
+        changed, index, etag = self.repo.get_group_item_index_with_etag(
+            group_id, entry[0] if entry is not MISSING else None)
+        if not changed:
+            with self._lock: self.hits += 1
+            return entry[2]
+
+        # Also lists the groupItems of a group not yet migrated to the index
+        ids = self.repo.get_group_item_ids(group_id)
+        if index is None: etag = None  # legacy group without groupItemIndex: computed every time, never cached
+        columns = entry[1].copy() if entry is not MISSING else GroupColumns()
+        known = set(columns.item_ids)
+        removed = known - set(ids)
+        if removed: columns.remove(removed)
+        added = [i for i in ids if i not in known]
+        for start in range(0, len(added), self.page_size):
+            columns.extend(self.repo.get_items(added[start:start + self.page_size]))
+        summary = summarize(columns, self.top)
+        with self._lock:
+            if entry is MISSING: self.rebuilds += 1
+            else: self.incremental += 1
+        if etag: self._cache.set(group_id, (etag, columns, summary))
+        return summary
+
+    def stats(self):
+        return {"groups": len(self._cache), "hits": self.hits, "rebuilds": self.rebuilds,
+                "incremental": self.incremental, "numpy": bool(_np)}
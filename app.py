@@ -1,10 +1,28 @@
-import firebase_admin
-from firebase_admin import credentials, auth, db
-from flask import Flask, request, jsonify
+import time
+_import_started = time.perf_counter()
+from flask import Flask, Blueprint, Response, current_app, request, jsonify, g, stream_with_context
+from instrumented_repository import InstrumentedRepository
+from database_interface import LazyRepository
 from firebase_repository import FirebaseRepository
-import traceback,os
-
+from cached_repository import CachedRepository
+from local_repository import LocalRepository
+from write_coalescer import WriteCoalescer
+from group_mirror import GroupMirror
+from analytics import GroupAnalytics
+from group_deletion import GroupDeleter
+from idempotency import IdempotencyStore, IdempotencyBusy, IdempotencyConflict, MAX_KEY_LENGTH
+from auth_tokens import GOOGLE_CERTS_URL, InvalidToken, SigningKeys, TokenVerifier, fetch_certificates
+from ttl_cache import TTLCache, MISSING
+from push_ids import generate_push_id
+import firebase_repository
+import config
+import metrics
+import split_logic
+import startup
+import traceback,os,sys,threading,gzip,functools,hashlib,json
 
+# firebase_admin (~0.5s of imports) and the credential file are only loaded by _build_backend(),
+# on first use or from the warm-up thread, never before the server can answer GET /.
 
 prod = 1
 cred_path = ""
@@ -15,36 +33,333 @@ else:
     cred_path = os.path.join("C:\\Users\\aman2\\Desktop\\Payplit", "firebase.json") # development
 
 # cred_path = os.path.join(os.path.dirname(file), "firebase.json") # development
+firebase_project = "myproject-b3962" if prod == 1 else "kotlinfirebase-95de4"
 # cred_path = os.path.join("C:\\Users\\aman2\\Desktop\\Payplit", "firebase.json") # development
-cred = credentials.Certificate(cred_path)
-if(prod ==1):
-    firebase_admin.initialize_app(cred, {"databaseURL": "https://myproject-b3962-default-rtdb.firebaseio.com/"})
-else:
-    firebase_admin.initialize_app(cred, {"databaseURL": "https://kotlinfirebase-95de4-default-rtdb.firebaseio.com/"})
 
+split_logic.MIN_TRANSFER_MAX_MEMBERS = config.MIN_TRANSFER_MAX_MEMBERS
+split_logic.MIN_TRANSFER_TIME_BUDGET = config.MIN_TRANSFER_TIME_BUDGET
+firebase_repository.GROUP_CHANGELOG_MAX = config.GROUP_CHANGELOG_MAX
+metrics.ENABLED = config.METRICS_ENABLED
+
+api = Blueprint("api", __name__)
+_request_slots = threading.BoundedSemaphore(config.MAX_CONCURRENT_REQUESTS)
+
+
+def _build_backend():
+    started = time.perf_counter()
+    if config.DB_BACKEND == "firebase":
+        import firebase_admin
+        from firebase_admin import credentials
+        cred = credentials.Certificate(cred_path)
+        # httpTimeout bounds every Realtime Database call, so one slow call cannot pin a thread
+        options = {"httpTimeout": config.FIREBASE_HTTP_TIMEOUT}
+        if(prod ==1):
+            options["databaseURL"] = "https://myproject-b3962-default-rtdb.firebaseio.com/"
+        else:
+            options["databaseURL"] = "https://kotlinfirebase-95de4-default-rtdb.firebaseio.com/"
+        firebase_admin.initialize_app(cred, options)
+        backend = FirebaseRepository()
+    else:
+        # 🔥 Embedded backend for load tests / offline dev: no network, no credentials
+        backend = LocalRepository(config.LOCAL_DB_PATH if config.DB_BACKEND == "sqlite" else None)
+    if config.METRICS_ENABLED:
+        backend = InstrumentedRepository(backend)
+    if config.WRITE_COALESCE_ENABLED:
+        backend = WriteCoalescer(backend, config.WRITE_COALESCE_WINDOW, config.WRITE_COALESCE_MAX_BATCH)
+    if config.MIRROR_ENABLED:
+        backend = GroupMirror(backend, config.MIRROR_MAX_GROUPS, config.MIRROR_PROMOTE_AFTER,
+                              config.MIRROR_DEMOTE_BELOW, config.MIRROR_WINDOW, config.MIRROR_VERIFY_AFTER)
+    if config.CACHE_ENABLED:
+        backend = CachedRepository(backend, config.CACHE_MAX_ENTRIES, config.CACHE_USER_TTL,
+                                   config.CACHE_GROUP_TTL, config.CACHE_ITEM_TTL)
+    startup.record("backend_init", time.perf_counter() - started)
+    startup.mark("backend_ready")
+    return backend
+
+
+# Created on first use; routes just call repo.*
+repo = LazyRepository(_build_backend)
+group_analytics = GroupAnalytics(repo, config.ANALYTICS_CACHE_GROUPS, config.ANALYTICS_TOP_MAX)
+idempotency = IdempotencyStore(repo, config.IDEMPOTENCY_CACHE_SIZE, config.IDEMPOTENCY_TTL,
+                               config.IDEMPOTENCY_LEASE, config.IDEMPOTENCY_WAIT)
+# 🔥 ID tokens are checked locally against cached Google keys: no Admin API call per request
+token_verifier = TokenVerifier(config.AUTH_PROJECT_ID or firebase_project,
+                               SigningKeys(functools.partial(fetch_certificates, config.AUTH_CERTS_URL or GOOGLE_CERTS_URL)))
+_profiles = TTLCache(config.AUTH_PROFILE_CACHE_SIZE, config.AUTH_PROFILE_TTL)  # uid -> user record
+group_deleter = GroupDeleter(repo, config.GROUP_DELETE_CHUNK, config.GROUP_DELETE_LEASE,
+                             config.GROUP_DELETE_WORKERS, config.GROUP_DELETE_RESUME_EVERY)
+# Reachable without a token when AUTH_MODE=required
+PUBLIC_ROUTES = {"/", "/v1/users/create", "/v1/users/login", "/metrics", "/v1/internal/startup"}
+
+
+def init_backend():
+    """Initializes Firebase (or the local store) and the repository now. Idempotent."""
+    return repo.inner
+
+
+def warm_backend():
+    """
+    Initializes the backend in a background thread. Under gunicorn this runs in post_fork,
+    after the listening socket is bound, so GET / is served while Firebase warms up.
+    """
+    def warm():
+        try:
+            init_backend()
+            group_deleter.start_background()  # picks up deletions a dead worker left unfinished
+        except Exception:
+            traceback.print_exc()
+    threading.Thread(target=warm, name="backend-warmup", daemon=True).start()
+
+
+def start_background():
+    """
+    Per-process background work, started once the server listens (post_fork under gunicorn).
+    With WARM_BACKEND the backend is built now and unfinished group deletions resume at once;
+    without it the deletion resume loop still starts, and its first pass (which builds the
+    backend) runs one interval later.
+    """
+    if config.WARM_BACKEND: warm_backend()
+    else: group_deleter.start_background(delay=group_deleter.resume_every)
+
+
+def _layers():
+    """The repository decorators of a built backend, outermost first."""
+    layer = repo.inner if repo.ready else None
+    while layer is not None:
+        yield layer
+        layer = getattr(layer, "inner", None)
+
+
+def shutdown_backend():
+    """Graceful shutdown: stop deletion jobs, close mirror streams, drain the batch-read pool, release the Firebase app."""
+    group_deleter.close()
+    for layer in _layers():
+        if isinstance(layer, GroupMirror): layer.close()
+    firebase_repository.shutdown()
+    firebase_admin = sys.modules.get("firebase_admin")
+    if firebase_admin and firebase_admin._apps: firebase_admin.delete_app(firebase_admin.get_app())
+    repo.reset()
+
+
+def create_app():
+    """App factory. The backend is built lazily (first use) or by warm_backend()."""
+    app = Flask(__name__)
+    app.register_blueprint(api)
+    if config.METRICS_ENABLED:
+        # Registered first: the request is timed from before the slot wait to after compression
+        app.before_request(_begin_request_metrics)
+        app.after_request(_end_request_metrics)
+        app.teardown_request(_record_unhandled_error)
+    app.before_request(_acquire_request_slot)
+    if config.AUTH_MODE != "off": app.before_request(_authenticate)
+    app.after_request(_record_first_response)
+    if config.COMPRESS_ENABLED: app.after_request(_compress_response)
+    app.teardown_request(_release_request_slot)
+    return app
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def _begin_request_metrics():
+    metrics.begin_request(_route(), keep_events=bool(config.TRACE_SLOW_REQUEST_MS))
+
+
+def _end_request_metrics(response):
+    trace = metrics.end_request(request.method, response.status_code,
+                                config.TRACE_SLOW_REQUEST_MS, config.TRACE_SAMPLE_RATE)
+    if trace: print(trace, flush=True)
+    return response
+
+
+def _record_unhandled_error(exc=None):
+    if exc is not None: metrics.record_error(_route(), exc)
+
+
+def _failed(exc):
+    """For routes that answer errors themselves: count the error by route and type, log the traceback."""
+    if config.METRICS_ENABLED: metrics.record_error(_route(), exc)
+    traceback.print_exc()
+
+
+def _acquire_request_slot():
+    # Bounded concurrency: shed load with 503 instead of queueing behind slow Firebase calls
+    if not _request_slots.acquire(timeout=config.REQUEST_QUEUE_TIMEOUT):
+        return safe_res("error", "Server busy, retry later", code=503)
+    g.holds_request_slot = True
+
+
+def _release_request_slot(exc=None):
+    if g.pop("holds_request_slot", False): _request_slots.release()
+
+
+def _authenticate():
+    """Verifies a Bearer ID token and puts its uid on g.uid (None for anonymous requests)."""
+    g.uid = None
+    header = request.headers.get("Authorization", "")
+    if header[:7].lower() == "bearer ":
+        try:
+            claims = token_verifier.verify(header[7:].strip())
+        except InvalidToken:
+            return safe_res("error", "Invalid or expired ID token", code=401)
+        except Exception as e:
+            _failed(e)
+            return safe_res("error", "Cannot verify ID token, retry later", code=503)
+        g.uid, g.claims = claims["uid"], claims
+    elif config.AUTH_MODE == "required" and _route() not in PUBLIC_ROUTES:
+        return safe_res("error", "Authorization required", code=401)
+
+
+def current_user():
+    """The authenticated caller's user record, from a short-lived per-uid cache; None if anonymous."""
+    uid = g.get("uid")
+    if not uid: return None
+    user = _profiles.get(uid)
+    if user is MISSING:
+        user = repo.get_user(uid)
+        if user is not None: _profiles.set(uid, user)
+    return user
+
+
+def _acting_uid(claimed):
+    """The user a request acts for: the token's uid if authenticated, else the userId the client sent."""
+    uid = g.get("uid")
+    if uid and claimed and claimed != uid: raise PermissionError("userId does not match the ID token")
+    return uid or claimed
+
+
+def _record_first_response(response):
+    if "first_response" not in startup.report()["sinceProcessStart"]:
+        startup.mark("first_response")
+        print(f"startup: {startup.report()}", flush=True)
+    return response
+
+
+def _compress_response(response):
+    """gzip large JSON bodies when the client accepts it; 304s and small bodies pass through."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or not request.accept_encodings["gzip"]):
+        return response
+    body = response.get_data()
+    if len(body) < config.COMPRESS_MIN_BYTES: return response
+    response.set_data(gzip.compress(body, config.COMPRESS_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    etag, weak = response.get_etag()
+    # Different bytes need a different validator; _client_etag() strips the suffix again
+    if etag: response.set_etag(etag + "-gz", weak)
+    return response
 
-app = Flask(__name__)
-repo = FirebaseRepository()
 
 def safe_res(status, msg, data=None, code=200):
     if data is None: data = {}
     return jsonify({"status": status, "message": msg, "data": data}), code
 
 
-@app.route("/", methods=["GET"])
+def _client_etag(prefix):
+    """The database ETag the client last saw for this kind of response (If-None-Match), or None."""
+    for tag in request.if_none_match.as_set():
+        tag = tag.removesuffix("-gz")
+        if tag.startswith(prefix): return tag[len(prefix):]
+    return None
+
+
+def _with_etag(result, prefix, etag):
+    """Tags a response with the ETag of the database node it was rendered from."""
+    response, code = result if isinstance(result, tuple) else (result, 200)
+    response.status_code = code
+    if etag: response.set_etag(prefix + etag)
+    return response
+
+
+def _not_modified(prefix, etag):
+    response = Response(status=304)
+    response.set_etag(prefix + etag)
+    return response
+
+
+def _idempotent(view):
+    """
+    Honours an Idempotency-Key header: the first request with a key runs, repeats with the
+    same body get its response back (Idempotent-Replayed: true) without running again.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key: return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH: return safe_res("error", "Idempotency-Key is too long", code=400)
+        fingerprint = hashlib.sha256(request.query_string + b"\0" + request.get_data()).hexdigest()
+
+        def handler():
+            response = current_app.make_response(view(*args, **kwargs))
+            return response.status_code, response.get_data(as_text=True), response.mimetype
+        try:
+            scope = f"{request.method} {_route()} {g.get('uid') or ''}"  # keys are per signed-in user
+            record, replayed = idempotency.run(scope, key, fingerprint, handler)
+        except IdempotencyConflict:
+            return safe_res("error", "Idempotency-Key was already used for a different request", code=422)
+        except IdempotencyBusy:
+            return safe_res("error", "A request with this Idempotency-Key is still in progress", code=409)
+        except Exception as e:
+            _failed(e)
+            return safe_res("error", "Fail", code=500)
+        response = Response(record["body"], status=record["status"], mimetype=record["mimetype"])
+        if replayed: response.headers["Idempotent-Replayed"] = "true"
+        return response
+    return wrapper
+
+
+@api.route("/", methods=["GET"])
 def check():
     return safe_res("success", "API running OK")
 
+@api.route("/v1/internal/stats", methods=["GET"])
+def internal_stats():
+    stats = {"backendReady": repo.ready}
+    for layer in _layers():
+        if isinstance(layer, CachedRepository): stats["cache"] = layer.stats()
+        if isinstance(layer, WriteCoalescer): stats["writeCoalescer"] = layer.stats()
+        if isinstance(layer, GroupMirror): stats["groupMirror"] = layer.stats()
+    stats["analytics"] = group_analytics.stats()
+    stats["idempotency"] = idempotency.stats()
+    stats["groupDeletion"] = group_deleter.stats()
+    stats["auth"] = dict(token_verifier.stats(), profiles=_profiles.stats())
+    return safe_res("success", "Fetched", stats)
+
+@api.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus text exposition of this worker (worker="<pid>" label): request/repository/database metrics plus decorator stats."""
+    lines = []
+    for layer in _layers():
+        if isinstance(layer, CachedRepository): lines += metrics.gauge_lines("payplit_cache", layer.stats(), "cache")
+        if isinstance(layer, WriteCoalescer): lines += metrics.gauge_lines("payplit_write_coalescer", layer.stats())
+        if isinstance(layer, GroupMirror): lines += metrics.gauge_lines("payplit_group_mirror", layer.stats())
+    lines += metrics.gauge_lines("payplit_analytics", group_analytics.stats())
+    lines += metrics.gauge_lines("payplit_idempotency", idempotency.stats())
+    lines += metrics.gauge_lines("payplit_group_deletion", group_deleter.stats())
+    lines += metrics.gauge_lines("payplit_auth", dict(token_verifier.stats(), profiles=_profiles.stats()), "cache")
+    return Response(metrics.render(lines), mimetype="text/plain; version=0.0.4")
+
+@api.route("/v1/internal/startup", methods=["GET"])
+def internal_startup():
+    """Cold-start report: import time, backend init and time to first response."""
+    return safe_res("success", "Fetched", startup.report())
+
 # ================================
 # 👤 USERS SECTION
 # ================================
 
-@app.route("/v1/users/create", methods=["POST"])
+@api.route("/v1/users/create", methods=["POST"])
 def create_user():
     try:
         data = request.get_json(force=True)
-        user_rec = auth.create_user(email=data['email'], password=data['password'], display_name=data['name'])
-        uid = user_rec.uid
+        if config.DB_BACKEND == "firebase":
+            from firebase_admin import auth
+            user_rec = auth.create_user(email=data['email'], password=data['password'], display_name=data['name'])
+            uid = user_rec.uid
+        else:
+            uid = generate_push_id()
         user_data = {
             "userId": uid,
             "name": data['name'],
@@ -55,30 +370,45 @@ def create_user():
         repo.create_user(uid, user_data)
         return safe_res("success", "User created", {"userId": uid}, 201)
     except Exception as e:
+        _failed(e)
         return safe_res("error", str(e), code=500)
 
-@app.route("/v1/users/login", methods=["POST"])
+@api.route("/v1/users/login", methods=["POST"])
 def login():
     try:
+        if g.get("uid"):
+            # Signed-in client: the verified token already names the user
+            user_data = current_user()
+            if not user_data: raise LookupError(g.uid)
+            return safe_res("success", "Login successful", user_data)
         data = request.get_json(force=True)
-        user = auth.get_user_by_email(data.get("email"))
-        user_data = repo.get_user(user.uid)
+        if config.DB_BACKEND == "firebase":
+            from firebase_admin import auth
+            user = auth.get_user_by_email(data.get("email"))
+            user_data = repo.get_user(user.uid)
+        else:
+            user_data = repo.get_user_by_email(data.get("email"))
+            if not user_data: raise LookupError(data.get("email"))
         return safe_res("success", "Login successful", user_data)
-    except:
+    except Exception as e:
+        _failed(e)
         return safe_res("error", "User not found", code=404)
 
-@app.route("/v1/users/groups", methods=["POST"])
+@api.route("/v1/users/groups", methods=["POST"])
 def get_user_group_ids():
     """🔥 FIXED: This was the missing 404 route"""
     try:
         data = request.get_json(force=True)
-        uid = data.get("userId")
+        uid = _acting_uid(data.get("userId"))
         group_ids = repo.get_user_groups(uid)
         return safe_res("success", "Fetched", {"groups": group_ids})
-    except:
+    except PermissionError as e:
+        return safe_res("error", str(e), code=403)
+    except Exception as e:
+        _failed(e)
         return safe_res("error", "Fail", code=500)
 
-@app.route("/v1/users/<userId>", methods=["GET"])
+@api.route("/v1/users/<userId>", methods=["GET"])
 def get_user_by_id(userId):
     user = repo.get_user(userId)
     return safe_res("success", "Fetched", {"user": user}) if user else safe_res("error", "Not found", code=404)
@@ -88,35 +418,75 @@ def get_user_by_id(userId):
 # 👥 GROUPS SECTION
 # ================================
 
-@app.route("/v1/groups/create", methods=["POST"])
+@api.route("/v1/groups/create", methods=["POST"])
 def create_group():
     try:
         data = request.get_json(force=True)
+        # Links the group to all members in the same write
         group = repo.create_group(data)
-        # Link group to all members
-        for uid in group['groupMembers']:
-            user = repo.get_user(uid)
-            if user:
-                user.setdefault("groupIds", [])
-                if group['groupId'] not in user["groupIds"]:
-                    user["groupIds"].append(group['groupId'])
-                    repo.update_user(uid, user)
         return safe_res("success", "Group created", {"group": group}, 201)
-    except:
+    except Exception as e:
+        _failed(e)
         return safe_res("error", "Fail", code=500)
 
-@app.route("/v1/groups/getGroup", methods=["POST"])
+@api.route("/v1/groups/getGroup", methods=["POST"])
 def get_group_by_id():
-    """🔥 FIXED: Required for parallel fetching in Android"""
+    """🔥 FIXED: Required for parallel fetching in Android. Supports If-None-Match."""
     try:
         data = request.get_json(force=True)
         gid = data.get("groupId")
-        group = repo.get_group(gid)
-        return safe_res("success", "Fetched", {"group": group}) if group else safe_res("error", "Not found", code=404)
-    except:
+        seen = _client_etag("g-")
+        changed, group, etag = repo.get_group_with_etag(gid, seen)
+        if not changed: return _not_modified("g-", seen)
+        if not group: return safe_res("error", "Not found", code=404)
+        return _with_etag(safe_res("success", "Fetched", {"group": group}), "g-", etag)
+    except Exception as e:
+        _failed(e)
         return safe_res("error", "Fail", code=500)
 
-@app.route("/v1/groups/addMember", methods=["PUT"])
+# Top-level group fields a batchGet projection may ask for
+GROUP_FIELDS = ("groupId", "groupName", "groupMembers", "memberNames", "settlementMode", "rev",
+                "groupBalance", "groupGraph")
+
+
+@api.route("/v1/groups/batchGet", methods=["POST"])
+def batch_get_groups():
+    """
+    🔥 One request for the group list: {"groupIds": [...], "fields": ["groupName", ...], "userId"}.
+    Only the requested fields are read (concurrently) and returned, in groupIds order, plus
+    "net" = the user's balance in each group when the caller is known (ID token or userId).
+    Default fields: groupId, groupName.
+    """
+    try:
+        data = request.get_json(force=True) or {}
+        group_ids, fields = data.get("groupIds"), data.get("fields") or ["groupId", "groupName"]
+        if not isinstance(group_ids, list) or len(group_ids) > config.BATCH_GET_MAX_GROUPS:
+            return safe_res("error", f"groupIds must be a list of at most {config.BATCH_GET_MAX_GROUPS} ids", code=400)
+        unknown = [f for f in fields if f not in GROUP_FIELDS]
+        if unknown: return safe_res("error", f"Unknown fields: {', '.join(map(str, unknown))}", code=400)
+        group_ids = [gid for gid in group_ids if isinstance(gid, str) and gid]
+        uid = _acting_uid(data.get("userId"))
+        # The ledger already holds each member's net: read just that one child
+        paths = list(fields) + ([f"groupBalance/{uid}"] if uid and "groupBalance" not in fields else [])
+        found = repo.get_group_fields(group_ids, paths)
+        groups = []
+        for gid in dict.fromkeys(group_ids):
+            if gid not in found: continue
+            values = found[gid]
+            group = {f: values.get(f) for f in fields}
+            if uid:
+                net = (values.get("groupBalance") or {}).get(uid) if "groupBalance" in fields else values.get(f"groupBalance/{uid}")
+                group["net"] = net or 0
+            groups.append(group)
+        missing = [gid for gid in dict.fromkeys(group_ids) if gid not in found]
+        return safe_res("success", "Fetched", {"groups": groups, "missing": missing})
+    except PermissionError as e:
+        return safe_res("error", str(e), code=403)
+    except Exception as e:
+        _failed(e)
+        return safe_res("error", "Fail", code=500)
+
+@api.route("/v1/groups/addMember", methods=["PUT"])
 def add_member():
     try:
         data = request.get_json(force=True)
@@ -125,64 +495,187 @@ def add_member():
         if not lookup: return safe_res("error", "User not found", code=404)
         
         mid = lookup['userId']
-        gid = data['groupId']
-        group = repo.get_group(gid)
-        
-        if mid not in group.get("groupMembers", []):
-            group.setdefault("groupMembers", []).append(mid)
-            # Denormalize name
-            group.setdefault("memberNames", {})[mid] = repo.get_user(mid).get("name", "Unknown")
-            # Init Graph
-            group.setdefault("groupGraph", {}).setdefault(mid, {})
-            for m in group["groupMembers"]:
-                group["groupGraph"].setdefault(m, {})[mid] = 0
-                group["groupGraph"][mid][m] = 0
-            repo.update_group(gid, group)
-            # Update user node
-            user = repo.get_user(mid)
-            user.setdefault("groupIds", []).append(gid)
-            repo.update_user(mid, user)
-            
+        if not repo.add_group_member(data['groupId'], mid):
+            return safe_res("error", "Group not found", code=404)
         return safe_res("success", "Member added")
-    except:
+    except Exception as e:
+        _failed(e)
+        return safe_res("error", "Fail", code=500)
+
+@api.route("/v1/groups/settlementMode", methods=["PUT"])
+def set_settlement_mode():
+    """Per-group solver: "greedy" (default) or "minimal" (fewest transfers)."""
+    try:
+        data = request.get_json(force=True)
+        success, message = repo.set_settlement_mode(data['groupId'], data.get('mode', "greedy"))
+        return safe_res("success", message) if success else safe_res("error", message, code=400)
+    except Exception as e:
+        _failed(e)
         return safe_res("error", "Fail", code=500)
 
-@app.route("/v1/groups", methods=["DELETE"])
+@api.route("/v1/groups", methods=["DELETE"])
 def delete_group():
+    """
+    🔥 Hides the group at once and deletes its items and member links in the background.
+    Answers 202 with the job; GET /v1/groups/<groupId>/deletion reports its progress.
+    """
     try:
         gid = request.get_json(force=True).get("groupId")
-        group = repo.get_group(gid)
-        if not group: return safe_res("error", "Not found", 404)
-        # Cleanup Items
-        for iid in group.get("groupItems", []): repo.delete_item(iid)
-        # Cleanup Users
-        for uid in group.get("groupMembers", []):
-            u = repo.get_user(uid)
-            if u:
-                u["groupIds"] = [g for g in u.get("groupIds", []) if g != gid]
-                repo.update_user(uid, u)
-        repo.delete_group(gid)
-        return safe_res("success", "Group deleted")
-    except:
+        if not gid: return safe_res("error", "groupId missing", code=400)
+        job = group_deleter.start(gid)
+        if not job: return safe_res("error", "Not found", code=404)
+        return safe_res("success", "Group deletion started", {"job": _deletion_status(job)}, 202)
+    except Exception as e:
+        _failed(e)
+        return safe_res("error", "Fail", code=500)
+
+@api.route("/v1/groups/<groupId>/deletion", methods=["GET"])
+def get_group_deletion(groupId):
+    """Progress of a group's deletion job: state, phase, membersUnlinked, itemsDeleted."""
+    try:
+        job = group_deleter.status(groupId)
+        if not job: return safe_res("error", "No deletion job for this group", code=404)
+        return safe_res("success", "Fetched", {"job": _deletion_status(job)})
+    except Exception as e:
+        _failed(e)
         return safe_res("error", "Fail", code=500)
 
-@app.route("/v1/groups/membersDetail", methods=["POST"])
+
+def _deletion_status(job):
+    status = {k: v for k, v in job.items() if k not in ("members", "owner", "leaseUntil")}
+    status["members"] = len(job.get("members") or [])
+    return status
+
+@api.route("/v1/groups/membersDetail", methods=["POST"])
 def get_members_detail():
     try:
         gid = request.get_json(force=True) # Expects raw groupId string
         group = repo.get_group(gid)
         if not group: return jsonify([]), 404
-        users = [repo.get_user(uid) for uid in group.get("groupMembers", [])]
+        users = repo.get_users(group.get("groupMembers", []))
         return jsonify(users), 200
-    except:
+    except Exception as e:
+        _failed(e)
         return jsonify([]), 500
 
+@api.route("/v1/groups/<groupId>/analytics", methods=["GET"])
+def get_group_analytics(groupId):
+    """Per-member paid/share/net, daily and monthly spend and the largest expenses (?top=10)."""
+    try:
+        top = max(0, min(int(request.args.get("top", 10)), config.ANALYTICS_TOP_MAX))
+        summary = group_analytics.summary(groupId)
+        if not summary["itemCount"] and not repo.get_group(groupId):
+            return safe_res("error", "Group not found", code=404)
+        return safe_res("success", "Fetched", dict(summary, largest=summary["largest"][:top]))
+    except ValueError:
+        return safe_res("error", "top must be an integer", code=400)
+    except Exception as e:
+        _failed(e)
+        return safe_res("error", "Fail", code=500)
+
+
+@api.route("/v1/sync", methods=["POST"])
+def sync_groups():
+    """
+    🔥 Delta refresh. Body {"groups": {groupId: lastRevision or null}}. Unchanged groups are left
+    out of "groups" in the reply; a changed one gets {"rev", "changes", "items" (created ones
+    still present), "group"}, or a snapshot {"rev", "snapshot": true, "group", "items",
+    "nextCursor"} when the client has no revision or is past the changelog; a deleted one
+    gets {"deleted": true}.
+    """
+    try:
+        known = (request.get_json(force=True) or {}).get("groups")
+        if not isinstance(known, dict) or len(known) > config.SYNC_MAX_GROUPS:
+            return safe_res("error", f"groups must map at most {config.SYNC_MAX_GROUPS} groupIds to revisions", code=400)
+        revisions = repo.get_group_revisions(list(known))
+        result = {}
+        for gid, last in known.items():
+            if gid not in revisions:
+                result[gid] = {"deleted": True}
+            elif last != revisions[gid] or type(last) is not int:
+                delta = _sync_group(gid, last, revisions[gid])
+                if delta: result[gid] = delta
+        return safe_res("success", "Synced", {"groups": result})
+    except Exception as e:
+        _failed(e)
+        return safe_res("error", "Fail", code=500)
+
+
+def _sync_group(gid, last, rev):
+    if type(last) is int and 0 <= last < rev and rev - last <= config.GROUP_CHANGELOG_MAX:
+        logged = repo.get_group_changes(gid, last, rev - last)
+        changes = []
+        for change in logged:
+            if change.get("rev") != last + len(changes) + 1: break
+            changes.append(change)
+        # A revision is logged just after its group write. A gap at the end is still being written:
+        # send what is there (or nothing yet). A gap with later entries means a pruned or lost record.
+        if len(changes) == len(logged):
+            if not changes: return None
+            group = repo.get_group(gid)
+            if not group: return {"deleted": True}  # marked for deletion (the last change is groupDeleted)
+            created = [c["itemId"] for c in changes if c["op"] == "itemCreated"]
+            return {"rev": changes[-1]["rev"], "changes": changes, "items": repo.get_items(created) if created else [],
+                    "group": group}
+    group = repo.get_group(gid)
+    if not group: return {"deleted": True}
+    items, next_cursor = repo.get_items_page(gid, config.SYNC_SNAPSHOT_ITEMS, None)
+    return {"rev": group.get("rev", 0), "snapshot": True, "group": group, "items": items, "nextCursor": next_cursor}
+
+
+@api.route("/v1/groups/<groupId>/export", methods=["GET"])
+def export_group(groupId):
+    """
+    🔥 Streams the group as NDJSON, one object per line: "group", one "member" per member,
+    every "item" oldest first, the "graph" and a closing "end" with the item count.
+    Items are fetched in concurrent batches and written as they arrive; memory stays flat.
+    """
+    try:
+        group = repo.get_group(groupId)
+        if not group: return safe_res("error", "Group not found", code=404)
+    except Exception as e:
+        _failed(e)
+        return safe_res("error", "Fail", code=500)
+    filename = f"group-{groupId}.ndjson"
+    return Response(stream_with_context(_export_lines(groupId, group)), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def _export_lines(group_id, group):
+    line = lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n"
+    names = group.pop("memberNames", None) or {}
+    balances = group.pop("groupBalance", None) or {}
+    graph = group.pop("groupGraph", None) or {}
+    header = [line({"type": "group", "group": group})]
+    for uid in dict.fromkeys(list(group.get("groupMembers") or []) + list(names)):
+        header.append(line({"type": "member", "userId": uid, "name": names.get(uid, ""), "balance": balances.get(uid, 0)}))
+    yield "".join(header)  # first bytes go out before any item is fetched
+
+    chunk, size, count = [], 0, 0
+    try:
+        for item in repo.scan_group_items(group_id, config.EXPORT_PAGE_SIZE):
+            text = line({"type": "item", "item": item})
+            chunk.append(text)
+            size += len(text)
+            count += 1
+            if size >= config.EXPORT_CHUNK_BYTES:
+                yield "".join(chunk)
+                chunk, size = [], 0
+        chunk.append(line({"type": "graph", "graph": graph}))
+        chunk.append(line({"type": "end", "items": count}))
+    except Exception as e:
+        # Headers are already sent: report in-band so the client knows the export is incomplete
+        _failed(e)
+        chunk.append(line({"type": "error", "message": "Export failed", "items": count}))
+    yield "".join(chunk)
+
 
 # ================================
 # 💸 ITEMS SECTION
 # ================================
 
-@app.route("/v1/items/create", methods=["POST"])
+@api.route("/v1/items/create", methods=["POST"])
+@_idempotent
 def add_item():
     try:
         data = request.get_json(force=True)
@@ -195,21 +688,49 @@ def add_item():
             return "item created", 201
         else:
             return msg, 400
-    except:
+    except Exception as e:
+        _failed(e)
+        # Database trouble is retryable: 503 is never stored under the Idempotency-Key
+        if firebase_repository.is_backend_error(e): return "Database unavailable, retry later", 503
         return "Error", 500
 
-@app.route("/v1/groups/items", methods=["POST"])
+@api.route("/v1/items/batch", methods=["POST"])
+@_idempotent
+def add_items_batch():
+    """Imports many expenses of one group with a single ledger transaction."""
+    try:
+        data = request.get_json(force=True)
+        items = data.get("items")
+        if not data.get("groupId") or not isinstance(items, list) or not items:
+            return safe_res("error", "groupId and items are required", code=400)
+        results = repo.create_items_atomically(data["groupId"], items)
+        created = sum(1 for r in results if r["success"])
+        if not created:
+            return safe_res("error", "No items created", {"results": results}, 400)
+        return safe_res("success", f"{created}/{len(results)} items created", {"results": results}, 201)
+    except Exception as e:
+        _failed(e)
+        if firebase_repository.is_backend_error(e): return safe_res("error", "Database unavailable, retry later", code=503)
+        return safe_res("error", "Fail", code=500)
+
+@api.route("/v1/groups/items", methods=["POST"])
 def get_paginated_items():
     try:
         req = request.get_json(force=True)
-        group = repo.get_group(req.get("groupId"))
-        if not group or "groupItems" not in group: return jsonify([]), 200
-        items = repo.get_paginated_items(group["groupItems"], req.get("limit", 10), req.get("offset", 0))
+        gid, limit = req.get("groupId"), req.get("limit", 10)
+        if not gid: return jsonify([]), 200
+        if "cursor" in req:
+            # Cursor mode: send "cursor": null for the first page, then the returned nextCursor
+            items, next_cursor = repo.get_items_page(gid, limit, req.get("cursor"))
+            return jsonify({"items": items, "nextCursor": next_cursor}), 200
+        items = repo.get_paginated_items(gid, limit, req.get("offset", 0))
         return jsonify(items), 200
-    except:
+    except Exception as e:
+        _failed(e)
         return jsonify([]), 500
 
-@app.route("/v1/items", methods=["DELETE"])
+@api.route("/v1/items", methods=["DELETE"])
+@_idempotent
 def delete_item_v1():
     try:
         item_id = request.args.get("itemId")
@@ -223,38 +744,45 @@ def delete_item_v1():
             return safe_res("success", message)
         else:
             return safe_res("error", message, code=404)
-    except:
+    except Exception as e:
+        _failed(e)
+        if firebase_repository.is_backend_error(e): return safe_res("error", "Database unavailable, retry later", code=503)
         return safe_res("error", "Delete failed", code=500)
     
 # ================================
 # 💸 ITEMS SECTION (Add this missing route)
 # ================================
 
-@app.route("/v1/items/<itemId>", methods=["GET"])
+@api.route("/v1/items/<itemId>", methods=["GET"])
 def get_item_by_id(itemId):
     """
     🔥 FIXED: Fetches single item detail.
     Matches Android GET call for Screen.ItemDetail
     """
     try:
-        item = repo.get_item(itemId)
+        seen = _client_etag("i-")
+        changed, item, etag = repo.get_item_with_etag(itemId, seen)
+        if not changed: return _not_modified("i-", seen)
         if item:
             # We wrap it in {"item": item} to match the SingleItemDto on Android
-            return safe_res("success", "Item fetched", {"item": item})
+            return _with_etag(safe_res("success", "Item fetched", {"item": item}), "i-", etag)
         else:
             return safe_res("error", "Item not found", code=404)
-    except Exception:
+    except Exception as e:
+        _failed(e)
         return safe_res("error", "Internal Server Error", code=500)
     
 # ================================
 # 📊 SETTLEMENTS SECTION
 # ================================
 
-@app.route("/v1/groups/expenseDetail", methods=["POST"])
+@api.route("/v1/groups/expenseDetail", methods=["POST"])
 def get_global_settlement():
     try:
         gid = request.get_data(as_text=True).strip('"') # Matches your original string handling
-        group = repo.get_group(gid)
+        seen = _client_etag("ed-")
+        changed, group, etag = repo.get_group_with_etag(gid, seen)
+        if not changed: return _not_modified("ed-", seen)
         if not group or "groupGraph" not in group: return jsonify({"expenseDetail": []})
         lines = []
         for p_id, recs in group["groupGraph"].items():
@@ -263,36 +791,70 @@ def get_global_settlement():
                 if amt > 0:
                     r_name = group["memberNames"].get(r_id, r_id)
                     lines.append(f"{p_name} get back from {r_name}: ₹{amt}")
-        return jsonify({"expenseDetail": lines}), 200
-    except:
+        return _with_etag(jsonify({"expenseDetail": lines}), "ed-", etag)
+    except Exception as e:
+        _failed(e)
         return jsonify({"expenseDetail": []}), 500
 
-@app.route("/v1/groups/expenseDetailbyCurrentUser", methods=["POST"])
+@api.route("/v1/groups/expenseDetailbyCurrentUser", methods=["POST"])
 def get_personal_settlement():
     try:
         data = request.get_json(force=True)
         gid = data.get("groupId")
-        curr_id = data.get("currentUserId")
-        group = repo.get_group(gid)
-        if not group or "groupGraph" not in group: return jsonify({"expenseDetail": []})
-        
-        graph = group["groupGraph"]
+        curr_id = _acting_uid(data.get("currentUserId"))
+        # 🔥 One small read of the materialized view instead of the whole group
+        seen = _client_etag("us-")
+        changed, summary, etag = repo.get_user_settlement_with_etag(curr_id, gid, seen)
+        if not changed: return _not_modified("us-", seen)
+        if summary is None:
+            # Not materialized yet (older group): computed from the group, read-only;
+            # reconcile_ledgers.py --backfill-views writes the missing summaries
+            group = repo.get_group(gid)
+            summary = split_logic.user_settlement_summaries(group, [curr_id]).get(curr_id) if group else None
+            if summary is None: return jsonify({"expenseDetail": []})
+            etag = None
+
+        names = summary.get("names") or {}
         lines = []
         # Money you are owed
-        if curr_id in graph:
-            for r_id, amt in graph[curr_id].items():
-                if amt > 0:
-                    r_name = group["memberNames"].get(r_id, r_id)
-                    lines.append(f"You get back from {r_name}: ₹{amt}")
+        for r_id, amt in (summary.get("owed") or {}).items():
+            lines.append(f"You get back from {names.get(r_id, r_id)}: ₹{amt}")
         # Money you owe
-        for p_id, recs in graph.items():
-            if p_id != curr_id and curr_id in recs and recs[curr_id] > 0:
-                p_name = group["memberNames"].get(p_id, p_id)
-                lines.append(f"You owe {p_name}: ₹{recs[curr_id]}")
-        return jsonify({"expenseDetail": lines}), 200
-    except:
+        for p_id, amt in (summary.get("owes") or {}).items():
+            lines.append(f"You owe {names.get(p_id, p_id)}: ₹{amt}")
+        return _with_etag(jsonify({"expenseDetail": lines}), "us-", etag)
+    except PermissionError as e:
+        return safe_res("error", str(e), code=403)
+    except Exception as e:
+        _failed(e)
         return jsonify({"expenseDetail": []}), 500
 
+@api.route("/v1/users/balance", methods=["POST"])
+def get_user_total_balance():
+    """Cross-group "my total balance", read from the user's settlement summaries only."""
+    try:
+        uid = _acting_uid(request.get_json(force=True).get("userId"))
+        if not uid: return safe_res("error", "userId missing", code=400)
+        summaries = repo.get_user_settlements(uid)
+        groups = {gid: {"groupName": s.get("groupName", ""), "net": s.get("net", 0)} for gid, s in summaries.items()}
+        # Groups without a summary yet (created before views existed): read the name and this
+        # user's ledger entry only, never write here (reconcile_ledgers.py --backfill-views does)
+        missing = [gid for gid in repo.get_user_groups(uid) if gid and gid not in summaries]
+        for gid, values in repo.get_group_fields(missing, ["groupName", f"groupBalance/{uid}"]).items():
+            groups[gid] = {"groupName": values.get("groupName") or "", "net": values.get(f"groupBalance/{uid}") or 0}
+        total = split_logic.from_minor(sum(split_logic.to_minor(g["net"]) for g in groups.values()))
+        return safe_res("success", "Fetched", {"total": total, "groups": groups})
+    except PermissionError as e:
+        return safe_res("error", str(e), code=403)
+    except Exception as e:
+        _failed(e)
+        return safe_res("error", "Fail", code=500)
+
+startup.record("app_import", time.perf_counter() - _import_started)
+startup.mark("app_imported")
+
 if __name__ == "__main__":
+    # Development server only; production runs: gunicorn -c gunicorn.conf.py
     port = int(os.environ.get("PORT", 7000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    start_background()
+    create_app().run(host="0.0.0.0", port=port, debug=config.DEBUG)
\ No newline at end of file
@@ -0,0 +1,144 @@
+'''
+Local verification of Firebase ID tokens (the Authorization: Bearer header).
+
+Tokens are RS256 JWTs signed with Google's rotating securetoken keys. SigningKeys keeps the
+public keys in memory for as long as the endpoint's Cache-Control max-age allows and refreshes
+them in the background shortly before they expire, so a request never waits on the network
+except on the very first verification or for a key id that appeared after the last refresh.
+Verification itself is a local RSA signature check plus the claim checks Firebase documents
+(aud = project id, iss = https://securetoken.google.com/<project id>, exp, iat, auth_time, sub).
+
+For tests and offline use pass SigningKeys a `fetch` returning ({kid: PEM}, max_age seconds);
+PEM may be an X.509 certificate (what Google serves) or a bare public key.
+'''
+import re
+import threading
+import time
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def fetch_certificates(url=GOOGLE_CERTS_URL, timeout=10):
+    """({kid: PEM certificate}, max-age seconds) from the public key endpoint."""
+    import requests
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    return response.json(), int(match.group(1)) if match else 3600
+
+
+def _public_key(pem):
+    from cryptography import x509
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+    data = pem.encode() if isinstance(pem, str) else pem
+    if b"CERTIFICATE" in data: return x509.load_pem_x509_certificate(data).public_key()
+    return load_pem_public_key(data)
+
+
+class SigningKeys:
+    """
+    kid -> public key, refreshed from `fetch`. Expired keys are refetched on the calling thread
+    (one fetch at a time); in the last `refresh_ahead` of their lifetime a background refresh
+    replaces them first. Unknown key ids trigger at most one refetch per `min_refetch` seconds.
+    """
+    def __init__(self, fetch=fetch_certificates, refresh_ahead=0.1, min_refetch=60.0, clock=time.monotonic):
+        self._fetch = fetch
+        self.refresh_ahead = refresh_ahead
+        self.min_refetch = min_refetch
+        self._clock = clock
+        self._keys = {}
+        self._fetched_at = None
+        self._expires_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def get(self, kid):
+        now = self._clock()
+        if now >= self._expires_at:
+            self._refresh()
+        elif kid not in self._keys and now - self._fetched_at >= self.min_refetch:
+            self._refresh()  # keys rotated since the last fetch
+        elif now >= self._expires_at - (self._expires_at - self._fetched_at) * self.refresh_ahead:
+            self._refresh_in_background()
+        return self._keys.get(kid)
+
+    def _refresh(self):
+        with self._lock:
+            if self._fetched_at is not None and self._clock() - self._fetched_at < 1: return  # another thread just did
+            certificates, max_age = self._fetch()
+            self._keys = {kid: _public_key(pem) for kid, pem in certificates.items()}
+            self._fetched_at = self._clock()
+            self._expires_at = self._fetched_at + max_age
+            self.refreshes += 1
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing: return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._refresh()
+            except Exception:
+                pass  # the current keys stay valid until they expire; the next get() retries
+            finally:
+                self._refreshing = False
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class TokenVerifier:
+    """
+    Verifies Firebase ID tokens of one project against SigningKeys. verify() returns the claims
+    (plus "uid") or raises InvalidToken; errors fetching the keys propagate unchanged.
+    """
+    def __init__(self, project_id, keys=None, leeway=60):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.keys = keys if keys is not None else SigningKeys()
+        self.leeway = leeway
+        self._lock = threading.Lock()
+        self.verified = 0
+        self.rejected = 0
+
+    def verify(self, token):
+        try:
+            claims = self._verify(token)
+        except InvalidToken:
+            with self._lock: self.rejected += 1
+            raise
+        with self._lock: self.verified += 1
+        return claims
+
+    def _verify(self, token):
+        import jwt
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e)) from e
+        if header.get("alg") != "RS256": raise InvalidToken("unexpected algorithm")
+        # May fetch keys; a failing key endpoint raises its own error, not InvalidToken
+        key = self.keys.get(header.get("kid"))
+        if key is None: raise InvalidToken("unknown signing key")
+        try:
+            claims = jwt.decode(token, key, algorithms=["RS256"], audience=self.project_id, issuer=self.issuer,
+                                leeway=self.leeway, options={"require": ["exp", "iat", "sub"], "verify_iat": False})
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e)) from e
+        now = time.time()
+        if claims["iat"] > now + self.leeway: raise InvalidToken("token issued in the future")
+        if claims.get("auth_time", 0) > now + self.leeway: raise InvalidToken("auth_time is in the future")
+        if not isinstance(claims["sub"], str) or not 0 < len(claims["sub"]) <= 128: raise InvalidToken("invalid sub")
+        claims["uid"] = claims["sub"]
+        return claims
+
+    def stats(self):
+        return {"verified": self.verified, "rejected": self.rejected, "keys": len(self.keys),
+                "keyRefreshes": self.keys.refreshes}
@@ -0,0 +1,111 @@
+'''
+Greedy vs minimum-transfer settlement: solve time and number of transfers.
+
+    python benchmarks/bench_settlement.py [--sizes 10 20 50 200] [--groups 20]
+                                          [--max-members 16] [--budget 0.25] [--out settlement.json]
+
+Balances come from bench_split_logic's synthetic expense histories (random payer, 1-4
+splitters per item, 5 items per member), which produce the many small offsetting balances
+real groups have. Each size is run over `--groups` seeded histories.
+
+The minimal solver gives up past `--max-members` non-zero balances left after pruning
+(hard cap MIN_TRANSFER_HARD_LIMIT) or past `--budget` seconds, and the group keeps the
+greedy plan. The "mode" column says which each size hit: "minimal" when every group was
+solved, "greedy (cap)" / "greedy (budget)" when every group fell back for that reason, and
+solved/cap/budget counts when they mixed. Minimal transfer counts are averaged over the
+solved groups only, next to greedy's count for those same groups.
+'''
+import argparse
+import copy
+import time
+
+from common import best_of, save_results
+from bench_split_logic import make_history
+from split_logic import SettlementLedger, apply_items, minimum_transfer_edges, optimal_account_balance
+
+
+def make_group(members, seed):
+    uids, history = make_history(members, members * 5, seed)
+    group = {"groupMembers": uids}
+    apply_items(group, history)
+    return group
+
+
+def count_transfers(graph):
+    return sum(1 for row in graph.values() for amount in row.values() if amount > 0)
+
+
+def mode(row):
+    solved, cap, budget = row["solved"], row["capFallbacks"], row["budgetFallbacks"]
+    if solved == row["groups"]: return "minimal"
+    if cap == row["groups"]: return "greedy (cap)"
+    if budget == row["groups"]: return "greedy (budget)"
+    return f"{solved}/{cap}/{budget}"
+
+
+def run(sizes, groups, max_members, budget, repeat, seed):
+    rows = []
+    for members in sizes:
+        row = {"members": members, "groups": groups, "nonZero": 0, "greedyTransfers": 0, "greedyMs": 0.0,
+               "solved": 0, "capFallbacks": 0, "budgetFallbacks": 0, "solvedGreedyTransfers": 0,
+               "minimalTransfers": 0, "minimalMs": 0.0, "minimalMaxMs": 0.0}
+        for offset in range(groups):
+            group = make_group(members, seed + offset)
+            balances = SettlementLedger.from_group(group).balances
+
+            def greedy():
+                g = copy.deepcopy(group)
+                optimal_account_balance(g)
+                return count_transfers(g["groupGraph"])
+
+            def minimal():
+                return minimum_transfer_edges(balances, max_members, budget)
+
+            greedy_time, greedy_transfers = best_of(greedy, repeat)
+            minimal_time, edges = best_of(minimal, repeat)
+            row["nonZero"] += sum(1 for v in balances.values() if v)
+            row["greedyTransfers"] += greedy_transfers
+            row["greedyMs"] += greedy_time * 1000
+            row["minimalMs"] += minimal_time * 1000
+            row["minimalMaxMs"] = max(row["minimalMaxMs"], minimal_time * 1000)
+            if edges is not None:
+                row["solved"] += 1
+                row["solvedGreedyTransfers"] += greedy_transfers
+                row["minimalTransfers"] += count_transfers(edges)
+            elif minimal_time >= budget:
+                row["budgetFallbacks"] += 1
+            else:
+                row["capFallbacks"] += 1  # gave up before solving: too many balances left after pruning
+        for key in ("nonZero", "greedyTransfers", "greedyMs", "minimalMs"): row[key] = round(row[key] / groups, 3)
+        for key in ("solvedGreedyTransfers", "minimalTransfers"):
+            row[key] = round(row[key] / row["solved"], 3) if row["solved"] else None
+        row["minimalMaxMs"] = round(row["minimalMaxMs"], 3)
+        row["mode"] = mode(row)
+        rows.append(row)
+        solved = lambda v: "-" if v is None else f"{v:.2f}"
+        print(f"{members:>8} {row['nonZero']:>8.1f} {row['greedyTransfers']:>9.2f} {row['greedyMs']:>10.3f}"
+              f" {row['mode']:>16} {solved(row['solvedGreedyTransfers']):>18} {solved(row['minimalTransfers']):>10}"
+              f" {row['minimalMs']:>11.3f} {row['minimalMaxMs']:>8.3f}", flush=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 50, 200])
+    parser.add_argument("--groups", type=int, default=20, help="seeded histories per size")
+    parser.add_argument("--max-members", type=int, default=16)
+    parser.add_argument("--budget", type=float, default=0.25, help="minimal solver time budget (s)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    print(f"{'members':>8} {'non-zero':>8} {'greedy #':>9} {'greedy ms':>10} {'mode':>16} {'greedy # (solved)':>18}"
+          f" {'minimal #':>10} {'minimal ms':>11} {'max ms':>8}")
+    rows = run(args.sizes, args.groups, args.max_members, args.budget, args.repeat, args.seed)
+    if args.out:
+        save_results(args.out, "settlement", vars(args), rows)
+
+
+if __name__ == "__main__":
+    main()
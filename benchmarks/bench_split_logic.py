@@ -0,0 +1,120 @@
+'''
+Micro-benchmarks of the settlement math across group sizes and ledger histories.
+
+    python benchmarks/bench_split_logic.py [--members 5 50 200 1000] [--items 100 10000 100000]
+                                           [--incremental-sample 2000] [--out split_logic.json]
+
+For each (members, items) pair:
+    update_group_balances    legacy per-split Decimal ledger update, replayed over the history
+    optimal_account_balance  legacy greedy rebuild of groupGraph from the final balances
+    apply_items              batch path: net all item deltas, settle once
+    apply_balance_deltas     incremental write path as in the item transaction: one call per item
+                             (first N items only), ledger reused from a LedgerCache between calls
+    apply_balance_deltas_cold  the same, re-parsing the stored ledger on every call (cache miss)
+
+Histories are synthetic (random payer, 1-4 splitters), seeded for reproducible runs.
+'''
+import argparse
+import copy
+import random
+import time
+
+from common import allocations, best_of, save_results
+from split_logic import (LedgerCache, SettlementLedger, apply_balance_deltas, apply_items, item_deltas,
+                         optimal_account_balance, update_group_balances)
+
+
+def make_history(members, items, seed):
+    rng = random.Random(seed)
+    uids = [f"user{i}" for i in range(members)]
+    history = []
+    for _ in range(items):
+        splitters = rng.sample(uids, rng.randint(1, min(4, members)))
+        history.append({"itemPayer": [rng.choice(uids)], "itemSpliter": splitters,
+                        "itemSpliterValue": [rng.choice([50, 100, 120, 250, 499.5]) for _ in splitters]})
+    return uids, history
+
+
+def legacy_replay(uids, history):
+    group = {"groupMembers": uids}
+    for item in history:
+        payer = item["itemPayer"][0]
+        for receiver, amount in zip(item["itemSpliter"], item["itemSpliterValue"]):
+            update_group_balances(group, payer, receiver, amount)
+    return group
+
+
+def incremental_replay(uids, history, cached=True):
+    group = {"groupMembers": uids, "rev": 0}
+    cache = LedgerCache()
+    for item in history:
+        ledger = cache.take("g", group) if cached else None
+        ledger = apply_balance_deltas(group, item_deltas(item), ledger)
+        group["rev"] += 1
+        if cached: cache.keep("g", group, ledger)
+    return group
+
+
+def run(members_list, items_list, incremental_sample, repeat, seed, measure_alloc):
+    rows = []
+    for members in members_list:
+        for items in items_list:
+            uids, history = make_history(members, items, seed)
+            sample = history[:incremental_sample]
+            legacy_group = legacy_replay(uids, history)
+            benches = {
+                "update_group_balances": (lambda: legacy_replay(uids, history), items),
+                "optimal_account_balance": (lambda: optimal_account_balance(copy.deepcopy(legacy_group)), 1),
+                "apply_items": (lambda: batch_group(uids, history), 1),
+                "apply_balance_deltas": (lambda: incremental_replay(uids, sample), len(sample)),
+                "apply_balance_deltas_cold": (lambda: incremental_replay(uids, sample, cached=False), len(sample)),
+            }
+            for name, (fn, ops) in benches.items():
+                seconds, _ = best_of(fn, repeat)
+                row = {"bench": name, "members": members, "items": items, "ops": ops,
+                       "totalMs": round(seconds * 1000, 3), "usPerOp": round(seconds * 1e6 / max(ops, 1), 3)}
+                if measure_alloc: row.update(allocations(fn)[1])
+                rows.append(row)
+                print(f"{name:<26} {members:>6} {items:>8} {row['totalMs']:>12.3f} {row['usPerOp']:>12.3f}"
+                      + (f" {row['peakKiB']:>10.1f}" if measure_alloc else ""), flush=True)
+            # Sanity check: all three paths end with the same balances
+            legacy = _nonzero(SettlementLedger.from_group(legacy_group).balances)
+            assert _nonzero(SettlementLedger.from_group(batch_group(uids, history)).balances) == legacy
+            assert (_nonzero(SettlementLedger.from_group(incremental_replay(uids, sample)).balances)
+                    == _nonzero(SettlementLedger.from_group(batch_group(uids, sample)).balances))
+    return rows
+
+
+def batch_group(uids, history):
+    group = {"groupMembers": uids}
+    apply_items(group, history)
+    return group
+
+
+def _nonzero(balances):
+    return {uid: units for uid, units in balances.items() if units}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, nargs="+", default=[5, 50, 200, 1000])
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--incremental-sample", type=int, default=2000,
+                        help="items replayed one by one through apply_balance_deltas")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    print(f"{'bench':<26} {'members':>6} {'items':>8} {'total ms':>12} {'us/op':>12}"
+          + ("" if args.no_alloc else f" {'peak KiB':>10}"))
+    started = time.perf_counter()
+    rows = run(args.members, args.items, args.incremental_sample, args.repeat, args.seed, not args.no_alloc)
+    print(f"done in {time.perf_counter() - started:.1f}s")
+    if args.out:
+        save_results(args.out, "split_logic", vars(args), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+'''Helpers shared by the benchmark scripts: timing, percentiles, allocations, JSON results.'''
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path: sys.path.insert(0, ROOT)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(seconds):
+    values = sorted(seconds)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {"count": len(values), "meanMs": ms(sum(values) / len(values)) if values else None,
+            "p50Ms": ms(percentile(values, 50)), "p95Ms": ms(percentile(values, 95)),
+            "p99Ms": ms(percentile(values, 99)), "maxMs": ms(values[-1] if values else None)}
+
+
+def best_of(fn, repeat):
+    """Best wall time of `repeat` runs (fn gets a fresh setup each time) and the last result."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def allocations(fn):
+    """Runs fn once under tracemalloc; returns (result, {"peakKiB", "netKiB", "blocks"})."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        diff = tracemalloc.take_snapshot().compare_to(before, "filename")
+    finally:
+        tracemalloc.stop()
+    return result, {"peakKiB": round(peak / 1024, 1), "netKiB": round(sum(d.size_diff for d in diff) / 1024, 1),
+                    "blocks": sum(d.count_diff for d in diff if d.count_diff > 0)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_results(path, name, params, results):
+    """Writes one run as JSON: metadata (commit, python, time), the parameters and the results."""
+    doc = {"benchmark": name, "commit": git_commit(), "python": platform.python_version(),
+           "platform": platform.platform(), "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+           "params": params, "results": results}
+    with open(path, "w") as f:
+        json.dump(doc, f, indent=2)
+    print(f"results written to {path}")
@@ -0,0 +1,44 @@
+'''
+Compares two result files written with --out by the same benchmark.
+
+    python benchmarks/compare.py before.json after.json
+'''
+import argparse
+import json
+
+
+def _rows(doc):
+    """{label: {metric: value}} for either benchmark's result shape."""
+    results = doc["results"]
+    if doc["benchmark"] == "load_test":
+        rows = {"throughput": {"req/s": results["throughputPerSec"]}}
+        for op, stats in [("overall", results["overall"])] + list(results["operations"].items()):
+            rows[op] = {k: stats[k] for k in ("p50Ms", "p95Ms", "p99Ms")}
+        if "allocations" in results: rows["allocations"] = {"KiB/req": results["allocations"]["KiBPerRequest"]}
+        return rows
+    return {f"{r['bench']} m={r['members']} n={r['items']}": {"us/op": r["usPerOp"], "peakKiB": r.get("peakKiB")}
+            for r in results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    with open(args.before) as f: before = json.load(f)
+    with open(args.after) as f: after = json.load(f)
+    if before["benchmark"] != after["benchmark"]:
+        raise SystemExit(f"different benchmarks: {before['benchmark']} vs {after['benchmark']}")
+
+    print(f"{before['benchmark']}: {before['commit']} -> {after['commit']}")
+    old, new = _rows(before), _rows(after)
+    for label, metrics in new.items():
+        for metric, value in metrics.items():
+            prev = old.get(label, {}).get(metric)
+            if value is None or prev is None: continue
+            change = f"{(value - prev) / prev * 100:+.1f}%" if prev else "n/a"
+            print(f"{label:<40} {metric:<8} {prev:>12} -> {value:>12}  {change}")
+
+
+if __name__ == "__main__":
+    main()
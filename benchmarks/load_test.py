@@ -0,0 +1,167 @@
+'''
+Macro load generator: replays a realistic traffic mix against the Flask app in-process.
+
+    python benchmarks/load_test.py [--requests 5000] [--threads 8] [--groups 20] [--members 8]
+                                   [--seed-items 50] [--alloc-requests 500] [--out load.json]
+
+The app runs on the embedded LocalRepository (DB_BACKEND=memory unless set otherwise),
+so no network or credentials are needed. Any config.py environment variable can be set
+to compare settings, e.g. REPO_CACHE=1 or WRITE_COALESCE=0.
+
+Mix (weights): create item 30, paginate items 30, settlement views 30, add member 10.
+Reports throughput, p50/p95/p99 latency per operation, status codes, and allocations
+(tracemalloc peak and KiB per request) from a separate single-threaded pass.
+'''
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+os.environ.setdefault("DB_BACKEND", "memory")
+os.environ.setdefault("WARM_BACKEND", "0")
+
+from common import allocations, latency_summary, save_results
+import app
+
+MIX = [("create_item", 30), ("paginate_items", 30), ("settlement_views", 30), ("add_member", 10)]
+
+
+class Scenario:
+    """Seeded groups plus a pool of spare users to add as members."""
+    def __init__(self, client, groups, members, seed_items, seed):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.groups = []   # [(group_id, [member ids])]
+        self.spare = []    # [(user_id, email)]
+        for g in range(groups):
+            uids = [self._user(client, f"g{g}m{m}") for m in range(members)]
+            gid = client.post("/v1/groups/create", json={"groupName": f"group {g}", "groupMembers": uids}
+                              ).get_json()["data"]["group"]["groupId"]
+            items = [self.item(uids) for _ in range(seed_items)]
+            if items: client.post("/v1/items/batch", json={"groupId": gid, "items": items})
+            self.groups.append((gid, uids))
+        for s in range(groups * 5):
+            self.spare.append((self._user(client, f"spare{s}"), f"spare{s}@bench.local"))
+
+    def _user(self, client, name):
+        return client.post("/v1/users/create", json={"email": f"{name}@bench.local", "password": "bench",
+                                                     "name": name}).get_json()["data"]["userId"]
+
+    def item(self, uids, rng=None):
+        rng = rng or self.rng
+        splitters = rng.sample(uids, rng.randint(1, min(4, len(uids))))
+        values = [rng.choice([50, 100, 120, 250, 499.5]) for _ in splitters]
+        return {"itemName": "bench", "itemPayer": [rng.choice(uids)], "itemSpliter": splitters,
+                "itemSpliterValue": values, "itemPrice": sum(values)}
+
+
+def run_op(client, scenario, op, rng):
+    """Performs one operation; returns the HTTP status of its last request."""
+    gid, uids = rng.choice(scenario.groups)
+    if op == "create_item":
+        item = scenario.item(uids, rng)
+        item["itemGroupId"] = gid
+        return client.post("/v1/items/create", json=item).status_code
+    if op == "paginate_items":
+        body, status = {"groupId": gid, "limit": 10, "cursor": None}, 200
+        for _ in range(rng.randint(1, 3)):
+            response = client.post("/v1/groups/items", json=body)
+            status = response.status_code
+            body["cursor"] = (response.get_json() or {}).get("nextCursor")
+            if not body["cursor"]: break
+        return status
+    if op == "settlement_views":
+        uid = rng.choice(uids)
+        kind = rng.random()
+        if kind < 0.5:
+            return client.post("/v1/groups/expenseDetailbyCurrentUser", json={"groupId": gid, "currentUserId": uid}).status_code
+        if kind < 0.8:
+            return client.post("/v1/groups/expenseDetail", data=json.dumps(gid)).status_code
+        return client.post("/v1/users/balance", json={"userId": uid}).status_code
+    if op == "add_member":
+        with scenario.lock:
+            if not scenario.spare: return client.post("/v1/groups/getGroup", json={"groupId": gid}).status_code
+            uid, email = scenario.spare.pop()
+            uids.append(uid)
+        return client.put("/v1/groups/addMember", json={"groupId": gid, "memberEmail": email}).status_code
+    raise ValueError(op)
+
+
+def replay(flask_app, scenario, total, threads, seed):
+    """Runs `total` operations over `threads` clients; returns ([(op, seconds, status)], wall seconds)."""
+    ops, weights = zip(*MIX)
+    samples, lock = [], threading.Lock()
+    remaining = [total]
+
+    def worker(index):
+        client = flask_app.test_client()
+        rng = random.Random(seed * 1000 + index)
+        local = []
+        while True:
+            with lock:
+                if remaining[0] <= 0: break
+                remaining[0] -= 1
+            op = rng.choices(ops, weights)[0]
+            started = time.perf_counter()
+            status = run_op(client, scenario, op, rng)
+            local.append((op, time.perf_counter() - started, status))
+        with lock: samples.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers: t.start()
+    for t in workers: t.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, wall):
+    report = {"requests": len(samples), "wallSeconds": round(wall, 3),
+              "throughputPerSec": round(len(samples) / wall, 1) if wall else None,
+              "overall": latency_summary([s for _, s, _ in samples]), "operations": {}, "statuses": {}}
+    for op, _ in MIX:
+        report["operations"][op] = latency_summary([s for o, s, _ in samples if o == op])
+    for _, _, status in samples:
+        report["statuses"][str(status)] = report["statuses"].get(str(status), 0) + 1
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--seed-items", type=int, default=50, help="items per group before the run")
+    parser.add_argument("--alloc-requests", type=int, default=500, help="0 skips the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    flask_app = app.create_app()
+    started = time.perf_counter()
+    scenario = Scenario(flask_app.test_client(), args.groups, args.members, args.seed_items, args.seed)
+    print(f"seeded {args.groups} groups in {time.perf_counter() - started:.2f}s")
+
+    samples, wall = replay(flask_app, scenario, args.requests, args.threads, args.seed)
+    report = summarize(samples, wall)
+    if args.alloc_requests:
+        _, report["allocations"] = allocations(lambda: replay(flask_app, scenario, args.alloc_requests, 1, args.seed + 1))
+        report["allocations"]["KiBPerRequest"] = round(report["allocations"]["netKiB"] / args.alloc_requests, 2)
+
+    print(f"{report['requests']} requests in {report['wallSeconds']}s: {report['throughputPerSec']} req/s")
+    print(f"{'operation':<18} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for op, stats in [("overall", report["overall"])] + list(report["operations"].items()):
+        if stats["count"]:
+            print(f"{op:<18} {stats['count']:>6} {stats['p50Ms']:>8.2f} {stats['p95Ms']:>8.2f} {stats['p99Ms']:>8.2f}")
+    print(f"statuses: {report['statuses']}")
+    if "allocations" in report: print(f"allocations: {report['allocations']}")
+    if args.out:
+        params = dict(vars(args), backend=os.environ.get("DB_BACKEND"),
+                      env={k: v for k, v in os.environ.items() if k.startswith(("REPO_CACHE", "WRITE_COALESCE", "GROUP_MIRROR"))})
+        save_results(args.out, "load_test", params, report)
+
+
+if __name__ == "__main__":
+    main()
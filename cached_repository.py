@@ -0,0 +1,195 @@
+import copy
+from database_interface import DelegatingRepository
+from ttl_cache import TTLCache, MISSING
+
+
+class CachedRepository(DelegatingRepository):
+    """
+    Read-through cache for users, groups and items in front of any DatabaseInterface.
+    Each entity type has its own bounded LRU and TTL. Our own writes invalidate the
+    touched nodes; writes from other processes are bounded by the TTL.
+    Cached values are deep-copied on the way in and out because callers mutate them.
+
+    Groups and items are cached with their RTDB ETag: once an entry expires it is
+    revalidated with a conditional read, which costs a 304 and no body if unchanged.
+    """
+    def __init__(self, inner, max_entries=2048, user_ttl=60, group_ttl=15, item_ttl=300):
+        super().__init__(inner)
+        self.users = TTLCache(max_entries, user_ttl)
+        self.groups = TTLCache(max_entries, group_ttl)
+        self.items = TTLCache(max_entries, item_ttl)
+        self.revalidated = 0
+
+    def _read(self, cache, key, loader):
+        value = cache.get(key)
+        if value is not MISSING: return copy.deepcopy(value)
+        value = loader(key)
+        if value is not None: cache.set(key, copy.deepcopy(value))
+        return value
+
+    def _read_many(self, cache, keys, loader, id_field, tagged=False):
+        found = {}
+        for key in dict.fromkeys(k for k in keys if k):
+            value = cache.get(key)
+            if value is not MISSING: found[key] = copy.deepcopy(value[0] if tagged else value)
+        missing = [k for k in dict.fromkeys(keys) if k and k not in found]
+        for value in loader(missing) if missing else []:
+            found[value[id_field]] = value
+            cache.set(value[id_field], copy.deepcopy((value, None) if tagged else value))
+        return [found[k] for k in keys if k in found]
+
+    def _read_tagged(self, cache, key, loader, etag=None):
+        """
+        (changed, value, etag) like Reference.get_if_changed. Fresh entries answer locally;
+        expired ones are revalidated with their stored ETag instead of a full download.
+        """
+        entry = cache.get(key)
+        if entry is MISSING:
+            stale = cache.get_stale(key)
+            changed, value, current = loader(key, stale[1] if stale is not MISSING else None)
+            if changed:
+                entry = (value, current)
+            else:
+                self.revalidated += 1
+                entry = stale
+            if entry[0] is not None: cache.set(key, copy.deepcopy(entry))
+        value, current = entry
+        if etag is not None and etag == current: return False, None, None
+        return True, copy.deepcopy(value), current
+
+    def stats(self):
+        return {"users": self.users.stats(), "groups": self.groups.stats(), "items": self.items.stats(),
+                "revalidated": self.revalidated}
+
+    # --- USERS ---
+    def create_user(self, uid, data):
+        self.inner.create_user(uid, data)
+        self.users.pop(uid)
+
+    def get_user(self, uid):
+        return self._read(self.users, uid, self.inner.get_user)
+
+    def get_users(self, uids):
+        return self._read_many(self.users, uids, self.inner.get_users, "userId")
+
+    def get_user_by_email(self, email):
+        email_key = email.replace(".", "_dot_").replace("@", "_at_")
+        lookup = self.inner.get_user_by_email_key(email_key)
+        return self.get_user(lookup['userId']) if lookup else None
+
+    def get_user_groups(self, uid):
+        user = self.get_user(uid)
+        return user.get("groupIds", []) if user else []
+
+    def update_user(self, uid, data):
+        try:
+            return self.inner.update_user(uid, data)
+        finally:
+            self.users.pop(uid)
+
+    # --- GROUPS ---
+    def create_group(self, data):
+        try:
+            return self.inner.create_group(data)
+        finally:
+            for uid in data.get("groupMembers", []): self.users.pop(uid)
+
+    def add_group_member(self, group_id, member_id):
+        try:
+            return self.inner.add_group_member(group_id, member_id)
+        finally:
+            self.groups.pop(group_id)
+            self.users.pop(member_id)
+
+    def get_group(self, group_id):
+        return self._read_tagged(self.groups, group_id, self.inner.get_group_with_etag)[1]
+
+    def get_group_with_etag(self, group_id, etag=None):
+        return self._read_tagged(self.groups, group_id, self.inner.get_group_with_etag, etag)
+
+    def set_settlement_mode(self, group_id, mode):
+        try:
+            return self.inner.set_settlement_mode(group_id, mode)
+        finally:
+            self.groups.pop(group_id)
+
+    def update_group(self, group_id, data):
+        try:
+            return self.inner.update_group(group_id, data)
+        finally:
+            self.groups.pop(group_id)
+
+    def delete_group(self, group_id):
+        try:
+            return self.inner.delete_group(group_id)
+        finally:
+            self.groups.pop(group_id)
+
+    def mark_group_deleted(self, group_id, now_ms):
+        try:
+            return self.inner.mark_group_deleted(group_id, now_ms)
+        finally:
+            self.groups.pop(group_id)
+
+    def run_deletion_step(self, group_id, job, chunk_size, now_ms, lease_ms):
+        try:
+            return self.inner.run_deletion_step(group_id, job, chunk_size, now_ms, lease_ms)
+        finally:
+            if job["phase"] == "members":
+                # The chunk of members whose groupIds lose the group
+                start = job["membersUnlinked"]
+                for uid in (job.get("members") or [])[start:start + chunk_size]: self.users.pop(uid)
+            elif job["phase"] == "items":
+                # The step picks its chunk from the index: drop every cached item of the group
+                self.items.pop_where(lambda entry: (entry[0] or {}).get("itemGroupId") == group_id)
+            self.groups.pop(group_id)
+
+    # --- ITEMS ---
+    def get_item(self, item_id):
+        return self._read_tagged(self.items, item_id, self.inner.get_item_with_etag)[1]
+
+    def get_item_with_etag(self, item_id, etag=None):
+        return self._read_tagged(self.items, item_id, self.inner.get_item_with_etag, etag)
+
+    def get_items(self, item_ids):
+        return self._read_many(self.items, item_ids, self.inner.get_items, "itemId", tagged=True)
+
+    def delete_item(self, item_id):
+        try:
+            return self.inner.delete_item(item_id)
+        finally:
+            self.items.pop(item_id)
+
+    def create_item_atomically(self, item_data):
+        try:
+            return self.inner.create_item_atomically(item_data)
+        finally:
+            self.groups.pop(item_data.get("itemGroupId"))
+
+    def create_items_atomically(self, group_id, items):
+        try:
+            return self.inner.create_items_atomically(group_id, items)
+        finally:
+            self.groups.pop(group_id)
+
+    def delete_item_atomically(self, item_id):
+        item = self.get_item(item_id)
+        try:
+            return self.inner.delete_item_atomically(item_id)
+        finally:
+            self.items.pop(item_id)
+            if item: self.groups.pop(item.get("itemGroupId"))
+
+    def reconcile_group(self, group_id, repair=False, page_size=None):
+        try:
+            return self.inner.reconcile_group(group_id, repair, page_size)
+        finally:
+            if repair: self.groups.pop(group_id)
+
+    def apply_item_mutations(self, group_id, mutations):
+        try:
+            return self.inner.apply_item_mutations(group_id, mutations)
+        finally:
+            self.groups.pop(group_id)
+            for op, item_data in mutations:
+                if op == "delete": self.items.pop(item_data.get("itemId"))
@@ -0,0 +1,103 @@
+import os
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(int(default))).strip().lower() in ("1", "true", "yes", "on")
+
+
+# --- Read-through cache (CachedRepository) ---
+CACHE_ENABLED = _env_bool("REPO_CACHE", False)
+CACHE_MAX_ENTRIES = int(os.environ.get("REPO_CACHE_MAX_ENTRIES", 2048))
+CACHE_USER_TTL = float(os.environ.get("REPO_CACHE_USER_TTL", 60))
+CACHE_GROUP_TTL = float(os.environ.get("REPO_CACHE_GROUP_TTL", 15))
+CACHE_ITEM_TTL = float(os.environ.get("REPO_CACHE_ITEM_TTL", 300))
+
+# Per-group write coalescing: item creates/deletes arriving within the window share one transaction
+WRITE_COALESCE_ENABLED = _env_bool("WRITE_COALESCE", True)
+WRITE_COALESCE_WINDOW = float(os.environ.get("WRITE_COALESCE_WINDOW", 0.005))
+WRITE_COALESCE_MAX_BATCH = int(os.environ.get("WRITE_COALESCE_MAX_BATCH", 50))
+
+# Push-based mirror of hot groups (listen() subscriptions); off by default
+MIRROR_ENABLED = _env_bool("GROUP_MIRROR", False)
+MIRROR_MAX_GROUPS = int(os.environ.get("GROUP_MIRROR_MAX_GROUPS", 64))
+MIRROR_PROMOTE_AFTER = int(os.environ.get("GROUP_MIRROR_PROMOTE_AFTER", 20))
+MIRROR_DEMOTE_BELOW = int(os.environ.get("GROUP_MIRROR_DEMOTE_BELOW", 5))
+MIRROR_WINDOW = float(os.environ.get("GROUP_MIRROR_WINDOW", 60))
+MIRROR_VERIFY_AFTER = float(os.environ.get("GROUP_MIRROR_VERIFY_AFTER", 30))
+
+# --- Backend: "firebase" (default), "memory" or "sqlite" (LocalRepository) ---
+DB_BACKEND = os.environ.get("DB_BACKEND", "firebase").strip().lower()
+LOCAL_DB_PATH = os.environ.get("LOCAL_DB_PATH", "payplit_local.db")
+
+# --- Settlement (split_logic) ---
+# Minimal mode runs on groups of up to MIN_TRANSFER_MAX_MEMBERS unsettled members (never more than 20)
+MIN_TRANSFER_MAX_MEMBERS = int(os.environ.get("MIN_TRANSFER_MAX_MEMBERS", 16))
+MIN_TRANSFER_TIME_BUDGET = float(os.environ.get("MIN_TRANSFER_TIME_BUDGET", 0.25))
+
+# --- Serving (gunicorn.conf.py / app.create_app) ---
+DEBUG = _env_bool("FLASK_DEBUG", False)
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 2 * (os.cpu_count() or 1) + 1))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 8))
+# Load shedding: requests running at once per worker. It must stay below WEB_THREADS, since
+# gthread never hands a worker more requests than it has threads: the spare threads are the
+# ones that wait up to REQUEST_QUEUE_TIMEOUT seconds for a slot and then answer 503.
+# Default: a quarter of the threads kept spare (8 threads -> 6 slots).
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", max(1, WEB_THREADS - max(1, WEB_THREADS // 4))))
+REQUEST_QUEUE_TIMEOUT = float(os.environ.get("REQUEST_QUEUE_TIMEOUT", 5))
+REQUEST_TIMEOUT = int(os.environ.get("REQUEST_TIMEOUT", 30))
+GRACEFUL_TIMEOUT = int(os.environ.get("GRACEFUL_TIMEOUT", 20))
+FIREBASE_HTTP_TIMEOUT = float(os.environ.get("FIREBASE_HTTP_TIMEOUT", 10))
+# Build the backend in the background once the server is listening (else on first use)
+WARM_BACKEND = _env_bool("WARM_BACKEND", True)
+
+
+# Response compression (gzip) for bodies of at least COMPRESS_MIN_BYTES
+COMPRESS_ENABLED = _env_bool("COMPRESS_ENABLED", True)
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+
+# Group analytics cache (per group, validated by the groupItemIndex ETag)
+ANALYTICS_CACHE_GROUPS = int(os.environ.get("ANALYTICS_CACHE_GROUPS", 256))
+ANALYTICS_TOP_MAX = int(os.environ.get("ANALYTICS_TOP_MAX", 50))
+
+# NDJSON group export: items fetched per concurrent batch, bytes buffered per written chunk
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", 100))
+EXPORT_CHUNK_BYTES = int(os.environ.get("EXPORT_CHUNK_BYTES", 16384))
+
+# Delta sync (/v1/sync): change records kept per group, groups per request, items in a snapshot
+GROUP_CHANGELOG_MAX = int(os.environ.get("GROUP_CHANGELOG_MAX", 200))
+SYNC_MAX_GROUPS = int(os.environ.get("SYNC_MAX_GROUPS", 200))
+SYNC_SNAPSHOT_ITEMS = int(os.environ.get("SYNC_SNAPSHOT_ITEMS", 10))
+
+# /v1/groups/batchGet: groups per request
+BATCH_GET_MAX_GROUPS = int(os.environ.get("BATCH_GET_MAX_GROUPS", 100))
+
+# Background group deletion: deletes per multi-path write, job lease, worker threads, resume scan period
+GROUP_DELETE_CHUNK = int(os.environ.get("GROUP_DELETE_CHUNK", 200))
+GROUP_DELETE_LEASE = float(os.environ.get("GROUP_DELETE_LEASE", 60))
+GROUP_DELETE_WORKERS = int(os.environ.get("GROUP_DELETE_WORKERS", 2))
+GROUP_DELETE_RESUME_EVERY = float(os.environ.get("GROUP_DELETE_RESUME_EVERY", 60))
+
+# Idempotency-Key on item create / batch / delete: responses are kept IDEMPOTENCY_TTL seconds,
+# a claim is held IDEMPOTENCY_LEASE seconds, duplicates wait up to IDEMPOTENCY_WAIT seconds.
+# The lease must outlast the request holding the claim: up to REQUEST_TIMEOUT, plus
+# GRACEFUL_TIMEOUT when a worker finishes its requests on shutdown, plus a margin for clock
+# skew between hosts. A shorter lease lets a retry run a slow request a second time.
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 10000))
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", 86400))
+IDEMPOTENCY_LEASE = float(os.environ.get("IDEMPOTENCY_LEASE", REQUEST_TIMEOUT + GRACEFUL_TIMEOUT + 10))
+IDEMPOTENCY_WAIT = float(os.environ.get("IDEMPOTENCY_WAIT", 10))
+
+# Firebase ID tokens (Authorization: Bearer), verified locally.
+# AUTH_MODE: off | optional (verify when sent, default) | required (all but the public routes)
+AUTH_MODE = os.environ.get("AUTH_MODE", "optional").strip().lower()
+AUTH_PROJECT_ID = os.environ.get("AUTH_PROJECT_ID", "")  # default: the project of the database
+AUTH_CERTS_URL = os.environ.get("AUTH_CERTS_URL", "")    # default: Google's securetoken certificates
+AUTH_PROFILE_CACHE_SIZE = int(os.environ.get("AUTH_PROFILE_CACHE_SIZE", 4096))
+AUTH_PROFILE_TTL = float(os.environ.get("AUTH_PROFILE_TTL", 30))
+
+# Instrumentation (GET /metrics). Requests slower than TRACE_SLOW_REQUEST_MS (0 = off)
+# log their repository calls and database round trips, for TRACE_SAMPLE_RATE of them.
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+TRACE_SLOW_REQUEST_MS = float(os.environ.get("TRACE_SLOW_REQUEST_MS", 0))
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 1.0))
\ No newline at end of file
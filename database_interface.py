@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+import threading
 
 class DatabaseInterface(ABC):
     @abstractmethod
@@ -8,6 +9,8 @@ class DatabaseInterface(ABC):
     @abstractmethod
     def get_all_users(self): pass
     @abstractmethod
+    def get_users(self, uids): pass
+    @abstractmethod
     def get_user_by_email(self, email): pass
     @abstractmethod
     def update_user(self, uid, data): pass
@@ -17,19 +20,200 @@ class DatabaseInterface(ABC):
     @abstractmethod
     def get_group(self, group_id): pass
     @abstractmethod
+    def get_group_with_etag(self, group_id, etag=None): pass
+    @abstractmethod
+    def get_group_fields(self, group_ids, fields): pass
+    @abstractmethod
+    def listen_group(self, group_id, callback): pass
+    @abstractmethod
     def get_all_groups(self, limit, start_at): pass
     @abstractmethod
     def update_group(self, group_id, data): pass
     @abstractmethod
     def delete_group(self, group_id): pass
+    @abstractmethod
+    def add_group_member(self, group_id, member_id): pass
+    @abstractmethod
+    def set_settlement_mode(self, group_id, mode): pass
 
     @abstractmethod
     def create_item(self, data): pass
     @abstractmethod
     def get_item(self, item_id): pass
     @abstractmethod
+    def get_item_with_etag(self, item_id, etag=None): pass
+    @abstractmethod
+    def get_items(self, item_ids): pass
+    @abstractmethod
     def get_all_items(self): pass
     @abstractmethod
-    def get_paginated_items(self, item_ids, limit, offset): pass
+    def get_group_item_ids(self, group_id): pass
+    @abstractmethod
+    def get_group_item_index_with_etag(self, group_id, etag=None): pass
+    @abstractmethod
+    def get_paginated_items(self, group_id, limit, offset): pass
+    @abstractmethod
+    def get_items_page(self, group_id, limit, cursor=None): pass
+    @abstractmethod
+    def delete_item(self, item_id): pass
+
+    # --- Used by the API, implemented by every backend ---
+    @abstractmethod
+    def get_user_groups(self, uid): pass
+    @abstractmethod
+    def get_user_by_email_key(self, email_key): pass
+    @abstractmethod
+    def create_item_atomically(self, item_data): pass
+    @abstractmethod
+    def create_items_atomically(self, group_id, items): pass
+    @abstractmethod
+    def delete_item_atomically(self, item_id): pass
+    @abstractmethod
+    def apply_item_mutations(self, group_id, mutations): pass
+
+    @abstractmethod
+    def scan_users(self, page_size=None): pass
+    @abstractmethod
+    def scan_groups(self, page_size=None): pass
+    @abstractmethod
+    def scan_items(self, page_size=None): pass
+    @abstractmethod
+    def scan_group_items(self, group_id, page_size=None): pass
+    @abstractmethod
+    def reconcile_group(self, group_id, repair=False, page_size=None): pass
+
+    @abstractmethod
+    def get_group_revisions(self, group_ids): pass
+    @abstractmethod
+    def get_group_changes(self, group_id, since_rev, limit=None): pass
+
+    @abstractmethod
+    def mark_group_deleted(self, group_id, now_ms): pass
+    @abstractmethod
+    def get_deletion_job(self, group_id): pass
     @abstractmethod
-    def delete_item(self, item_id): pass
\ No newline at end of file
+    def queued_deletion_jobs(self): pass
+    @abstractmethod
+    def claim_deletion_job(self, group_id, owner, now_ms, lease_ms): pass
+    @abstractmethod
+    def run_deletion_step(self, group_id, job, chunk_size, now_ms, lease_ms): pass
+    @abstractmethod
+    def fail_deletion_step(self, group_id, error, now_ms): pass
+
+    @abstractmethod
+    def get_idempotency_record(self, key): pass
+    @abstractmethod
+    def claim_idempotency_key(self, key, fingerprint, now_ms, lease_ms, ttl_ms): pass
+    @abstractmethod
+    def complete_idempotency_key(self, key, record): pass
+    @abstractmethod
+    def release_idempotency_key(self, key): pass
+    @abstractmethod
+    def purge_idempotency_keys(self, now_ms, limit=500): pass
+
+    @abstractmethod
+    def get_user_settlement(self, uid, group_id): pass
+    @abstractmethod
+    def get_user_settlement_with_etag(self, uid, group_id, etag=None): pass
+    @abstractmethod
+    def get_user_settlements(self, uid): pass
+    @abstractmethod
+    def rebuild_user_settlements(self, group_id): pass
+
+
+class DelegatingRepository(DatabaseInterface):
+    """Base for decorators: forwards every call to the wrapped repository."""
+    def __init__(self, inner):
+        self.inner = inner
+
+    def create_user(self, uid, data): return self.inner.create_user(uid, data)
+    def get_user(self, uid): return self.inner.get_user(uid)
+    def get_all_users(self): return self.inner.get_all_users()
+    def get_users(self, uids): return self.inner.get_users(uids)
+    def get_user_by_email(self, email): return self.inner.get_user_by_email(email)
+    def update_user(self, uid, data): return self.inner.update_user(uid, data)
+    def get_user_groups(self, uid): return self.inner.get_user_groups(uid)
+    def get_user_by_email_key(self, email_key): return self.inner.get_user_by_email_key(email_key)
+
+    def create_group(self, data): return self.inner.create_group(data)
+    def get_group(self, group_id): return self.inner.get_group(group_id)
+    def get_group_with_etag(self, group_id, etag=None): return self.inner.get_group_with_etag(group_id, etag)
+    def get_group_fields(self, group_ids, fields): return self.inner.get_group_fields(group_ids, fields)
+    def listen_group(self, group_id, callback): return self.inner.listen_group(group_id, callback)
+    def get_all_groups(self, limit, start_at): return self.inner.get_all_groups(limit, start_at)
+    def update_group(self, group_id, data): return self.inner.update_group(group_id, data)
+    def delete_group(self, group_id): return self.inner.delete_group(group_id)
+    def add_group_member(self, group_id, member_id): return self.inner.add_group_member(group_id, member_id)
+    def set_settlement_mode(self, group_id, mode): return self.inner.set_settlement_mode(group_id, mode)
+
+    def create_item(self, data): return self.inner.create_item(data)
+    def get_item(self, item_id): return self.inner.get_item(item_id)
+    def get_item_with_etag(self, item_id, etag=None): return self.inner.get_item_with_etag(item_id, etag)
+    def get_items(self, item_ids): return self.inner.get_items(item_ids)
+    def get_all_items(self): return self.inner.get_all_items()
+    def get_group_item_ids(self, group_id): return self.inner.get_group_item_ids(group_id)
+    def get_group_item_index_with_etag(self, group_id, etag=None):
+        return self.inner.get_group_item_index_with_etag(group_id, etag)
+    def get_paginated_items(self, group_id, limit, offset): return self.inner.get_paginated_items(group_id, limit, offset)
+    def get_items_page(self, group_id, limit, cursor=None): return self.inner.get_items_page(group_id, limit, cursor)
+    def delete_item(self, item_id): return self.inner.delete_item(item_id)
+    def create_item_atomically(self, item_data): return self.inner.create_item_atomically(item_data)
+    def create_items_atomically(self, group_id, items): return self.inner.create_items_atomically(group_id, items)
+    def delete_item_atomically(self, item_id): return self.inner.delete_item_atomically(item_id)
+    def apply_item_mutations(self, group_id, mutations): return self.inner.apply_item_mutations(group_id, mutations)
+
+    def scan_users(self, page_size=None): return self.inner.scan_users(page_size)
+    def scan_groups(self, page_size=None): return self.inner.scan_groups(page_size)
+    def scan_items(self, page_size=None): return self.inner.scan_items(page_size)
+    def scan_group_items(self, group_id, page_size=None): return self.inner.scan_group_items(group_id, page_size)
+    def reconcile_group(self, group_id, repair=False, page_size=None):
+        return self.inner.reconcile_group(group_id, repair, page_size)
+
+    def get_group_revisions(self, group_ids): return self.inner.get_group_revisions(group_ids)
+    def get_group_changes(self, group_id, since_rev, limit=None):
+        return self.inner.get_group_changes(group_id, since_rev, limit)
+
+    def mark_group_deleted(self, group_id, now_ms): return self.inner.mark_group_deleted(group_id, now_ms)
+    def get_deletion_job(self, group_id): return self.inner.get_deletion_job(group_id)
+    def queued_deletion_jobs(self): return self.inner.queued_deletion_jobs()
+    def claim_deletion_job(self, group_id, owner, now_ms, lease_ms):
+        return self.inner.claim_deletion_job(group_id, owner, now_ms, lease_ms)
+    def run_deletion_step(self, group_id, job, chunk_size, now_ms, lease_ms):
+        return self.inner.run_deletion_step(group_id, job, chunk_size, now_ms, lease_ms)
+    def fail_deletion_step(self, group_id, error, now_ms): return self.inner.fail_deletion_step(group_id, error, now_ms)
+
+    def get_idempotency_record(self, key): return self.inner.get_idempotency_record(key)
+    def claim_idempotency_key(self, key, fingerprint, now_ms, lease_ms, ttl_ms):
+        return self.inner.claim_idempotency_key(key, fingerprint, now_ms, lease_ms, ttl_ms)
+    def complete_idempotency_key(self, key, record): return self.inner.complete_idempotency_key(key, record)
+    def release_idempotency_key(self, key): return self.inner.release_idempotency_key(key)
+    def purge_idempotency_keys(self, now_ms, limit=500): return self.inner.purge_idempotency_keys(now_ms, limit)
+
+    def get_user_settlement(self, uid, group_id): return self.inner.get_user_settlement(uid, group_id)
+    def get_user_settlement_with_etag(self, uid, group_id, etag=None):
+        return self.inner.get_user_settlement_with_etag(uid, group_id, etag)
+    def get_user_settlements(self, uid): return self.inner.get_user_settlements(uid)
+    def rebuild_user_settlements(self, group_id): return self.inner.rebuild_user_settlements(group_id)
+
+
+
+class LazyRepository(DelegatingRepository):
+    """Builds the real repository with `factory` on first use, so startup never touches the database."""
+    def __init__(self, factory):
+        self._factory = factory
+        self._inner = None
+        self._lock = threading.Lock()
+
+    @property
+    def inner(self):
+        if self._inner is None:
+            with self._lock:
+                if self._inner is None: self._inner = self._factory()
+        return self._inner
+
+    @property
+    def ready(self):
+        return self._inner is not None
+
+    def reset(self):
+        with self._lock: self._inner = None
@@ -1,28 +1,185 @@
-from firebase_admin import db
 from database_interface import DatabaseInterface
-from split_logic import update_group_balances
-from split_logic import optimal_account_balance
+from split_logic import apply_balance_deltas, from_minor, item_deltas, settle_group, to_minor, user_settlement_summaries, validate_item, LedgerCache, SettlementLedger, SETTLEMENT_MODES
+from concurrent.futures import ThreadPoolExecutor
+from push_ids import generate_push_id
+import heapq
+import local_db
+import metrics
+import sqlite3
+import sys
 import traceback
+
+# Bounded pool for batch reads. firebase_admin shares one requests session per app
+# (10 pooled connections), so staying below that keeps every fetch on a warm socket.
+MAX_FETCH_WORKERS = 8
+_fetch_pool = ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS, thread_name_prefix="rtdb-fetch")
+# Children per request for the streaming scans; memory stays at about one page
+SCAN_PAGE_SIZE = 500
+# Change records kept per group in groupChanges/{gid}; clients further behind get a snapshot
+GROUP_CHANGELOG_MAX = 200
+# Re-checks of groups/{gid}/rev after a summary write before leaving stale views to reconcile
+SETTLE_VIEW_ATTEMPTS = 5
+# Parsed integer ledgers of recently written groups, reused by the next item transaction
+_ledgers = LedgerCache()
+
+
+def _visible(group):
+    """Groups marked for deletion read as missing while their deletion job runs."""
+    return None if group and group.get("deleted") else group
+
+
+def _as_list(value):
+    """An RTDB array as a list without holes (sparse arrays come back as {index: value})."""
+    if isinstance(value, dict): value = [value[k] for k in sorted(value, key=lambda k: (len(k), k))]
+    return [v for v in value or [] if v]
+
+
+def _group_ids(value):
+    """
+    users/{uid}/groupIds as a list of group ids. Links are written keyed, {gid: true}, so one
+    multi-path update can add them; older users hold a list of ids (or both, mixed).
+    """
+    if isinstance(value, dict):
+        value = [k if v is True else v for k, v in sorted(value.items(), key=lambda kv: (len(kv[0]), kv[0]))]
+    return list(dict.fromkeys(gid for gid in value or [] if isinstance(gid, str) and gid))
+
+
+def _with_group_list(user):
+    """A user record as clients read it: groupIds always a list."""
+    if isinstance(user, dict) and "groupIds" in user: user["groupIds"] = _group_ids(user["groupIds"])
+    return user
+
+
+# Children of groups/{gid} holding objects or arrays; a shallow read of the group returns only True for them
+_GROUP_OBJECTS = frozenset(("groupMembers", "memberNames", "groupBalance", "groupGraph", "groupItems"))
+
+
+def _child(value, path):
+    """value at a "/"-separated path inside a read node, or None."""
+    for key in path.split("/"):
+        if isinstance(value, list) and key.isdigit(): value = value[int(key)] if int(key) < len(value) else None
+        elif isinstance(value, dict): value = value.get(key)
+        else: return None
+    return value
+
+
+def _union(index, legacy_ids):
+    """Index keys plus the ids a not yet migrated group still lists in groupItems, oldest first."""
+    return sorted(set(index).union(legacy_ids)) if legacy_ids else list(index)
+
+
+def is_backend_error(exc):
+    """
+    True for a failure of the database or of the connection to it, which a retry may not hit
+    (as opposed to a refusal of the request itself). Item writes raise these instead of
+    reporting them, so callers can answer 503 and never store them as the request's outcome.
+    """
+    if isinstance(exc, (ConnectionError, TimeoutError, local_db.TransactionAbortedError, sqlite3.OperationalError)):
+        return True
+    firebase = sys.modules.get("firebase_admin.exceptions")  # only loaded with the Firebase backend
+    return firebase is not None and isinstance(exc, firebase.FirebaseError)
+
+
+def shutdown():
+    """Waits for in-flight batch reads; called on worker exit."""
+    _fetch_pool.shutdown(wait=True)
+
 class FirebaseRepository(DatabaseInterface):
+    def _ref(self, path):
+        """Single entry point to the database; LocalRepository swaps in an embedded store."""
+        from firebase_admin import db  # imported lazily: keeps firebase_admin out of cold start
+        return metrics.track(db.reference(path), path)
+
+    def _get_with_etag(self, path, etag=None):
+        """
+        (changed, value, etag). With a known etag the database answers 304 and sends no body
+        when the node is unchanged; then changed is False and value/etag are None.
+        """
+        ref = self._ref(path)
+        if etag: return ref.get_if_changed(etag)
+        value, current = ref.get(etag=True)
+        return True, value, current
+
+    # --- BATCH READS ---
+    def _fetch_many(self, root, ids):
+        """Fetches root/{id} for every distinct id concurrently. Returns {id: value or None}."""
+        unique_ids = list(dict.fromkeys(i for i in ids if i))
+        if not unique_ids: return {}
+        values = _fetch_pool.map(metrics.propagate(lambda i: self._ref(f"{root}/{i}").get()), unique_ids)
+        return dict(zip(unique_ids, values))
+
+    def _get_many(self, root, ids):
+        """Batch read that keeps the requested order and skips missing nodes."""
+        found = self._fetch_many(root, ids)
+        return [found[i] for i in ids if found.get(i)]
+
+    def _iter_many(self, root, ids):
+        """Like _get_many, but yields each value as soon as it and everything before it has arrived."""
+        for value in _fetch_pool.map(metrics.propagate(lambda i: self._ref(f"{root}/{i}").get()), ids):
+            if value: yield value
+
+    # --- STREAMING SCANS (key-ordered pages, constant memory) ---
+    def _scan(self, path, page_size=None):
+        """Yields (key, value) of every child of path in key order, page_size children per request."""
+        page_size = page_size or SCAN_PAGE_SIZE
+        cursor = None
+        while True:
+            query = self._ref(path).order_by_key()
+            if cursor is not None: query = query.start_at(cursor)
+            page = query.limit_to_first(page_size + 1 if cursor is not None else page_size).get() or {}
+            keys = [k for k in page if k != cursor]
+            for key in keys: yield key, page[key]
+            if len(keys) < page_size: return
+            cursor = keys[-1]
+
+    def scan_users(self, page_size=None):
+        return self._scan("users", page_size)
+
+    def scan_groups(self, page_size=None):
+        return self._scan("groups", page_size)
+
+    def scan_items(self, page_size=None):
+        return self._scan("items", page_size)
+
+    def scan_group_items(self, group_id, page_size=None):
+        """
+        Yields the items of one group, oldest first: index pages (merged with the ids of a group
+        not yet fully migrated), each fetched as one concurrent batch whose items are yielded as they arrive.
+        """
+        page_size = page_size or SCAN_PAGE_SIZE
+        index_ids = (item_id for item_id, _ in self._scan(f"groupItemIndex/{group_id}", page_size))
+        ids, last = [], None
+        for item_id in heapq.merge(index_ids, self._legacy_item_ids(group_id)):
+            if item_id == last: continue
+            ids.append(item_id)
+            last = item_id
+            if len(ids) == page_size:
+                yield from self._iter_many("items", ids)
+                ids = []
+        if ids: yield from self._iter_many("items", ids)
+
     # --- USER LOGIC ---
     def create_user(self, uid, data):
-        db.reference(f"users/{uid}").set(data)
+        self._ref(f"users/{uid}").set(data)
         email_key = data['email'].replace(".", "_dot_").replace("@", "_at_")
-        db.reference(f"usersAsEmailKey/{email_key}").set({"userId": uid})
+        self._ref(f"usersAsEmailKey/{email_key}").set({"userId": uid})
 
     def get_user(self, uid):
-        return db.reference(f"users/{uid}").get()
+        return _with_group_list(self._ref(f"users/{uid}").get())
 
     def get_all_users(self):
-        return db.reference("users").get() or {}
+        return {uid: _with_group_list(user) for uid, user in (self._ref("users").get() or {}).items()}
+
+    def get_users(self, uids):
+        return {uid: _with_group_list(user) for uid, user in self._get_many("users", uids).items()}
 
     def get_user_by_email(self, email):
         email_key = email.replace(".", "_dot_").replace("@", "_at_")
-        lookup = db.reference(f"usersAsEmailKey/{email_key}").get()
+        lookup = self._ref(f"usersAsEmailKey/{email_key}").get()
         return self.get_user(lookup['userId']) if lookup else None
 
     def update_user(self, uid, data):
-        db.reference(f"users/{uid}").update(data)
+        self._ref(f"users/{uid}").update(data)
         
     # Inside FirebaseRepository class   
 
@@ -31,142 +188,607 @@ class FirebaseRepository(DatabaseInterface):
         return user.get("groupIds", []) if user else []
 
     def get_user_by_email_key(self, email_key):
-        return db.reference(f"usersAsEmailKey/{email_key}").get()        
+        return self._ref(f"usersAsEmailKey/{email_key}").get()        
 
     # --- GROUP LOGIC ---
     def create_group(self, data):
-        # 🔥 DENORMALIZATION
-        member_names = {}
-        for uid in data.get("groupMembers", []):
-            user = self.get_user(uid)
-            member_names[uid] = user.get("name", "Unknown") if user else "Unknown"
-        data["memberNames"] = member_names
-        
-        ref = db.reference("groups").push()
-        data["groupId"] = ref.key
-        ref.set(data)
+        # 🔥 DENORMALIZATION: group node, its first change record and every member's groupIds
+        # link in ONE multi-path write (all or nothing)
+        users = self._fetch_many("users", data.get("groupMembers", []))
+        data["memberNames"] = {uid: (user or {}).get("name", "Unknown") for uid, user in users.items()}
+
+        group_id = generate_push_id()
+        data["groupId"] = group_id
+        data.pop("groupItems", None)  # item membership lives in groupItemIndex/{gid}
+        data["rev"] = 1
+        updates = {f"groups/{group_id}": data}
+        updates.update(self._change_updates(group_id, 1, [{"op": "groupCreated"}]))
+        updates.update({f"users/{uid}/groupIds/{group_id}": True for uid, user in users.items() if user})
+        self._ref("/").update(updates)
         return data
 
+    def add_group_member(self, group_id, member_id):
+        """
+        Appends member_id to groupMembers in a transaction on that list alone (concurrent adds all
+        land), bumps the group's rev, then writes its name, the user's groupIds link and the
+        change record in ONE multi-path write. Adding an existing member rewrites the name and
+        link only, which repairs an earlier add that stopped half way.
+        """
+        # Transactions cannot write None, so unknown groups are turned away before
+        group_future = _fetch_pool.submit(metrics.propagate(lambda: self._ref(f"groups/{group_id}").get(shallow=True)))
+        user = self.get_user(member_id)
+        if not _visible(group_future.result()) or not user: return False
+        added = [False]
+
+        def member_transaction(members):
+            members = _as_list(members)
+            added[0] = member_id not in members
+            return members + [member_id] if added[0] else members
+
+        self._ref(f"groups/{group_id}/groupMembers").transaction(member_transaction)
+        updates = {f"groups/{group_id}/memberNames/{member_id}": user.get("name", "Unknown"),
+                   f"users/{member_id}/groupIds/{group_id}": True}
+        if added[0]:
+            rev = self._ref(f"groups/{group_id}/rev").transaction(lambda rev: (rev or 0) + 1)
+            updates.update(self._change_updates(group_id, rev, [{"op": "memberAdded", "userId": member_id}]))
+        self._ref("/").update(updates)
+        return True
+
     def get_group(self, group_id):
-        return db.reference(f"groups/{group_id}").get()
+        return _visible(self._ref(f"groups/{group_id}").get())
+
+    def get_group_fields(self, group_ids, fields):
+        """
+        {group_id: {field: value}} for the groups that exist (fields may be paths such as
+        "groupBalance/<uid>"), with at most 2 reads per group, all concurrent: a shallow read of
+        groups/{gid} returns its scalar fields (and groupId / deleted), and the one requested
+        object or path is read beside it. Asking for several objects reads each group once, whole.
+        """
+        ids = list(dict.fromkeys(gid for gid in group_ids if gid))
+        fields = [f for f in dict.fromkeys(fields) if f != "groupId"]
+        deep = [f for f in fields if "/" in f or f in _GROUP_OBJECTS]
+        whole = len(deep) > 1
+        reads = [(gid, None) for gid in ids] + ([(gid, deep[0]) for gid in ids] if len(deep) == 1 else [])
+
+        def read(key):
+            gid, field = key
+            if field: return self._ref(f"groups/{gid}/{field}").get()
+            return self._ref(f"groups/{gid}").get(shallow=not whole)
+        values = dict(zip(reads, _fetch_pool.map(metrics.propagate(read), reads)))
+        found = {}
+        for gid in ids:
+            group = values[(gid, None)]
+            # groupId doubles as the existence probe: every group node stores it
+            if not isinstance(group, dict) or group.get("groupId") is None or group.get("deleted"): continue
+            found[gid] = {"groupId": gid}
+            for field in fields:
+                found[gid][field] = (_child(group, field) if whole else
+                                     values[(gid, field)] if field in deep else group.get(field))
+        return found
+
+    def get_group_with_etag(self, group_id, etag=None):
+        changed, group, etag = self._get_with_etag(f"groups/{group_id}", etag)
+        return changed, _visible(group), etag
+
+    def listen_group(self, group_id, callback):
+        """Streams put/patch events of groups/{gid} to callback; returns the registration (close() to stop)."""
+        return self._ref(f"groups/{group_id}").listen(callback)
 
     def get_all_groups(self, limit, start_at):
-        query = db.reference("groups").order_by_key()
+        query = self._ref("groups").order_by_key()
         if start_at: query = query.start_at(start_at)
         return query.limit_to_first(limit).get() or {}
 
     def update_group(self, group_id, data):
-        db.reference(f"groups/{group_id}").update(data)
+        self._ref(f"groups/{group_id}").update(data)
 
     def delete_group(self, group_id):
-        db.reference(f"groups/{group_id}").delete()
+        updates = {f"groups/{group_id}": None, f"groupItemIndex/{group_id}": None, f"groupChanges/{group_id}": None}
+        for uid in self._ref(f"groups/{group_id}/groupMembers").get() or []:
+            if uid: updates[f"userSettlements/{uid}/{group_id}"] = None
+        self._ref("/").update(updates)
+
+    def set_settlement_mode(self, group_id, mode):
+        """Switches the group's solver ("greedy" / "minimal") and re-settles its graph atomically."""
+        if mode not in SETTLEMENT_MODES: return False, f"Unknown settlement mode: {mode}"
+
+        def mode_transaction(current_group):
+            if current_group is None or current_group.get("deleted"): return current_group
+            current_group["settlementMode"] = mode
+            settle_group(current_group)
+            current_group["rev"] = current_group.get("rev", 0) + 1
+            return current_group
+
+        try:
+            new_group = _visible(self._ref(f"groups/{group_id}").transaction(mode_transaction))
+            if not new_group: return False, "Group not found"
+            updates = self._settlement_updates(group_id, new_group)
+            updates.update(self._change_updates(group_id, new_group["rev"], [{"op": "settlementMode", "mode": mode}]))
+            self._ref("/").update(updates)
+            self._settle_views(group_id, new_group["rev"])
+            return True, "Settlement mode updated"
+        except Exception as e:
+            return False, str(e)
+
+    # --- SETTLEMENT VIEWS (userSettlements/{uid}/{gid}, rewritten after every ledger change) ---
+
+    def _settlement_updates(self, group_id, group_data, uids=None):
+        """Multi-path entries refreshing the members' summaries (all, or `uids`), stamped with the group rev."""
+        summaries = user_settlement_summaries(group_data or {}, uids)
+        return {f"userSettlements/{uid}/{group_id}": summary for uid, summary in summaries.items()}
+
+    def _settle_views(self, group_id, rev, uids=None):
+        """
+        Called after a write that carried the summaries of `uids` (all members if None) at `rev`.
+        Writes of consecutive revisions can land out of order, so when a later revision has
+        committed meanwhile, its summaries may have been overwritten by ours: rewrite them from
+        the current group until no newer revision shows up. A writer whose check still sees its
+        own rev landed after every earlier one. Costs one read of groups/{gid}/rev.
+        """
+        try:
+            for _ in range(SETTLE_VIEW_ATTEMPTS):
+                current = self._ref(f"groups/{group_id}/rev").get()
+                if current is None or current <= rev: return
+                group = _visible(self._ref(f"groups/{group_id}").get())
+                if not group: return
+                rev = group.get("rev", 0)
+                self._ref("/").update(self._settlement_updates(group_id, group, uids))
+        except Exception:
+            traceback.print_exc()  # the write itself succeeded; reconcile_group rewrites stale views
+
+    def get_user_settlement(self, uid, group_id):
+        return self._ref(f"userSettlements/{uid}/{group_id}").get()
+
+    def get_user_settlement_with_etag(self, uid, group_id, etag=None):
+        return self._get_with_etag(f"userSettlements/{uid}/{group_id}", etag)
+
+    def get_user_settlements(self, uid):
+        return self._ref(f"userSettlements/{uid}").get() or {}
+
+    def rebuild_user_settlements(self, group_id):
+        """Backfills the summaries of a group from its current ledger; returns {uid: summary}."""
+        group = self.get_group(group_id)
+        if not group: return {}
+        self._ref("/").update(self._settlement_updates(group_id, group))
+        self._settle_views(group_id, group.get("rev", 0))
+        return user_settlement_summaries(group)
 
     # --- ITEM LOGIC ---
 
     def create_item_atomically(self, item_data):
         try:
-            item_ref = db.reference("items").push()
-            item_id = item_ref.key
-            item_data["itemId"] = item_id
-
             group_id = item_data["itemGroupId"]
-            group_ref = db.reference(f"groups/{group_id}")
-
-            def create_transaction(current_group):
-                if current_group is None: return None
-                
-                # 1. Standard Denormalization
-                name_map = current_group.get("memberNames", {})
-                item_data["itemPayerNames"] = [name_map.get(uid, "Unknown") for uid in item_data.get("itemPayer", [])]
-                item_data["itemSpliterNames"] = [name_map.get(uid, "Unknown") for uid in item_data.get("itemSpliter", [])]
-                current_group.setdefault("groupItems", []).append(item_id)
-
-                # 2. 🔥 UPDATED GRAPH LOGIC
-                payer_id = item_data["itemPayer"][0]
-                splitters = item_data["itemSpliter"]
-                values = item_data["itemSpliterValue"]
-
-                for k in range(len(splitters)):
-                    # Step A: Update the ledger
-                    update_group_balances(current_group, payer_id, splitters[k], values[k])
-                
-                # Step B: Rebuild simplified instructions
-                optimal_account_balance(current_group)
-                
-                return current_group
-
-            group_ref.transaction(create_transaction)
-            db.reference(f"items/{item_id}").set(item_data)
-            return True, "item created"
+            validate_item(item_data, group_id)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return False, f"Invalid item: {e}"
+        return self._apply_one(group_id, ("create", item_data))
+
+    def _apply_one(self, group_id, mutation):
+        try:
+            return self.apply_item_mutations(group_id, [mutation])[0]
         except Exception as e:
+            if is_backend_error(e): raise
             return False, str(e)
 
-    def delete_item_atomically(self, item_id):
-        item_data = db.reference(f"items/{item_id}").get()
-        if not item_data: return False, "Not found"
-
-        group_id = item_data["itemGroupId"]
-        group_ref = db.reference(f"groups/{group_id}")
-
-        def delete_transaction(current_group):
-            if current_group is None: return None
-            
-            # Remove from history
-            if "groupItems" in current_group:
-                current_group["groupItems"] = [i for i in current_group["groupItems"] if i != item_id]
-
-            # 🔥 REVERSE THE LEDGER
-            payer_id = item_data["itemPayer"][0]
-            splitters = item_data["itemSpliter"]
-            values = item_data["itemSpliterValue"]
-
-            for k in range(len(splitters)):
-                # To reverse, we add the negative of the original split value
-                reverse_amt = -float(values[k])
-                update_group_balances(current_group, payer_id, splitters[k], reverse_amt)
-            
-            # Rebuild simplified instructions for remaining balances
-            optimal_account_balance(current_group)
-            
+    def create_items_atomically(self, group_id, items):
+        """
+        🔥 BULK CREATE: keys are reserved locally, every ledger delta is applied in ONE group
+        transaction and all item nodes are written in ONE multi-path update.
+        Returns one {"index", "success", "itemId" | "message"} result per input item.
+        """
+        results = [None] * len(items)
+        accepted = []
+        for index, item_data in enumerate(items):
+            try:
+                validate_item(item_data, group_id)
+                accepted.append((index, item_data))
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                results[index] = {"index": index, "success": False, "message": f"Invalid item: {e}"}
+
+        if accepted:
+            try:
+                outcomes = self.apply_item_mutations(group_id, [("create", item) for _, item in accepted])
+            except Exception as e:
+                if is_backend_error(e): raise
+                outcomes = [(False, str(e))] * len(accepted)
+            for (index, item_data), (success, message) in zip(accepted, outcomes):
+                results[index] = ({"index": index, "success": True, "itemId": item_data["itemId"]} if success
+                                  else {"index": index, "success": False, "message": message})
+        return results
+
+    def apply_item_mutations(self, group_id, mutations):
+        """
+        🔥 Applies ("create", item_data) / ("delete", stored_item) mutations of one group with ONE
+        group transaction (one ledger update for the summed deltas) and ONE multi-path write.
+        Creates get a fresh push id. Returns one (success, message) per mutation.
+        Raises when the group transaction fails: nothing was committed then, so the caller may
+        retry the mutations (one by one, to isolate a bad one). Backend errors after the commit
+        (is_backend_error) are raised too; the ledger already holds the deltas then, which
+        reconcile_group corrects.
+        """
+        results = [None] * len(mutations)
+        applied = []
+        deleting = set()
+        for index, (op, item_data) in enumerate(mutations):
+            if op == "create":
+                item_data["itemId"] = generate_push_id()
+            elif item_data["itemId"] in deleting:
+                results[index] = (False, "Not found")
+                continue
+            else:
+                deleting.add(item_data["itemId"])
+            applied.append((index, op, item_data))
+
+        first_rev, ledger, legacy = [None], [None], [[]]
+
+        def mutation_transaction(current_group):
+            ledger[0] = None
+            # Unknown group: {} writes nothing (a transaction cannot return None)
+            if current_group is None: return {}
+            if current_group.get("deleted"): return current_group
+            legacy[0] = _as_list(current_group.get("groupItems"))
+            # Parsed ledger of our last write to the group when it is still current
+            ledger[0] = _ledgers.take(group_id, current_group)
+            # One revision per mutation
+            first_rev[0] = current_group.get("rev", 0) + 1
+            current_group["rev"] = first_rev[0] + len(applied) - 1
+            name_map = current_group.get("memberNames", {})
+            deltas = {}
+            for _, op, item_data in applied:
+                if op == "create":
+                    # 1. Standard Denormalization
+                    item_data["itemPayerNames"] = [name_map.get(uid, "Unknown") for uid in item_data.get("itemPayer", [])]
+                    item_data["itemSpliterNames"] = [name_map.get(uid, "Unknown") for uid in item_data.get("itemSpliter", [])]
+                    item_deltas(item_data, deltas=deltas)
+                else:
+                    # 🔥 REVERSE THE LEDGER (sign=-1)
+                    item_deltas(item_data, sign=-1, deltas=deltas)
+            # 2. 🔥 INCREMENTAL LEDGER: integer paise, only the affected graph edges are re-settled
+            apply_balance_deltas(current_group, deltas, ledger[0])
             return current_group
 
+        if not applied: return results
+        new_group = _visible(self._ref(f"groups/{group_id}").transaction(mutation_transaction))
+        if not new_group:
+            # Unknown or being deleted: writing the items would only orphan them
+            for index, _, _ in applied: results[index] = (False, "Group not found")
+            return results
+        # Committed: the ledger already holds these mutations
         try:
-            group_ref.transaction(delete_transaction)
-            db.reference(f"items/{item_id}").delete()
-            return True, "Deleted"
+            _ledgers.keep(group_id, new_group, ledger[0])
+            updates = self._settlement_updates(group_id, new_group, ledger[0].touched)
+            if legacy[0]:
+                # First indexed write to a group still listing groupItems: move them into the index
+                # in this same write, so the index alone lists every item from now on
+                updates.update({f"groupItemIndex/{group_id}/{item_id}": True for item_id in legacy[0]})
+                updates[f"groups/{group_id}/groupItems"] = None
+            for _, op, item_data in applied:
+                item_id = item_data["itemId"]
+                updates[f"items/{item_id}"] = item_data if op == "create" else None
+                updates[f"groupItemIndex/{group_id}/{item_id}"] = True if op == "create" else None
+            updates.update(self._change_updates(group_id, first_rev[0], [
+                {"op": "itemCreated" if op == "create" else "itemDeleted", "itemId": item_data["itemId"]}
+                for _, op, item_data in applied]))
+            self._ref("/").update(updates)
+            self._settle_views(group_id, new_group["rev"], ledger[0].touched)
+            for index, op, _ in applied:
+                results[index] = (True, "item created" if op == "create" else "Deleted")
         except Exception as e:
-            return False, str(e)
-        
-        
+            if is_backend_error(e): raise
+            for index, _, _ in applied:
+                results[index] = (False, str(e))
+        return results
+
+    def delete_item_atomically(self, item_id):
+        item_data = self._ref(f"items/{item_id}").get()
+        if not item_data: return False, "Not found"
+        return self._apply_one(item_data["itemGroupId"], ("delete", item_data))
+
     def create_item(self, data):
         # 🔥 DENORMALIZATION
         payer_id = data["itemPayer"][0]
         user = self.get_user(payer_id)
         data["payerName"] = user.get("name", "Unknown") if user else "Unknown"
         
-        ref = db.reference("items").push()
+        ref = self._ref("items").push()
         data["itemId"] = ref.key
         ref.set(data)
         return data
 
     def get_item(self, item_id):
-        return db.reference(f"items/{item_id}").get()
+        return self._ref(f"items/{item_id}").get()
+
+    def get_item_with_etag(self, item_id, etag=None):
+        return self._get_with_etag(f"items/{item_id}", etag)
+
+    def get_items(self, item_ids):
+        return self._get_many("items", item_ids)
 
     def get_all_items(self):
-        return db.reference("items").get() or {}
-
-    def get_paginated_items(self, item_ids, limit, offset):
-        # 🔥 PAGINATION (Newest first)
-        reversed_ids = item_ids[::-1]
-        paginated_ids = reversed_ids[offset : offset + limit]
-        items = []
-        for iid in paginated_ids:
-            item_data = self.get_item(iid)
-            if item_data: items.append(item_data)
-        return items
+        return self._ref("items").get() or {}
+
+    # --- ITEM INDEX (groupItemIndex/{gid}/{itemId}: true, ordered by push key = creation time) ---
+
+    def get_group_item_index_with_etag(self, group_id, etag=None):
+        """(changed, {itemId: True} or None, etag) of groupItemIndex/{gid}; changes on every item create/delete."""
+        return self._get_with_etag(f"groupItemIndex/{group_id}", etag)
+
+    def get_group_item_ids(self, group_id):
+        """All item ids of a group, oldest first."""
+        legacy = self._legacy_future(group_id)
+        index = self._ref(f"groupItemIndex/{group_id}").get(shallow=True) or {}
+        return _union(index, legacy.result())
+
+    def get_paginated_items(self, group_id, limit, offset):
+        # 🔥 PAGINATION (Newest first): only the last offset+limit index keys are read
+        legacy = self._legacy_future(group_id)
+        index = self._ref(f"groupItemIndex/{group_id}").order_by_key().limit_to_last(offset + limit).get() or {}
+        ids = _union(index, legacy.result())
+        return self.get_items(ids[::-1][offset : offset + limit])
+
+    def get_items_page(self, group_id, limit, cursor=None):
+        """
+        Cursor pagination, newest first. `cursor` is the nextCursor of the previous page
+        (the oldest item id it returned). Returns (items, nextCursor or None).
+        """
+        legacy = self._legacy_future(group_id)
+        query = self._ref(f"groupItemIndex/{group_id}").order_by_key()
+        if cursor: query = query.end_at(cursor)
+        index = query.limit_to_last(limit + 1 if cursor else limit).get() or {}
+        ids = [i for i in _union(index, legacy.result()) if not cursor or i < cursor]
+        ids = ids[-limit:][::-1]
+        next_cursor = ids[-1] if len(ids) == limit else None
+        return self.get_items(ids), next_cursor
+
+    def _legacy_item_ids(self, group_id):
+        """
+        Sorted ids still listed in groups/{gid}/groupItems: the whole list for a group never
+        written since the index was introduced (the first item write migrates it). Empty afterwards.
+        """
+        return sorted(set(_as_list(self._ref(f"groups/{group_id}/groupItems").get())))
+
+    def _legacy_future(self, group_id):
+        """_legacy_item_ids read concurrently with the caller's index query."""
+        return _fetch_pool.submit(metrics.propagate(self._legacy_item_ids), group_id)
+
+    def migrate_group_item_index(self, group_id):
+        """Moves groups/{gid}/groupItems into groupItemIndex/{gid} in one multi-path write."""
+        legacy = self._legacy_item_ids(group_id)
+        if not legacy: return 0
+        updates = {f"groupItemIndex/{group_id}/{item_id}": True for item_id in legacy}
+        updates[f"groups/{group_id}/groupItems"] = None
+        self._ref("/").update(updates)
+        return len(legacy)
+
+    # --- RECONCILIATION ---
+
+    def _ledger_diff(self, group_id, page_size=None):
+        """
+        (group, etag, items seen, {uid: (stored, expected)} minor units, graph consistent,
+        unindexed ids) for the group's current items. Item writes skip this graph check;
+        reconciliation is where it runs. Unindexed ids are listed in groups/{gid}/groupItems but
+        missing from groupItemIndex (a group no item write has migrated yet).
+        """
+        group, etag = self._ref(f"groups/{group_id}").get(etag=True)
+        if not _visible(group): return None, etag, 0, {}, True, set()
+        unindexed = set(_as_list(group.get("groupItems")))
+        if unindexed:
+            unindexed.difference_update(item_id for item_id, _ in self._scan(f"groupItemIndex/{group_id}", page_size or SCAN_PAGE_SIZE))
+        expected, count = {}, 0
+        for item_data in self.scan_group_items(group_id, page_size):
+            item_deltas(item_data, deltas=expected)
+            count += 1
+        stored = {uid: to_minor(v) for uid, v in (group.get("groupBalance") or {}).items()}
+        diff = {uid: (stored.get(uid, 0), expected.get(uid, 0)) for uid in set(stored) | set(expected)
+                if stored.get(uid, 0) != expected.get(uid, 0)}
+        return group, etag, count, diff, SettlementLedger.from_group(group).is_consistent(), unindexed
+
+    def reconcile_group(self, group_id, repair=False, page_size=None):
+        """
+        Recomputes groupBalance from the group's items and diffs it against the stored ledger,
+        and checks that groupGraph adds up to groupBalance.
+        With repair=True a mismatch is checked a second time (an item write may sit between its
+        group transaction and its item write), then the recomputed balances and a fresh graph
+        are written only if the group is unchanged since that check (set_if_unchanged).
+        Returns {"groupId", "items", "consistent", "graphConsistent", "diff": {uid: {"stored", "expected"}},
+        "repaired"}, plus "unindexed" (count) for a group whose groupItems are not all in the index.
+        Such a group is never repaired ("refused"): migrate it first (migrate_group_items.py).
+        """
+        group, etag, count, diff, graph_ok, unindexed = self._ledger_diff(group_id, page_size)
+        report = {"groupId": group_id, "items": count, "consistent": not diff and graph_ok, "graphConsistent": graph_ok,
+                  "repaired": False,
+                  "diff": {uid: {"stored": from_minor(a), "expected": from_minor(b)} for uid, (a, b) in diff.items()}}
+        if group is None: report["missing"] = True
+        if unindexed: report["unindexed"] = len(unindexed)
+        if report["consistent"] or not repair or group is None: return report
+        if unindexed: return dict(report, refused="groupItems not migrated to groupItemIndex")
+
+        group, etag, count, diff, graph_ok, unindexed = self._ledger_diff(group_id, page_size)
+        if unindexed: return dict(report, unindexed=len(unindexed), refused="groupItems not migrated to groupItemIndex")
+        if not diff and graph_ok: return dict(report, consistent=True, graphConsistent=True, diff={})
+        balances = group.setdefault("groupBalance", {})
+        for uid, (_, expected) in diff.items(): balances[uid] = from_minor(expected)
+        settle_group(group)
+        group["rev"] = group.get("rev", 0) + 1
+        written, _, _ = self._ref(f"groups/{group_id}").set_if_unchanged(etag, group)
+        if written:
+            updates = self._settlement_updates(group_id, group)
+            updates.update(self._change_updates(group_id, group["rev"], [{"op": "ledgerRepaired"}]))
+            self._ref("/").update(updates)
+            self._settle_views(group_id, group["rev"])
+        report["repaired"] = written
+        if not written: report["conflict"] = True
+        return report
+
+    # --- REVISIONS (groups/{gid}/rev) AND CHANGELOG (groupChanges/{gid}/{zero-padded rev}) ---
+
+    def _change_updates(self, group_id, first_rev, records):
+        """Multi-path entries logging records as revisions first_rev.. and dropping the ones past the bound."""
+        updates = {}
+        for rev, record in enumerate(records, first_rev):
+            updates[f"groupChanges/{group_id}/{rev:010d}"] = dict(record, rev=rev)
+            if rev > GROUP_CHANGELOG_MAX: updates[f"groupChanges/{group_id}/{rev - GROUP_CHANGELOG_MAX:010d}"] = None
+        return updates
+
+    def get_group_revisions(self, group_ids):
+        """{group_id: rev} read concurrently; 0 for groups older than revisions, missing groups left out."""
+        ids = list(dict.fromkeys(gid for gid in group_ids if gid))
+        revs = self._fetch_many("groups", [f"{gid}/rev" for gid in ids])
+        unknown = [gid for gid in ids if revs.get(f"{gid}/rev") is None]
+        exists = _fetch_pool.map(metrics.propagate(lambda gid: bool(self._ref(f"groups/{gid}").get(shallow=True))), unknown)
+        found = {gid: revs[f"{gid}/rev"] for gid in ids if revs.get(f"{gid}/rev") is not None}
+        found.update({gid: 0 for gid, present in zip(unknown, exists) if present})
+        return found
+
+    def get_group_changes(self, group_id, since_rev, limit=None):
+        """Change records after since_rev, oldest first (at most limit, default the whole log)."""
+        query = self._ref(f"groupChanges/{group_id}").order_by_key().start_at(f"{since_rev + 1:010d}")
+        page = query.limit_to_first(limit or GROUP_CHANGELOG_MAX).get() or {}
+        return [page[key] for key in sorted(page)]
+
+    # --- GROUP DELETION JOBS (deletionJobs/{gid}; deletionQueue/{gid} while unfinished) ---
+
+    def mark_group_deleted(self, group_id, now_ms):
+        """
+        Hides the group (deleted: true, one more revision) and queues its deletion job.
+        Returns the job (the existing one if the group was already marked) or None if unknown.
+        """
+        # Transactions cannot write None, so unknown groups are turned away before
+        if not self._ref(f"groups/{group_id}/groupId").get(): return None
+        marked = [False]
+
+        def mark_transaction(group):
+            marked[0] = False
+            if group is None or group.get("deleted"): return group
+            group["deleted"], group["deletedAt"] = True, now_ms
+            group["rev"] = group.get("rev", 0) + 1
+            marked[0] = True
+            return group
+        group = self._ref(f"groups/{group_id}").transaction(mark_transaction)
+        job = None if marked[0] else self.get_deletion_job(group_id)
+        if job is None:
+            # Also when a previous call died between the mark and this write
+            job = {"groupId": group_id, "groupName": group.get("groupName", ""), "state": "queued", "phase": "members",
+                   "members": _as_list(group.get("groupMembers")), "membersUnlinked": 0,
+                   "itemsDeleted": 0, "attempts": 0, "createdAt": now_ms, "updatedAt": now_ms}
+            updates = {f"deletionJobs/{group_id}": job, f"deletionQueue/{group_id}": now_ms}
+            if marked[0]: updates.update(self._change_updates(group_id, group["rev"], [{"op": "groupDeleted"}]))
+            self._ref("/").update(updates)
+        return job
+
+    def get_deletion_job(self, group_id):
+        return self._ref(f"deletionJobs/{group_id}").get()
+
+    def queued_deletion_jobs(self):
+        """Group ids whose deletion has not finished, oldest first."""
+        queued = self._ref("deletionQueue").get() or {}
+        return sorted(queued, key=queued.get)
+
+    def claim_deletion_job(self, group_id, owner, now_ms, lease_ms):
+        """Takes the unfinished job unless another owner holds a live lease; returns it or None."""
+        ref = self._ref(f"deletionJobs/{group_id}")
+        job = ref.get()
+        if not job or job.get("state") == "done": return None
+        claimed = [None]
+
+        def claim_transaction(job):
+            claimed[0] = None
+            if not job or job.get("state") == "done": return job
+            if job.get("owner") != owner and job.get("leaseUntil", 0) > now_ms: return job
+            job.update(state="running", owner=owner, leaseUntil=now_ms + lease_ms, attempts=job.get("attempts", 0) + 1)
+            claimed[0] = job
+            return job
+        ref.transaction(claim_transaction)
+        return claimed[0]
+
+    def run_deletion_step(self, group_id, job, chunk_size, now_ms, lease_ms):
+        """
+        Performs one chunk of the job and records its progress (and a renewed lease) in the same
+        multi-path write, so a restarted job continues where the last write left off.
+        Phases: members (group links and settlement views), items (index pages, then legacy
+        groupItems), group (the group, its index and changelog). Returns the updated job.
+        """
+        base = f"deletionJobs/{group_id}"
+        progress = {"updatedAt": now_ms, "leaseUntil": now_ms + lease_ms}
+        updates = {}
+        if job["phase"] == "members":
+            members = job.get("members") or []
+            chunk = members[job["membersUnlinked"]:job["membersUnlinked"] + chunk_size]
+            for uid in chunk:
+                # Transactions: older users hold a list of ids, which may be appended to concurrently
+                self._ref(f"users/{uid}/groupIds").transaction(
+                    lambda ids: {k: v for k, v in ids.items() if group_id not in (k, v)} if isinstance(ids, dict)
+                    else [gid for gid in _as_list(ids) if gid != group_id])
+                updates[f"userSettlements/{uid}/{group_id}"] = None
+            progress["membersUnlinked"] = job["membersUnlinked"] + len(chunk)
+            if progress["membersUnlinked"] >= len(members): progress["phase"] = "items"
+        elif job["phase"] == "items":
+            # Deleted entries leave the index, so the first page is always the next chunk
+            ids = list(self._ref(f"groupItemIndex/{group_id}").order_by_key().limit_to_first(chunk_size).get() or {})
+            if not ids:
+                legacy = self._legacy_item_ids(group_id)
+                ids = legacy[job.get("legacyDeleted", 0):job.get("legacyDeleted", 0) + chunk_size]
+                progress["legacyDeleted"] = job.get("legacyDeleted", 0) + len(ids)
+            for item_id in ids:
+                updates[f"items/{item_id}"] = None
+                updates[f"groupItemIndex/{group_id}/{item_id}"] = None
+            progress["itemsDeleted"] = job["itemsDeleted"] + len(ids)
+            if not ids: progress["phase"] = "group"
+        else:
+            updates.update({f"groups/{group_id}": None, f"groupItemIndex/{group_id}": None,
+                            f"groupChanges/{group_id}": None, f"deletionQueue/{group_id}": None})
+            progress.update(phase="done", state="done", finishedAt=now_ms, leaseUntil=0)
+        updates.update({f"{base}/{key}": value for key, value in progress.items()})
+        self._ref("/").update(updates)
+        return dict(job, **progress)
+
+    def fail_deletion_step(self, group_id, error, now_ms):
+        """Records the error; the job stays queued and is resumed once its lease runs out."""
+        self._ref(f"deletionJobs/{group_id}").update({"error": error, "updatedAt": now_ms})
+
+    # --- IDEMPOTENCY KEYS (idempotencyKeys/{key}: pending claim or stored response) ---
+
+    def get_idempotency_record(self, key):
+        return self._ref(f"idempotencyKeys/{key}").get()
+
+    def claim_idempotency_key(self, key, fingerprint, now_ms, lease_ms, ttl_ms):
+        """
+        Claims key for one request across all workers. Returns (True, pending record) to the
+        caller that should run the request, or (False, record) when an unexpired record exists:
+        a stored response ("done") or another request's live claim ("pending").
+        An expired record or a pending claim whose lease ran out is taken over.
+        """
+        ref = self._ref(f"idempotencyKeys/{key}")
+
+        def live(record):
+            return record and record.get("expiresAt", 0) > now_ms and (
+                record.get("state") == "done" or record.get("leaseUntil", 0) > now_ms)
+        current = ref.get()
+        if live(current): return False, current
+        claim = {"state": "pending", "fingerprint": fingerprint, "leaseUntil": now_ms + lease_ms,
+                 "expiresAt": now_ms + ttl_ms}
+        found = [None]
+
+        def claim_transaction(record):
+            found[0] = record if live(record) else None
+            return record if found[0] else claim
+        ref.transaction(claim_transaction)
+        return (False, found[0]) if found[0] else (True, claim)
+
+    def complete_idempotency_key(self, key, record):
+        self._ref(f"idempotencyKeys/{key}").set(dict(record, state="done"))
+
+    def release_idempotency_key(self, key):
+        self._ref(f"idempotencyKeys/{key}").delete()
+
+    def purge_idempotency_keys(self, now_ms, limit=500):
+        """Deletes up to `limit` expired records (wants ".indexOn": "expiresAt" in the rules). Returns the count."""
+        expired = self._ref("idempotencyKeys").order_by_child("expiresAt").end_at(now_ms).limit_to_first(limit).get() or {}
+        if expired: self._ref("idempotencyKeys").update({key: None for key in expired})
+        return len(expired)
 
     def delete_item(self, item_id):
-        db.reference(f"items/{item_id}").delete()
+        self._ref(f"items/{item_id}").delete()
         
     # Inside FirebaseRepository class
 
@@ -0,0 +1,98 @@
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class GroupDeleter:
+    """
+    Cascade deletion of groups in the background. start() marks the group deleted (hidden from
+    every read at once) and queues a job; a worker thread then runs it chunk by chunk with
+    run_deletion_step(): member links and settlement views, then items, then the group itself.
+
+    Jobs live in the database with a lease, so any worker can resume one whose owner died:
+    resume() (run every `resume_every` seconds once started) picks up queued jobs with an
+    expired lease. Every step only deletes, so a chunk repeated after a crash is harmless.
+    """
+    def __init__(self, repo, chunk_size=200, lease=60.0, workers=2, resume_every=60.0):
+        self.repo = repo
+        self.chunk_size = chunk_size
+        self.lease = lease
+        self.resume_every = resume_every
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="group-delete")
+        self._lock = threading.Lock()
+        self._running = set()
+        self._stopped = threading.Event()
+        self._resumer = None
+        self.finished = 0
+        self.failures = 0
+        self.chunks = 0
+
+    def start(self, group_id):
+        """Marks the group deleted and schedules its job; returns the job, or None for an unknown group."""
+        job = self.repo.mark_group_deleted(group_id, _now_ms())
+        if job is not None and job.get("state") != "done": self._submit(group_id)
+        return job
+
+    def status(self, group_id):
+        return self.repo.get_deletion_job(group_id)
+
+    def _submit(self, group_id):
+        with self._lock:
+            if group_id in self._running or self._stopped.is_set(): return
+            self._running.add(group_id)
+        self._pool.submit(self._run, group_id)
+
+    def _run(self, group_id):
+        try:
+            job = self.repo.claim_deletion_job(group_id, self.owner, _now_ms(), int(self.lease * 1000))
+            while job is not None and job.get("state") != "done" and not self._stopped.is_set():
+                job = self.repo.run_deletion_step(group_id, job, self.chunk_size, _now_ms(), int(self.lease * 1000))
+                with self._lock: self.chunks += 1
+            if job is not None and job.get("state") == "done":
+                with self._lock: self.finished += 1
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock: self.failures += 1
+            try:
+                self.repo.fail_deletion_step(group_id, f"{type(e).__name__}: {e}", _now_ms())
+            except Exception:
+                pass
+        finally:
+            with self._lock: self._running.discard(group_id)
+
+    def resume(self):
+        """Schedules every unfinished job; claim_deletion_job skips those leased by a live owner."""
+        for group_id in self.repo.queued_deletion_jobs(): self._submit(group_id)
+
+    def start_background(self, delay=0.0):
+        """Resumes queued jobs after `delay` seconds and then every `resume_every` seconds (one daemon thread)."""
+        if self._resumer is not None: return
+
+        def loop():
+            self._stopped.wait(delay)
+            while not self._stopped.is_set():
+                try:
+                    self.resume()
+                except Exception:
+                    traceback.print_exc()
+                self._stopped.wait(self.resume_every)
+        self._resumer = threading.Thread(target=loop, name="group-delete-resume", daemon=True)
+        self._resumer.start()
+
+    def close(self):
+        """Stops after the current chunk; unfinished jobs are resumed later from their last step."""
+        self._stopped.set()
+        self._pool.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {"running": len(self._running), "finished": self.finished, "failures": self.failures,
+                    "chunks": self.chunks}
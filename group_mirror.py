@@ -0,0 +1,243 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from database_interface import DelegatingRepository
+from local_db import apply_event, materialize
+
+
+def _served(value):
+    """(group as get_group returns it, ETag) of a stored (normalized) group value."""
+    group, etag = materialize(value)
+    if isinstance(group, dict) and group.get("deleted"): return materialize(None)
+    return group, etag
+
+
+def _rev(value):
+    return value.get("rev", 0) if isinstance(value, dict) else -1
+
+
+class _Subscription:
+    def __init__(self):
+        self.registration = None
+        self.value = None       # stored (normalized) form, updated by apply_event
+        self.json = None        # materialized copy served to readers
+        self.etag = None
+        self.seq = 0            # events applied so far
+        self.ready = False      # initial snapshot received
+        self.failed = False
+        self.last_event = 0.0
+
+    def alive(self):
+        # firebase_admin runs the stream on registration._thread and lets it die on a fatal error
+        thread = getattr(self.registration, "_thread", None)
+        return not self.failed and (thread is None or thread.is_alive())
+
+
+class GroupMirror(DelegatingRepository):
+    """
+    Push-based mirror of hot groups. A group read at least `promote_after` times within `window`
+    seconds is subscribed with listen_group(); streamed put/patch events keep an in-memory copy
+    current and get_group is served from it with no network call.
+
+    Groups read fewer than `demote_below` times in a window are unsubscribed, and at most
+    `max_groups` are mirrored (least recently read goes first). While a subscription is
+    connecting, has failed, or has been silent for `verify_after` seconds, reads go to the
+    database (the silent case re-checks the copy with one direct read). Our own writes to a
+    mirrored group refresh its copy at once so callers read their writes.
+
+    ETags are a hash of the group's content (local_db.materialize) on both paths: streamed
+    events carry no RTDB ETag, so database reads are hashed the same way rather than passing
+    the RTDB one through. A database read for a known ETag is therefore a full read.
+    """
+    def __init__(self, inner, max_groups=64, promote_after=20, demote_below=5, window=60.0,
+                 verify_after=30.0, clock=time.monotonic):
+        super().__init__(inner)
+        self.max_groups = max_groups
+        self.promote_after = promote_after
+        self.demote_below = demote_below
+        self.window = window
+        self.verify_after = verify_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._mirrors = OrderedDict()  # group_id -> _Subscription, least recently read first
+        self._reads = {}  # group_id -> reads in the current window
+        self._window_start = clock()
+        self.hits = 0
+        self.fallbacks = 0
+        self.events = 0
+        self.verifications = 0
+        self.promotions = 0
+        self.demotions = 0
+
+    # --- Reads ---
+
+    def get_group(self, group_id):
+        return self.get_group_with_etag(group_id)[1]
+
+    def get_group_with_etag(self, group_id, etag=None):
+        sub = self._touch(group_id)
+        if sub is not None and sub.ready and sub.alive():
+            if self._clock() - sub.last_event >= self.verify_after:
+                # Quiet for a while: a silent reconnect may have dropped events, re-check once
+                self._refresh(group_id, sub)
+                with self._lock: self.verifications += 1
+            with self._lock:
+                self.hits += 1
+                if etag is not None and etag == sub.etag: return False, None, None
+                return True, copy.deepcopy(sub.json), sub.etag
+        with self._lock: self.fallbacks += 1
+        group, current = _served(apply_event(None, "put", "/", self.inner.get_group(group_id)))
+        if etag is not None and etag == current: return False, None, None
+        return True, group, current
+
+    def _touch(self, group_id):
+        """Counts the read, applies promotion / demotion, returns the group's subscription if any."""
+        promote, demote = False, []
+        with self._lock:
+            now = self._clock()
+            if now - self._window_start >= self.window:
+                demote = [gid for gid in self._mirrors if self._reads.get(gid, 0) < self.demote_below]
+                self._reads.clear()
+                self._window_start = now
+            reads = self._reads[group_id] = self._reads.get(group_id, 0) + 1
+            sub = self._mirrors.get(group_id)
+            if sub is not None and not sub.alive():
+                demote.append(group_id)
+                sub = None
+            elif sub is not None:
+                self._mirrors.move_to_end(group_id)
+            elif reads >= self.promote_after and self.max_groups > 0:
+                promote = True
+                demote += list(self._mirrors)[:max(0, len(self._mirrors) - self.max_groups + 1)]
+                sub = _Subscription()
+            closing = [self._mirrors.pop(gid) for gid in dict.fromkeys(demote) if gid in self._mirrors]
+            if promote: self._mirrors[group_id] = sub
+        for old in closing: self._close(old)
+        if promote: threading.Thread(target=self._subscribe, args=(group_id, sub), daemon=True).start()
+        return sub
+
+    # --- Subscriptions ---
+
+    def _subscribe(self, group_id, sub):
+        def on_event(event):
+            try:
+                if event.event_type not in ("put", "patch"): return
+                with self._lock:
+                    sub.value = apply_event(sub.value, event.event_type, event.path, event.data)
+                    sub.json, sub.etag = _served(sub.value)
+                    sub.seq += 1
+                    sub.ready = True
+                    sub.last_event = self._clock()
+                    self.events += 1
+            except Exception:
+                sub.failed = True
+        try:
+            registration = self.inner.listen_group(group_id, on_event)
+        except Exception:
+            sub.failed = True
+            return
+        sub.registration = registration
+        with self._lock:
+            self.promotions += 1
+            current = self._mirrors.get(group_id) is sub
+        if not current: registration.close()  # demoted while connecting
+
+    def _close(self, sub):
+        with self._lock: self.demotions += 1
+        if sub.registration is not None:
+            try:
+                sub.registration.close()
+            except Exception:
+                pass
+
+    def _refresh(self, group_id, sub):
+        with self._lock: seq = sub.seq
+        value = apply_event(None, "put", "/", self.inner.get_group(group_id))
+        with self._lock:
+            # Events streamed during the read may be newer than it: only a later rev replaces them
+            if sub.seq == seq or _rev(value) > _rev(sub.value):
+                sub.value = value
+                sub.json, sub.etag = _served(value)
+            sub.last_event = self._clock()
+
+    def _wrote(self, group_id):
+        with self._lock: sub = self._mirrors.get(group_id)
+        if sub is not None and sub.ready: self._refresh(group_id, sub)
+
+    def close(self):
+        with self._lock:
+            mirrors = list(self._mirrors.items())
+            self._mirrors.clear()
+        for _, sub in mirrors: self._close(sub)
+
+    def stats(self):
+        with self._lock:
+            return {"mirrored": len(self._mirrors), "ready": sum(1 for s in self._mirrors.values() if s.ready),
+                    "maxGroups": self.max_groups, "hits": self.hits, "fallbacks": self.fallbacks,
+                    "events": self.events, "verifications": self.verifications,
+                    "promotions": self.promotions, "demotions": self.demotions}
+
+    # --- Writes: refresh the mirrored copy so our own callers read their writes ---
+
+    def update_group(self, group_id, data):
+        try:
+            return self.inner.update_group(group_id, data)
+        finally:
+            self._wrote(group_id)
+
+    def delete_group(self, group_id):
+        try:
+            return self.inner.delete_group(group_id)
+        finally:
+            self._wrote(group_id)
+
+    def mark_group_deleted(self, group_id, now_ms):
+        try:
+            return self.inner.mark_group_deleted(group_id, now_ms)
+        finally:
+            self._wrote(group_id)
+
+    def add_group_member(self, group_id, member_id):
+        try:
+            return self.inner.add_group_member(group_id, member_id)
+        finally:
+            self._wrote(group_id)
+
+    def set_settlement_mode(self, group_id, mode):
+        try:
+            return self.inner.set_settlement_mode(group_id, mode)
+        finally:
+            self._wrote(group_id)
+
+    def create_item_atomically(self, item_data):
+        try:
+            return self.inner.create_item_atomically(item_data)
+        finally:
+            self._wrote(item_data.get("itemGroupId"))
+
+    def create_items_atomically(self, group_id, items):
+        try:
+            return self.inner.create_items_atomically(group_id, items)
+        finally:
+            self._wrote(group_id)
+
+    def delete_item_atomically(self, item_id):
+        with self._lock: mirrored = bool(self._mirrors)
+        item = self.inner.get_item(item_id) if mirrored else None
+        try:
+            return self.inner.delete_item_atomically(item_id)
+        finally:
+            if item: self._wrote(item.get("itemGroupId"))
+
+    def reconcile_group(self, group_id, repair=False, page_size=None):
+        try:
+            return self.inner.reconcile_group(group_id, repair, page_size)
+        finally:
+            if repair: self._wrote(group_id)
+
+    def apply_item_mutations(self, group_id, mutations):
+        try:
+            return self.inner.apply_item_mutations(group_id, mutations)
+        finally:
+            self._wrote(group_id)
@@ -0,0 +1,45 @@
+# Production serving: pre-fork workers x threads, Firebase initialized per worker after fork.
+#   gunicorn -c gunicorn.conf.py
+import os
+import config as app_config  # not "config": that name is a gunicorn setting
+
+wsgi_app = "app:create_app()"
+bind = f"0.0.0.0:{os.environ.get('PORT', 7000)}"
+
+# Workers use every core; threads overlap the blocking Firebase I/O inside each worker
+workers = app_config.WEB_WORKERS
+worker_class = "gthread"
+threads = app_config.WEB_THREADS
+# MAX_CONCURRENT_REQUESTS (< threads) of them run requests; the rest queue for a slot and shed with 503
+if app_config.MAX_CONCURRENT_REQUESTS >= threads:
+    print(f"MAX_CONCURRENT_REQUESTS={app_config.MAX_CONCURRENT_REQUESTS} >= threads={threads}: load shedding is off",
+          flush=True)
+
+# Import the app (routes, split_logic) once in the master; workers fork from it
+preload_app = True
+
+timeout = app_config.REQUEST_TIMEOUT
+graceful_timeout = app_config.GRACEFUL_TIMEOUT
+if app_config.IDEMPOTENCY_LEASE <= timeout:
+    print(f"IDEMPOTENCY_LEASE={app_config.IDEMPOTENCY_LEASE} <= REQUEST_TIMEOUT={timeout}: a retry may run a slow"
+          f" request twice", flush=True)
+keepalive = 5
+# Recycle workers now and then so slow leaks never accumulate
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # Firebase / requests sessions must be created in the worker, never inherited across fork.
+    # The socket is already bound, so warm up in the background instead of delaying GET /.
+    # The group deletion resume loop starts here with or without WARM_BACKEND.
+    import app
+    app.start_background()
+
+
+def worker_exit(server, worker):
+    import app
+    app.shutdown_backend()
@@ -0,0 +1,146 @@
+'''
+Idempotency-Key support for the item mutation endpoints.
+
+A request carrying an Idempotency-Key runs at most once per (route, key) for `ttl` seconds;
+repeats get the stored response back and never reach the ledger.
+
+    in this process   completed responses sit in a bounded TTL/LRU cache, and a duplicate of
+                      a request that is still running waits on it instead of racing it
+    across workers    idempotencyKeys/{sha256(route, key)} holds a pending claim (taken with a
+                      transaction) and then the stored response, so a retry that lands on
+                      another worker waits for or replays the first one
+
+A response with a 5xx status is not stored: the claim is released and the client may retry.
+Database errors reach the routes as exceptions (firebase_repository.is_backend_error) and are
+answered with 503, so only 2xx and deterministic 4xx outcomes are ever stored.
+If a worker dies mid-request its claim expires after `lease` seconds and the key can be
+claimed again. The lease must be longer than any request may run (the worker timeout, see
+config.IDEMPOTENCY_LEASE), or a retry claims the key while the first request still runs.
+'''
+import hashlib
+import threading
+import time
+import traceback
+from ttl_cache import TTLCache, MISSING
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different body."""
+
+
+class IdempotencyBusy(Exception):
+    """The first request with this key is still running after `wait` seconds."""
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class IdempotencyStore:
+    def __init__(self, repo, maxsize=10000, ttl=86400, lease=60, wait=10, purge_every=500):
+        self.repo = repo
+        self.ttl = ttl
+        self.lease = lease
+        self.wait = wait
+        self.purge_every = purge_every
+        self._done = TTLCache(maxsize, ttl)  # storage key -> stored record
+        self._inflight = {}  # storage key -> threading.Event, set when the running request ends
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.replayed = 0
+        self.waited = 0
+
+    @staticmethod
+    def storage_key(scope, key):
+        return hashlib.sha256(f"{scope}\0{key}".encode()).hexdigest()
+
+    def run(self, scope, key, fingerprint, handler):
+        """
+        Runs handler() -> (status, body, mimetype) once per (scope, key).
+        Returns (record, replayed); record has "status", "body" and "mimetype".
+        Raises IdempotencyConflict if the fingerprint differs from the first request's
+        and IdempotencyBusy if that request is still running after `wait` seconds.
+        """
+        skey = self.storage_key(scope, key)
+        deadline = time.monotonic() + self.wait
+        while True:
+            event = None
+            with self._lock:
+                record = self._done.get(skey)
+                if record is MISSING:
+                    event = self._inflight.get(skey)
+                    if event is None: self._inflight[skey] = threading.Event()
+                    else: self.waited += 1
+            if record is not MISSING: return self._replay(record, fingerprint)
+            if event is None: break
+            # Same key already running in this process: wait, then replay it (or run, if it was released)
+            if not event.wait(max(0, deadline - time.monotonic())): raise IdempotencyBusy()
+        try:
+            return self._lead(skey, fingerprint, handler, deadline)
+        finally:
+            with self._lock: self._inflight.pop(skey).set()
+
+    def _lead(self, skey, fingerprint, handler, deadline):
+        pause = 0.05
+        while True:
+            claimed, record = self.repo.claim_idempotency_key(
+                skey, fingerprint, _now_ms(), int(self.lease * 1000), int(self.ttl * 1000))
+            if claimed: break
+            if record.get("state") == "done":
+                self._remember(skey, record)
+                return self._replay(record, fingerprint)
+            # Running on another worker
+            if record.get("fingerprint") != fingerprint: raise IdempotencyConflict()
+            if time.monotonic() + pause > deadline: raise IdempotencyBusy()
+            time.sleep(pause)
+            pause = min(pause * 2, 0.5)
+
+        try:
+            status, body, mimetype = handler()
+        except BaseException:
+            self._release(skey)
+            raise
+        record = {"fingerprint": fingerprint, "status": status, "body": body, "mimetype": mimetype,
+                  "expiresAt": record["expiresAt"]}
+        if status >= 500:
+            self._release(skey)
+            return record, False
+        try:
+            self.repo.complete_idempotency_key(skey, record)
+        except Exception:
+            # The response is still served and remembered here; elsewhere the claim expires after the lease
+            traceback.print_exc()
+        self._remember(skey, record)
+        with self._lock:
+            self.executed += 1
+            purge = self.purge_every and self.executed % self.purge_every == 0
+        if purge: threading.Thread(target=self._purge, daemon=True).start()
+        return record, False
+
+    def _replay(self, record, fingerprint):
+        if record.get("fingerprint") != fingerprint: raise IdempotencyConflict()
+        with self._lock: self.replayed += 1
+        return record, True
+
+    def _remember(self, skey, record):
+        ttl = (record.get("expiresAt", 0) - _now_ms()) / 1000
+        if ttl > 0: self._done.set(skey, record, ttl)
+
+    def _release(self, skey):
+        try:
+            self.repo.release_idempotency_key(skey)
+        except Exception:
+            traceback.print_exc()
+
+    def _purge(self):
+        try:
+            self.repo.purge_idempotency_keys(_now_ms())
+        except Exception:
+            traceback.print_exc()
+
+    def stats(self):
+        with self._lock:
+            return {"cached": len(self._done), "inflight": len(self._inflight), "executed": self.executed,
+                    "replayed": self.replayed, "waited": self.waited}
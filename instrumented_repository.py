@@ -0,0 +1,14 @@
+from database_interface import DatabaseInterface, DelegatingRepository
+from metrics import timed_method
+
+
+class InstrumentedRepository(DelegatingRepository):
+    """
+    Times every DatabaseInterface call made on the wrapped backend: call counts and latency
+    per method (payplit_repository_call_duration_seconds), and an entry in the request trace.
+    Wraps the backend directly, so the numbers are what Firebase (or the local store) costs.
+    """
+    def __init__(self, inner):
+        super().__init__(inner)
+        for name in DatabaseInterface.__abstractmethods__:
+            setattr(self, name, timed_method(name, getattr(inner, name)))
@@ -0,0 +1,474 @@
+'''
+Embedded stand-in for the Realtime Database.
+
+LocalDatabase.reference(path) returns objects with the same surface as
+firebase_admin.db.Reference (get/set/update/push/delete/transaction/queries, ETags),
+so the repository code runs unchanged against it. listen() is a local fake of the
+Realtime Database event stream: an initial "put" of the node, then one "put" or
+"patch" per write that touches it, delivered on the registration's own thread.
+
+Storage is split per top-level child, e.g. ("users", uid) or ("groups", gid):
+
+    MemoryStore  -> dicts plus a sorted key list per root (pure in-process)
+    SQLiteStore  -> one row per (root, key) in a SQLite file, primary key = (root, key)
+
+Like RTDB, arrays are stored as index-keyed maps, nulls delete and empty maps vanish.
+'''
+import bisect
+import hashlib
+import json
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from push_ids import generate_push_id
+
+_TRANSACTION_MAX_RETRIES = 25
+_CHILD_PATH = re.compile(r"^[A-Za-z0-9_]+(/[A-Za-z0-9_]+)*$")
+
+
+class TransactionAbortedError(Exception):
+    pass
+
+
+def _split(path):
+    return [s for s in (path or "").split("/") if s]
+
+
+def _is_index(key):
+    return key.isdigit() and (key == "0" or key[0] != "0")
+
+
+def _normalize(value):
+    """JSON value -> stored form: lists become index-keyed maps, nulls and empty maps vanish."""
+    if isinstance(value, (list, tuple)):
+        value = {str(i): v for i, v in enumerate(value)}
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            v = _normalize(v)
+            if v is not None: out[str(k)] = v
+        return out or None
+    return value
+
+
+def _denormalize(value):
+    """Stored form -> JSON value. Maps keyed mostly by array indexes come back as lists, as in RTDB."""
+    if not isinstance(value, dict): return value
+    out = {k: _denormalize(v) for k, v in value.items()}
+    if out and all(_is_index(k) for k in out):
+        max_index = max(int(k) for k in out)
+        if 2 * len(out) > max_index + 1:
+            return [out.get(str(i)) for i in range(max_index + 1)]
+    return out
+
+
+def _etag(value):
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _get_in(node, path):
+    for key in path:
+        if not isinstance(node, dict): return None
+        node = node.get(key)
+    return node
+
+
+def _set_in(node, path, value):
+    """Copy-on-write set: returns a new node, never mutates the stored one."""
+    if not path: return value
+    node = dict(node) if isinstance(node, dict) else {}
+    child = _set_in(node.get(path[0]), path[1:], value)
+    if child is None: node.pop(path[0], None)
+    else: node[path[0]] = child
+    return node or None
+
+
+def apply_event(value, event_type, path, data):
+    """Applies a listen() "put" / "patch" event to a stored (normalized) value; returns the new value."""
+    segments = _split(path)
+    if event_type == "patch":
+        for child, child_value in (data or {}).items():
+            value = _set_in(value, segments + _split(child), _normalize(child_value))
+        return value
+    return _set_in(value, segments, _normalize(data))
+
+
+def materialize(value):
+    """Stored value -> (JSON value, ETag), as Reference.get(etag=True) returns them."""
+    return _denormalize(value), _etag(value)
+
+
+def _order_key(value):
+    """RTDB child ordering: null < false < true < numbers < strings < objects."""
+    if value is None: return (0, 0)
+    if isinstance(value, bool): return (1, value)
+    if isinstance(value, (int, float)): return (2, value)
+    if isinstance(value, str): return (3, value)
+    return (4, "")
+
+
+class MemoryStore:
+    def __init__(self):
+        self._docs = {}  # root -> {key: value}
+        self._keys = {}  # root -> sorted [key]
+
+    def get(self, root, key):
+        return self._docs.get(root, {}).get(key)
+
+    def put(self, root, key, value):
+        docs = self._docs.setdefault(root, {})
+        keys = self._keys.setdefault(root, [])
+        if value is None:
+            if docs.pop(key, None) is not None:
+                del keys[bisect.bisect_left(keys, key)]
+            return
+        if key not in docs: bisect.insort(keys, key)
+        docs[key] = value
+
+    def scan(self, root, start=None, end=None, limit=None, last=False):
+        keys = self._keys.get(root, [])
+        lo = bisect.bisect_left(keys, start) if start is not None else 0
+        hi = bisect.bisect_right(keys, end) if end is not None else len(keys)
+        if limit is not None:
+            lo, hi = (max(lo, hi - limit), hi) if last else (lo, min(hi, lo + limit))
+        docs = self._docs.get(root, {})
+        return [(k, docs[k]) for k in keys[lo:hi]]
+
+    def scan_child(self, root, child_path, value):
+        return [(k, v) for k, v in self.scan(root) if _get_in(v, child_path) == value]
+
+    def roots(self):
+        return [root for root, docs in self._docs.items() if docs]
+
+    def drop(self, root):
+        self._docs.pop(root, None)
+        self._keys.pop(root, None)
+
+    @contextmanager
+    def batch(self):
+        yield
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS nodes ("
+        " root TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+        " PRIMARY KEY (root, key)) WITHOUT ROWID",
+        # Every lookup the API makes is by key (groupItemIndex, usersAsEmailKey), so the
+        # primary key is the only index; drop the unused expression indexes of older files
+        "DROP INDEX IF EXISTS idx_items_group",
+        "DROP INDEX IF EXISTS idx_users_email",
+    )
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in self.SCHEMA: self._conn.execute(stmt)
+        self._depth = 0
+
+    def get(self, root, key):
+        row = self._conn.execute("SELECT value FROM nodes WHERE root = ? AND key = ?", (root, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, root, key, value):
+        if value is None:
+            self._conn.execute("DELETE FROM nodes WHERE root = ? AND key = ?", (root, key))
+        else:
+            self._conn.execute("INSERT OR REPLACE INTO nodes (root, key, value) VALUES (?, ?, ?)",
+                               (root, key, json.dumps(value, separators=(",", ":"))))
+
+    def scan(self, root, start=None, end=None, limit=None, last=False):
+        sql, args = "SELECT key, value FROM nodes WHERE root = ?", [root]
+        if start is not None: sql, args = sql + " AND key >= ?", args + [start]
+        if end is not None: sql, args = sql + " AND key <= ?", args + [end]
+        sql += " ORDER BY key DESC" if last else " ORDER BY key"
+        if limit is not None: sql, args = sql + " LIMIT ?", args + [limit]
+        rows = [(k, json.loads(v)) for k, v in self._conn.execute(sql, args)]
+        return rows[::-1] if last else rows
+
+    def scan_child(self, root, child_path, value):
+        # The JSON path is inlined, so it is validated first; filters in SQL, with no index
+        if not _CHILD_PATH.match("/".join(child_path)):
+            raise ValueError(f"Invalid child path: {child_path}")
+        expr = "json_extract(value, '$." + ".".join(child_path) + "')"
+        sql = f"SELECT key, value FROM nodes WHERE root = ? AND {expr} = ? ORDER BY key"
+        return [(k, json.loads(v)) for k, v in self._conn.execute(sql, (root, value))]
+
+    def roots(self):
+        return [r for (r,) in self._conn.execute("SELECT DISTINCT root FROM nodes")]
+
+    def drop(self, root):
+        self._conn.execute("DELETE FROM nodes WHERE root = ?", (root,))
+
+    @contextmanager
+    def batch(self):
+        """All writes inside one batch commit (or roll back) together. Re-entrant."""
+        if self._depth == 0: self._conn.execute("BEGIN IMMEDIATE")
+        self._depth += 1
+        try:
+            yield
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0: self._conn.execute("ROLLBACK")
+            raise
+        self._depth -= 1
+        if self._depth == 0: self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+
+
+class LocalDatabase:
+    """In memory when `path` is None, otherwise backed by the SQLite file at `path`."""
+    def __init__(self, path=None):
+        self._store = SQLiteStore(path) if path else MemoryStore()
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def reference(self, path="/"):
+        return LocalReference(self, _split(path))
+
+    def close(self):
+        with self._lock: self._store.close()
+
+    # --- Raw access on stored (normalized) values ---
+    def _read(self, segments):
+        with self._lock:
+            if not segments:
+                tree = {root: dict(self._store.scan(root)) for root in self._store.roots()}
+                return tree or None
+            if len(segments) == 1:
+                return dict(self._store.scan(segments[0])) or None
+            return _get_in(self._store.get(segments[0], segments[1]), segments[2:])
+
+    def _write(self, segments, value):
+        with self._lock, self._store.batch():
+            self._write_unlocked(segments, value)
+            self._notify([(segments, value)], "put")
+
+    def _update(self, segments, mapping):
+        with self._lock, self._store.batch():
+            writes = [(segments + _split(rel_path), _normalize(value)) for rel_path, value in mapping.items()]
+            for path, value in writes:
+                self._write_unlocked(path, value)
+            self._notify(writes, "patch")
+
+    # --- Fake event stream ---
+    def _listen(self, segments, callback):
+        with self._lock:
+            registration = LocalListenerRegistration(self, segments, callback)
+            registration._queue.put(LocalEvent("put", "/", _denormalize(self._read(segments))))
+            self._listeners.append(registration)
+        registration._thread.start()
+        return registration
+
+    def _notify(self, writes, event_type):
+        """Queues the events each listener would get from RTDB for these (already applied) writes."""
+        for registration in self._listeners:
+            node, depth = registration._segments, len(registration._segments)
+            if any(len(path) <= depth and node[:len(path)] == path for path in writes):
+                # Written at or above the listened node: resend the whole node
+                registration._queue.put(LocalEvent("put", "/", _denormalize(self._read(node))))
+                continue
+            below = {"/".join(path[depth:]): _denormalize(value) for path, value in writes if path[:depth] == node}
+            if not below: continue
+            if event_type == "put":
+                (child, value), = below.items()
+                registration._queue.put(LocalEvent("put", "/" + child, value))
+            else:
+                registration._queue.put(LocalEvent("patch", "/", below))
+
+    def _write_unlocked(self, segments, value):
+        if not segments:
+            for root in self._store.roots(): self._store.drop(root)
+            for root, child in (value or {}).items(): self._write_unlocked([root], child)
+        elif len(segments) == 1:
+            self._store.drop(segments[0])
+            for key, child in (value or {}).items(): self._store.put(segments[0], key, child)
+        else:
+            root, key = segments[0], segments[1]
+            self._store.put(root, key, _set_in(self._store.get(root, key), segments[2:], value))
+
+
+class LocalReference:
+    def __init__(self, database, segments):
+        self._db = database
+        self._segments = segments
+
+    @property
+    def key(self):
+        return self._segments[-1] if self._segments else None
+
+    @property
+    def path(self):
+        return "/" + "/".join(self._segments)
+
+    @property
+    def parent(self):
+        return LocalReference(self._db, self._segments[:-1]) if self._segments else None
+
+    def child(self, path):
+        if not path or not isinstance(path, str) or path.startswith("/"):
+            raise ValueError(f'Invalid path argument: "{path}".')
+        return LocalReference(self._db, self._segments + _split(path))
+
+    def get(self, etag=False, shallow=False):
+        if etag and shallow:
+            raise ValueError("etag and shallow cannot both be set to True.")
+        value = self._db._read(self._segments)
+        if etag: return _denormalize(value), _etag(value)
+        if shallow and isinstance(value, dict):
+            return {k: True if isinstance(v, dict) else v for k, v in value.items()}
+        return _denormalize(value)
+
+    def get_if_changed(self, etag):
+        if not isinstance(etag, str): raise ValueError("ETag must be a string.")
+        value, current = self.get(etag=True)
+        return (False, None, None) if current == etag else (True, value, current)
+
+    def set(self, value):
+        if value is None: raise ValueError("Value must not be None.")
+        self._db._write(self._segments, _normalize(value))
+
+    def set_if_unchanged(self, expected_etag, value):
+        if not isinstance(expected_etag, str): raise ValueError("Expected ETag must be a string.")
+        if value is None: raise ValueError("Value must not be none.")
+        with self._db._lock:
+            current = self._db._read(self._segments)
+            if _etag(current) != expected_etag:
+                return False, _denormalize(current), _etag(current)
+            stored = _normalize(value)
+            self._db._write(self._segments, stored)
+            return True, value, _etag(stored)
+
+    def push(self, value=""):
+        if value is None: raise ValueError("Value must not be None.")
+        ref = self.child(generate_push_id())
+        ref.set(value)
+        return ref
+
+    def update(self, value):
+        if not value or not isinstance(value, dict):
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        if None in value.keys(): raise ValueError("Dictionary must not contain None keys.")
+        self._db._update(self._segments, value)
+
+    def delete(self):
+        self._db._write(self._segments, None)
+
+    def listen(self, callback):
+        return self._db._listen(self._segments, callback)
+
+    def transaction(self, transaction_update):
+        """Same optimistic compare-and-swap loop as firebase_admin's Reference.transaction."""
+        if not callable(transaction_update):
+            raise ValueError("transaction_update must be a function.")
+        tries = 0
+        data, etag = self.get(etag=True)
+        while tries < _TRANSACTION_MAX_RETRIES:
+            new_data = transaction_update(data)
+            success, data, etag = self.set_if_unchanged(etag, new_data)
+            if success: return new_data
+            tries += 1
+        raise TransactionAbortedError("Transaction aborted after failed retries.")
+
+    def order_by_key(self):
+        return LocalQuery(self, None)
+
+    def order_by_child(self, path):
+        if not path or path.startswith("/"): raise ValueError(f'Invalid path argument: "{path}".')
+        return LocalQuery(self, _split(path))
+
+
+class LocalEvent:
+    """Same attributes as firebase_admin.db.Event."""
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class LocalListenerRegistration:
+    """Like firebase_admin.db.ListenerRegistration: calls `callback` with each event on its own thread."""
+    def __init__(self, database, segments, callback):
+        self._db = database
+        self._segments = segments
+        self._callback = callback
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._start_listen, daemon=True)
+
+    def _start_listen(self):
+        while True:
+            event = self._queue.get()
+            if event is None: return
+            self._callback(event)
+
+    def close(self):
+        with self._db._lock:
+            if self in self._db._listeners: self._db._listeners.remove(self)
+        self._queue.put(None)
+        if self._thread is not threading.current_thread(): self._thread.join()
+
+
+class LocalQuery:
+    def __init__(self, ref, order_by):
+        self._ref = ref
+        self._order_by = order_by  # None = by key, else child path segments
+        self._start = self._end = self._equal = self._limit = None
+        self._last = False
+
+    def limit_to_first(self, limit):
+        self._limit, self._last = limit, False
+        return self
+
+    def limit_to_last(self, limit):
+        self._limit, self._last = limit, True
+        return self
+
+    def start_at(self, start):
+        self._start = start
+        return self
+
+    def end_at(self, end):
+        self._end = end
+        return self
+
+    def equal_to(self, value):
+        self._equal = value
+        return self
+
+    def get(self):
+        db, segments = self._ref._db, self._ref._segments
+        with db._lock:
+            if len(segments) == 1 and self._order_by is None:
+                start = self._start if self._equal is None else self._equal
+                end = self._end if self._equal is None else self._equal
+                rows = db._store.scan(segments[0], start, end, self._limit, self._last)
+                return {k: _denormalize(v) for k, v in rows}
+            if len(segments) == 1 and self._equal is not None:
+                rows = db._store.scan_child(segments[0], self._order_by, self._equal)
+            else:
+                node = db._read(segments)
+                rows = list(node.items()) if isinstance(node, dict) else []
+        rows = self._filter(rows)
+        if self._limit is not None:
+            rows = rows[-self._limit:] if self._last else rows[:self._limit]
+        return {k: _denormalize(v) for k, v in rows}
+
+    def _filter(self, rows):
+        if self._order_by is None:
+            sort_key = lambda row: row[0]
+        else:
+            sort_key = lambda row: (_order_key(_get_in(row[1], self._order_by)), row[0])
+        value_of = (lambda row: row[0]) if self._order_by is None else (lambda row: _get_in(row[1], self._order_by))
+        if self._equal is not None: rows = [r for r in rows if value_of(r) == self._equal]
+        if self._start is not None: rows = [r for r in rows if _order_key(value_of(r)) >= _order_key(self._start)]
+        if self._end is not None: rows = [r for r in rows if _order_key(value_of(r)) <= _order_key(self._end)]
+        return sorted(rows, key=sort_key)
@@ -0,0 +1,16 @@
+from firebase_repository import FirebaseRepository
+from local_db import LocalDatabase
+import metrics
+
+
+class LocalRepository(FirebaseRepository):
+    """
+    FirebaseRepository running on the embedded LocalDatabase instead of the Realtime Database.
+    In memory when `path` is None, otherwise persisted to the SQLite file at `path`.
+    Transactions keep the same ETag compare-and-swap retry loop as group_ref.transaction.
+    """
+    def __init__(self, path=None):
+        self.database = LocalDatabase(path)
+
+    def _ref(self, path):
+        return metrics.track(self.database.reference(path), path)
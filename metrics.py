@@ -0,0 +1,264 @@
+'''
+In-process instrumentation exported in the Prometheus text format (GET /metrics).
+
+    payplit_http_request_duration_seconds   histogram {route, method, status}
+    payplit_http_request_db_round_trips     histogram {route}    database calls per HTTP request
+    payplit_repository_call_duration_seconds histogram {method}   per repository method (count = calls)
+    payplit_db_round_trips_total            counter   {op}
+    payplit_transaction_retries_total       counter   {root}     extra attempts of Reference.transaction
+    payplit_errors_total                    counter   {route, exception}
+
+Every sample carries worker="<pid>": the numbers are per process, and under gunicorn a scrape
+of /metrics is answered by whichever worker accepts it. Sum over the label for the service,
+e.g. sum without (worker) (rate(payplit_db_round_trips_total[5m])). A worker's series only
+advance when a scrape lands on it, so keep the scrape interval short relative to the worker
+count, or run one worker per container (WEB_WORKERS=1) and scrape every container.
+A recycled worker (max_requests) starts new series under its new pid.
+
+Each request gets a RequestTrace (a contextvar, handed to pool threads by propagate()).
+When tracing is on, it also keeps the sequence of repository calls and round trips,
+which is logged for sampled slow requests to make N+1 patterns visible.
+'''
+import contextvars
+import functools
+import os
+import random
+import re
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+ENABLED = True
+_current = contextvars.ContextVar("request_trace", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [("worker", os.getpid())] + list(zip(names, values)) + list(extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, count in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, values)} {count}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None: series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[-1] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, values, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram("payplit_http_request_duration_seconds", "HTTP request latency.",
+                            ("route", "method", "status"))
+REQUEST_ROUND_TRIPS = Histogram("payplit_http_request_db_round_trips", "Database round trips per HTTP request.",
+                                ("route",), ROUND_TRIP_BUCKETS)
+REPOSITORY_LATENCY = Histogram("payplit_repository_call_duration_seconds", "Repository method latency.",
+                               ("method",))
+ROUND_TRIPS = Counter("payplit_db_round_trips_total", "Database round trips by operation.", ("op",))
+TRANSACTION_RETRIES = Counter("payplit_transaction_retries_total", "Retried transaction attempts.", ("root",))
+ERRORS = Counter("payplit_errors_total", "Errors by route and exception type.", ("route", "exception"))
+
+REGISTRY = [REQUEST_LATENCY, REQUEST_ROUND_TRIPS, REPOSITORY_LATENCY, ROUND_TRIPS, TRANSACTION_RETRIES, ERRORS]
+
+
+def render(extra_lines=()):
+    lines = []
+    for metric in REGISTRY: lines += metric.render()
+    lines += extra_lines
+    return "\n".join(lines) + "\n"
+
+
+def gauge_lines(prefix, stats, label=None):
+    """Renders a stats() dict as gauges: {"hits": 3} -> prefix_hits 3; nested dicts become `label` values."""
+    samples = []
+
+    def walk(values, labels):
+        for key, value in values.items():
+            if isinstance(value, dict) and label:
+                walk(value, [(label, key)])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = prefix + "_" + re.sub(r"(?<!^)(?=[A-Z])", "_", key).lower()
+                samples.append((name, _labels((), (), labels), value))
+    walk(stats, [])
+    lines = []
+    for name in dict.fromkeys(name for name, _, _ in samples):
+        lines.append(f"# TYPE {name} gauge")
+        lines += [f"{n}{labels} {value}" for n, labels, value in samples if n == name]
+    return lines
+
+
+# --- Per-request trace ---
+
+class RequestTrace:
+    def __init__(self, route, keep_events=False):
+        self.route = route
+        self.started = time.perf_counter()
+        self.round_trips = 0
+        self.events = [] if keep_events else None
+        self._lock = threading.Lock()
+
+    def add(self, kind, name, seconds, round_trips=0):
+        with self._lock:
+            self.round_trips += round_trips
+            if self.events is not None:
+                self.events.append((round((time.perf_counter() - self.started) * 1000, 2), kind, name,
+                                    round(seconds * 1000, 2)))
+
+
+def begin_request(route, keep_events=False):
+    trace = RequestTrace(route, keep_events)
+    _current.set(trace)
+    return trace
+
+
+def end_request(method, status, slow_ms=0, sample_rate=1.0):
+    """Records the request's latency and round trips; returns the trace lines if it should be logged."""
+    trace = _current.get()
+    if trace is None: return None
+    _current.set(None)
+    elapsed = time.perf_counter() - trace.started
+    REQUEST_LATENCY.observe(elapsed, trace.route, method, str(status))
+    REQUEST_ROUND_TRIPS.observe(trace.round_trips, trace.route)
+    if not slow_ms or trace.events is None or elapsed * 1000 < slow_ms or random.random() >= sample_rate:
+        return None
+    lines = [f"slow request {method} {trace.route} {status} {elapsed * 1000:.1f}ms, {trace.round_trips} round trips"]
+    lines += [f"  +{at:>8.2f}ms {kind:<4} {name} ({ms:.2f}ms)" for at, kind, name, ms in trace.events]
+    return "\n".join(lines)
+
+
+def propagate(fn):
+    """Runs fn in another thread (e.g. the batch-read pool) under the caller's request trace."""
+    trace = _current.get()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def record_error(route, exc):
+    ERRORS.inc(route, type(exc).__name__)
+
+
+def _record(kind, name, seconds, round_trips=0):
+    trace = _current.get()
+    if trace is not None: trace.add(kind, name, seconds, round_trips)
+
+
+# --- Repository and database instrumentation ---
+
+def track(ref, path):
+    """What FirebaseRepository._ref hands out: the Reference, wrapped when metrics are on."""
+    return TrackedReference(ref, path) if ENABLED else ref
+
+
+def timed_method(name, fn):
+    @functools.wraps(fn)
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            REPOSITORY_LATENCY.observe(elapsed, name)
+            _record("repo", name, elapsed)
+    return timed
+
+
+_ROUND_TRIP_OPS = frozenset(("get", "get_if_changed", "set", "set_if_unchanged", "update", "push", "delete", "listen"))
+_CHAINED_OPS = frozenset(("child", "order_by_key", "order_by_child", "order_by_value", "limit_to_first",
+                          "limit_to_last", "start_at", "end_at", "equal_to"))
+
+
+class TrackedReference:
+    """
+    Wraps a Reference (or Query) and counts each call that goes to the database.
+    transaction() counts its initial read plus one round trip per attempt; attempts after
+    the first are reported as retries.
+    """
+    def __init__(self, target, path):
+        self._target = target
+        self._path = path
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in _ROUND_TRIP_OPS: return functools.partial(self._round_trip, name, attr)
+        if name in _CHAINED_OPS:
+            return lambda *args, **kwargs: TrackedReference(attr(*args, **kwargs), self._path)
+        return attr
+
+    def _round_trip(self, op, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            ROUND_TRIPS.inc(op)
+            _record("db", f"{op} {self._path}", elapsed, 1)
+
+    def transaction(self, transaction_update):
+        attempts = [0]
+
+        def counted(data):
+            attempts[0] += 1
+            return transaction_update(data)
+        started = time.perf_counter()
+        try:
+            return self._target.transaction(counted)
+        finally:
+            elapsed = time.perf_counter() - started
+            ROUND_TRIPS.inc("transaction", amount=1 + attempts[0])
+            if attempts[0] > 1: TRANSACTION_RETRIES.inc(self._path.strip("/").split("/")[0], amount=attempts[0] - 1)
+            _record("db", f"transaction {self._path} ({attempts[0]} attempts)", elapsed, 1 + attempts[0])
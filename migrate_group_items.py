@@ -0,0 +1,28 @@
+'''
+One-off migration: groups/{gid}/groupItems -> groupItemIndex/{gid}/{itemId}.
+
+    python migrate_group_items.py [--workers 8]
+
+Uses the backend configured for the app (DB_BACKEND etc.). Safe to re-run:
+migrated groups no longer have groupItems and are skipped.
+'''
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move groupItems lists into groupItemIndex")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    import app
+    repo = app.init_backend()
+    while not hasattr(repo, "_ref"): repo = repo.inner  # down through every decorator to the database repository
+    group_ids = list(repo._ref("groups").get(shallow=True) or {})
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        moved = list(pool.map(repo.migrate_group_item_index, group_ids))
+    print(f"groups scanned: {len(group_ids)}, groups migrated: {sum(1 for m in moved if m)}, items indexed: {sum(moved)}")
+
+
+if __name__ == "__main__":
+    main()
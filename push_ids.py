@@ -0,0 +1,46 @@
+import random
+import threading
+import time
+
+# Same alphabet and layout as the Firebase client SDKs: 8 chars of millisecond
+# timestamp followed by 12 random chars, so ids sort by creation time.
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_rand = [0] * 12
+_rng = random.SystemRandom()
+
+
+def generate_push_id():
+    """Returns a chronologically ordered push key without a round trip to the server."""
+    global _last_ms
+    with _lock:
+        now = int(time.time() * 1000)
+        if now == _last_ms:
+            # Same millisecond: increment the random part so keys stay strictly ordered
+            for i in range(11, -1, -1):
+                if _last_rand[i] != 63:
+                    _last_rand[i] += 1
+                    break
+                _last_rand[i] = 0
+        else:
+            _last_ms = now
+            for i in range(12): _last_rand[i] = _rng.randrange(64)
+
+        ts_chars = []
+        for _ in range(8):
+            ts_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        return "".join(reversed(ts_chars)) + "".join(PUSH_CHARS[r] for r in _last_rand)
+
+
+def push_id_timestamp(push_id):
+    """Creation time in epoch milliseconds encoded in the first 8 chars of a push key (None if not one)."""
+    if not isinstance(push_id, str) or len(push_id) != 20: return None
+    ms = 0
+    for char in push_id[:8]:
+        index = PUSH_CHARS.find(char)
+        if index < 0: return None
+        ms = ms * 64 + index
+    return ms
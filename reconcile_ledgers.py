@@ -0,0 +1,68 @@
+'''
+Ledger reconciliation: recomputes every group's groupBalance from its items and reports
+groups whose stored ledger differs. With --repair, mismatched groups are rewritten
+(balances + a fresh groupGraph + settlement views), unless they changed meanwhile or still
+list items in groups/{gid}/groupItems that are missing from groupItemIndex ("unindexed":
+run migrate_group_items.py first).
+
+    python reconcile_ledgers.py [--workers 8] [--page-size 500] [--repair] [--backfill-views] [--group GID ...]
+
+--backfill-views also rewrites every group's userSettlements summaries from its stored ledger,
+once, for groups created before the summaries existed (the read endpoints never write them).
+
+Uses the backend configured for the app (DB_BACKEND etc.). Groups are streamed in
+key-ordered pages and at most 2 x workers groups are in flight, so memory stays flat.
+Mismatches are printed as JSON lines, then a summary.
+'''
+import argparse
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def reconcile_all(repo, group_ids, workers, repair, page_size, backfill_views=False):
+    """Runs reconcile_group over group_ids with a bounded number of groups in flight; yields reports."""
+    def reconcile(group_id):
+        report = repo.reconcile_group(group_id, repair, page_size)
+        if backfill_views and not report.get("missing"):
+            report["viewsWritten"] = len(repo.rebuild_user_settlements(group_id))
+        return report
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for group_id in group_ids:
+            pending.add(pool.submit(reconcile, group_id))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done: yield future.result()
+        for future in pending: yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--repair", action="store_true", help="rewrite mismatched ledgers")
+    parser.add_argument("--backfill-views", action="store_true", help="rewrite every group's userSettlements summaries")
+    parser.add_argument("--group", nargs="+", help="only these group ids")
+    args = parser.parse_args()
+
+    import app
+    repo = app.init_backend()
+    group_ids = args.group or (gid for gid, _ in repo.scan_groups(args.page_size))
+    totals = {"groups": 0, "items": 0, "mismatched": 0, "repaired": 0, "conflicts": 0, "unindexed": 0, "refused": 0,
+              "viewsWritten": 0}
+    for report in reconcile_all(repo, group_ids, args.workers, args.repair, args.page_size, args.backfill_views):
+        totals["groups"] += 1
+        totals["items"] += report["items"]
+        if not report["consistent"]: totals["mismatched"] += 1
+        if not report["consistent"] or report.get("unindexed"): print(json.dumps(report), flush=True)
+        totals["repaired"] += report["repaired"]
+        totals["conflicts"] += bool(report.get("conflict"))
+        totals["unindexed"] += bool(report.get("unindexed"))
+        totals["refused"] += bool(report.get("refused"))
+        totals["viewsWritten"] += report.get("viewsWritten", 0)
+    print(f"summary: {json.dumps(totals)}")
+
+
+if __name__ == "__main__":
+    main()
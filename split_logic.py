@@ -13,7 +13,25 @@ groupGraph ->
     'useridB' -> ... same
 }
 '''
-from decimal import Decimal
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+import heapq
+import time
+from ttl_cache import TTLCache, MISSING
+
+MINOR_UNITS = 100  # paise per rupee
+
+# groupData["settlementMode"]: "greedy" (default, incremental) or "minimal"
+SETTLEMENT_MODES = ("greedy", "minimal")
+# Minimal mode budget; past it the group falls back to the greedy plan
+MIN_TRANSFER_MAX_MEMBERS = 16
+MIN_TRANSFER_TIME_BUDGET = 0.25  # seconds
+# The subset DP allocates 2**n entries, so n is capped here whatever MIN_TRANSFER_MAX_MEMBERS says
+MIN_TRANSFER_HARD_LIMIT = 20
+
+
+class SettlementError(ValueError):
+    """Raised when balances do not sum to zero, i.e. the ledger cannot be settled."""
 
 
 def update_group_balances(group_data, payer_id, receiver_id, amount):
@@ -83,4 +101,359 @@ def optimal_account_balance(group_data):
     group_data['groupGraph'] = new_graph
     
     if((i< len(positive_accounts)) or( j<len(negative_accounts)) ):
-        print("something wrong account is not balance fully")
+        raise SettlementError("something wrong account is not balance fully")
+
+
+
+# ================================
+# Incremental settlement engine (integer minor units)
+# ================================
+
+def to_minor(amount):
+    """Exact rupees -> integer paise (half-up), via str so floats like 0.1 stay exact."""
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(units):
+    return units / MINOR_UNITS
+
+
+def item_deltas(item_data, sign=1, deltas=None):
+    """
+    Net balance change per member for one item, in minor units.
+    sign=-1 reverses the item (delete). Pass `deltas` to accumulate several items.
+    """
+    if deltas is None: deltas = {}
+    payer_id = item_data["itemPayer"][0]
+    for receiver_id, amount in zip(item_data["itemSpliter"], item_data["itemSpliterValue"]):
+        if receiver_id == payer_id: continue
+        units = sign * to_minor(amount)
+        deltas[payer_id] = deltas.get(payer_id, 0) + units
+        deltas[receiver_id] = deltas.get(receiver_id, 0) - units
+    return deltas
+
+
+def validate_item(item_data, group_id):
+    """Raises KeyError / IndexError / TypeError / ValueError when the item cannot go into the group's ledger."""
+    if not isinstance(item_data, dict): raise TypeError("item must be an object")
+    item_data.setdefault("itemGroupId", group_id)
+    if item_data["itemGroupId"] != group_id: raise ValueError("itemGroupId does not match groupId")
+    if not item_data["itemPayer"]: raise ValueError("itemPayer is empty")
+    if len(item_data["itemSpliter"]) != len(item_data["itemSpliterValue"]):
+        raise ValueError("itemSpliter and itemSpliterValue differ in length")
+    for value in item_data["itemSpliterValue"]:
+        try:
+            to_minor(value)
+        except ArithmeticError:
+            raise ValueError(f"invalid amount {value!r}")
+
+
+def _stored_minor(amount):
+    """
+    Stored ledger value -> paise. Values this module wrote are exact multiples of 0.01, so
+    rounding the float is exact and skips the Decimal parse; anything else goes through to_minor.
+    """
+    units = amount * MINOR_UNITS
+    rounded = round(units)
+    return rounded if abs(units - rounded) < 1e-6 else to_minor(amount)
+
+
+class SettlementLedger:
+    """
+    Balances and settlement edges of one group in integer minor units.
+    balances[uid] = sum(edges[uid].values()) holds for a consistent ledger; edges[a][b] > 0
+    means a gets back from b. `transfers` counts the edges, `nonzero` the unsettled members,
+    `touched` the members the last apply_balance_deltas() changed (None = all of them).
+    """
+    __slots__ = ("balances", "edges", "rebuilt", "transfers", "nonzero", "touched")
+
+    def __init__(self, balances, edges):
+        self.balances = balances
+        self.edges = edges
+        self.rebuilt = False
+        self.touched = None
+        self.transfers = sum(1 for row in edges.values() for units in row.values() if units > 0)
+        self.nonzero = sum(1 for units in balances.values() if units)
+
+    @classmethod
+    def from_group(cls, group_data):
+        balances = {uid: _stored_minor(v) for uid, v in (group_data.get("groupBalance") or {}).items()}
+        edges = {}
+        for a, row in (group_data.get("groupGraph") or {}).items():
+            for b, amt in (row or {}).items():
+                if amt: edges.setdefault(a, {})[b] = _stored_minor(amt)
+        return cls(balances, edges)
+
+    def is_consistent(self):
+        """Every edge mirrored and every balance equal to its row sum (checked by reconciliation)."""
+        for a, row in self.edges.items():
+            for b, units in row.items():
+                if self.edges.get(b, {}).get(a) != -units: return False
+        users = set(self.balances) | set(self.edges)
+        return all(self.balances.get(u, 0) == sum(self.edges.get(u, {}).values()) for u in users)
+
+    def rebuild(self):
+        """Full re-match of every non-zero balance (at most nonzero - 1 transfers)."""
+        self.edges = {}
+        self.transfers = 0
+        self._match(dict(self.balances))
+        self.rebuilt = True
+
+    def solve_minimal(self, max_members=None, time_budget=None):
+        """Replaces the edges with a minimum-transfer plan, or the greedy one when over budget."""
+        edges = minimum_transfer_edges(self.balances, max_members, time_budget)
+        if edges is None:
+            self.rebuild()
+        else:
+            self.edges = edges
+            self.transfers = sum(1 for row in edges.values() for units in row.values() if units > 0)
+        self.rebuilt = True
+
+    def apply(self, deltas):
+        """
+        Applies balance deltas and re-settles only the edges of the affected members; falls
+        back to a full rebuild when the incremental plan has more than nonzero - 1 transfers.
+        Returns the set of members whose balance or edges changed.
+        """
+        self.rebuilt = False
+        affected = {uid for uid, units in deltas.items() if units}
+        if not affected: return set()
+        residual = {}
+        for uid in affected:
+            before = self.balances.get(uid, 0)
+            after = self.balances[uid] = before + deltas[uid]
+            self.nonzero += bool(after) - bool(before)
+            residual[uid] = after
+        for uid in affected:
+            for other in self.edges.pop(uid, {}):
+                peer = self.edges.get(other)
+                if peer is None or uid not in peer: continue  # mirror already dropped with other's row
+                self.transfers -= 1
+                units = peer.pop(uid)
+                # The counterparty's share of the dropped edge becomes unsettled again
+                if other not in affected: residual[other] = residual.get(other, 0) + units
+                if not peer: del self.edges[other]
+        self._match(residual)
+        if self.transfers > max(self.nonzero - 1, 0): self.rebuild()
+        return set(residual)
+
+    def _match(self, residual):
+        """Heap matching: always settle the largest creditor against the largest debtor."""
+        creditors = [(-units, uid) for uid, units in residual.items() if units > 0]
+        debtors = [(units, uid) for uid, units in residual.items() if units < 0]
+        heapq.heapify(creditors)
+        heapq.heapify(debtors)
+        while creditors and debtors:
+            c_units, creditor = heapq.heappop(creditors)
+            d_units, debtor = heapq.heappop(debtors)
+            amount = min(-c_units, -d_units)
+            self._add_edge(creditor, debtor, amount)
+            if -c_units > amount: heapq.heappush(creditors, (c_units + amount, creditor))
+            if -d_units > amount: heapq.heappush(debtors, (d_units + amount, debtor))
+        if creditors or debtors:
+            raise SettlementError("balances do not sum to zero")
+
+    def _add_edge(self, creditor, debtor, units):
+        row = self.edges.setdefault(creditor, {})
+        before = row.get(debtor, 0)
+        total = before + units
+        peer = self.edges.setdefault(debtor, {})
+        self.transfers += bool(total) - bool(before)
+        if total:
+            row[debtor] = total
+            peer[creditor] = -total
+        else:
+            row.pop(debtor, None)
+            peer.pop(creditor, None)
+            if not row: del self.edges[creditor]
+            if not peer: del self.edges[debtor]
+
+    def write_to(self, group_data, touched=None):
+        """Writes balances and graph rows back as floats (the shape the Android client reads)."""
+        users = set(self.balances) | set(self.edges) if touched is None else touched
+        balance_list = group_data.setdefault("groupBalance", {})
+        graph = group_data.get("groupGraph")
+        if not isinstance(graph, dict) or touched is None:
+            graph = group_data["groupGraph"] = {uid: {} for uid in group_data.get("groupMembers", [])}
+        for uid in users:
+            if uid in self.balances: balance_list[uid] = from_minor(self.balances[uid])
+            graph[uid] = {other: from_minor(units) for other, units in self.edges.get(uid, {}).items()}
+
+
+class LedgerCache:
+    """
+    Parsed ledgers of recently written groups, so consecutive writes to a group skip re-reading
+    its whole graph. take() hands out the cached ledger only while the group's rev and balances
+    are still the ones keep() saw, and removes it: a ledger belongs to one write attempt at a
+    time, and an attempt that did not commit is never put back.
+    """
+    def __init__(self, maxsize=1024):
+        self._cache = TTLCache(maxsize, float("inf"))  # group id -> (rev, balances as written, ledger)
+
+    def take(self, group_id, group_data):
+        entry = self._cache.pop(group_id)
+        if (entry is not MISSING and entry[0] == group_data.get("rev")
+                and entry[1] == (group_data.get("groupBalance") or {})):
+            return entry[2]
+        return SettlementLedger.from_group(group_data)
+
+    def keep(self, group_id, group_data, ledger):
+        """Caches the ledger of a committed write; group_data is the group as committed."""
+        if ledger is None or group_data.get("rev") is None: return
+        self._cache.set(group_id, (group_data["rev"], dict(group_data.get("groupBalance") or {}), ledger))
+
+    def discard(self, group_id):
+        self._cache.pop(group_id)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+def apply_balance_deltas(group_data, deltas, ledger=None):
+    """
+    Applies per-member minor-unit deltas to group_data (parsed into `ledger` unless one is given).
+    Greedy groups touch only the affected graph edges; "minimal" groups are re-solved in full.
+    A stored graph that does not add up to the balances is rebuilt from the balances.
+    """
+    if ledger is None: ledger = SettlementLedger.from_group(group_data)
+    try:
+        touched = ledger.apply(deltas)
+    except SettlementError:
+        ledger.rebuild()  # raises again if the balances themselves do not sum to zero
+        touched = None
+    if group_data.get("settlementMode") == "minimal" and touched:
+        ledger.solve_minimal()
+    ledger.touched = None if ledger.rebuilt else touched
+    ledger.write_to(group_data, ledger.touched)
+    return ledger
+
+
+def settle_group(group_data):
+    """Recomputes the whole groupGraph from groupBalance using the group's settlementMode."""
+    ledger = SettlementLedger.from_group(group_data)
+    if group_data.get("settlementMode") == "minimal": ledger.solve_minimal()
+    else: ledger.rebuild()
+    ledger.write_to(group_data)
+    return ledger
+
+
+def apply_items(group_data, items, sign=1):
+    """Batch mode: nets the deltas of many items, then settles once."""
+    deltas = {}
+    for item_data in items: item_deltas(item_data, sign, deltas)
+    return apply_balance_deltas(group_data, deltas)
+
+
+
+def user_settlement_summaries(group_data, uids=None):
+    """
+    Per-member view of groupGraph, materialized at write time as userSettlements/{uid}/{gid}:
+    {"groupName", "net", "owed": {uid: amt}, "owes": {uid: amt}, "names": {uid: name}, "rev"}.
+    "rev" is the group revision the summary was computed from.
+    Settled members still get {"net": 0.0} so a missing node means "not materialized yet".
+    `uids` limits the result to those members (the ones a ledger update touched).
+    """
+    names = group_data.get("memberNames") or {}
+    graph = group_data.get("groupGraph") or {}
+    balances = group_data.get("groupBalance") or {}
+    summaries = {}
+    if uids is None: uids = set(group_data.get("groupMembers") or []) | set(graph) | set(balances)
+    for uid in uids:
+        row = graph.get(uid) or {}
+        owed = {other: amt for other, amt in row.items() if amt > 0}
+        owes = {other: -amt for other, amt in row.items() if amt < 0}
+        summaries[uid] = {
+            "groupName": group_data.get("groupName", ""),
+            "net": from_minor(_stored_minor(balances.get(uid, 0))),
+            "owed": owed,
+            "owes": owes,
+            "names": {other: names.get(other, other) for other in list(owed) + list(owes)},
+            "rev": group_data.get("rev", 0),
+        }
+    return summaries
+
+
+# ================================
+# Minimum-transfer solver
+# ================================
+
+def minimum_transfer_edges(balances, max_members=None, time_budget=None):
+    """
+    Fewest-transfers settlement. n non-zero balances split into k disjoint zero-sum
+    subsets need exactly n - k transfers, so we look for the partition with the most
+    subsets (subset DP over bitmasks), then settle each subset on its own.
+    Returns edges in SettlementLedger form, or None when the group is over the
+    member or time budget (callers fall back to the greedy plan).
+    """
+    if max_members is None: max_members = MIN_TRANSFER_MAX_MEMBERS
+    if time_budget is None: time_budget = MIN_TRANSFER_TIME_BUDGET
+    deadline = time.perf_counter() + time_budget
+
+    ledger = SettlementLedger({}, {})
+    # Pruning: an exact +x/-x pair is always its own subset in some optimal plan
+    by_amount = {}
+    rest = []
+    for uid, units in sorted(balances.items()):
+        if not units: continue
+        partners = by_amount.get(-units)
+        if partners:
+            other = partners.pop()
+            if units > 0: ledger._add_edge(uid, other, units)
+            else: ledger._add_edge(other, uid, -units)
+        else:
+            by_amount.setdefault(units, []).append(uid)
+    for units, uids in by_amount.items():
+        rest.extend((uid, units) for uid in uids)
+    if sum(units for _, units in rest):
+        raise SettlementError("balances do not sum to zero")
+    if len(rest) > min(max_members, MIN_TRANSFER_HARD_LIMIT): return None
+
+    subsets = _zero_sum_subsets(rest, deadline)
+    if subsets is None: return None
+    for subset in subsets: ledger._match(dict(subset))
+    return ledger.edges
+
+
+def _zero_sum_subsets(entries, deadline):
+    """
+    dp[mask] = most zero-sum groups among an ordering of mask's members, i.e.
+    max over i in mask of dp[mask - i], plus one if mask itself sums to zero.
+    Memoized bottom-up over all masks; returns the partition or None on timeout.
+    """
+    n = len(entries)
+    if n == 0: return []
+    if n > MIN_TRANSFER_HARD_LIMIT: return None  # checked before allocating 2**n entries
+    values = [units for _, units in entries]
+    size = 1 << n
+    sums = array("q", bytes(8 * size))
+    dp = bytearray(size)
+    for mask in range(1, size):
+        if not mask & 0xFFF and time.perf_counter() > deadline: return None
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + values[low.bit_length() - 1]
+        best, bits = 0, mask
+        while bits:
+            bit = bits & -bits
+            if dp[mask ^ bit] > best: best = dp[mask ^ bit]
+            bits ^= bit
+        dp[mask] = best + (sums[mask] == 0)
+
+    # Recover an ordering by peeling members off, then cut it at zero prefix sums
+    order, mask = [], size - 1
+    while mask:
+        target = dp[mask] - (sums[mask] == 0)
+        bits = mask
+        while bits:
+            bit = bits & -bits
+            if dp[mask ^ bit] == target: break
+            bits ^= bit
+        order.append(bit.bit_length() - 1)
+        mask ^= bit
+    subsets, current, total = [], [], 0
+    for index in reversed(order):
+        current.append(entries[index])
+        total += values[index]
+        if total == 0:
+            subsets.append(current)
+            current = []
+    return subsets
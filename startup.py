@@ -0,0 +1,48 @@
+'''
+Cold-start timings. Milestones are seconds since the process started:
+
+    app_imported   -> app.py finished importing (routes registered, no Firebase yet)
+    backend_ready  -> Firebase / repository initialized (lazily or by the warm-up thread)
+    first_response -> first HTTP response handed to the server
+'''
+import os
+import threading
+import time
+
+_lock = threading.Lock()
+_milestones = {}
+_durations = {}
+
+
+def _process_start():
+    """Wall-clock process start from /proc on Linux; falls back to this module's import time."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_START = _process_start()
+
+
+def mark(name):
+    """Records a milestone once; returns seconds since process start."""
+    with _lock:
+        if name not in _milestones:
+            _milestones[name] = round(time.time() - PROCESS_START, 4)
+        return _milestones[name]
+
+
+def record(name, seconds):
+    """Records how long a single step took (e.g. app imports, backend init)."""
+    with _lock:
+        _durations[name] = round(seconds, 4)
+
+
+def report():
+    with _lock:
+        return {"pid": os.getpid(), "sinceProcessStart": dict(_milestones), "durations": dict(_durations)}
@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from local_repository import LocalRepository
+
+
+@pytest.fixture
+def repo():
+    return LocalRepository()  # in memory
+
+
+@pytest.fixture
+def group(repo):
+    """Id of a group of three members, u1..u3."""
+    for uid, name in (("u1", "Asha"), ("u2", "Bilal"), ("u3", "Chen")):
+        repo.create_user(uid, {"name": name, "email": f"{uid}@example.com"})
+    return repo.create_group({"groupName": "trip", "groupMembers": ["u1", "u2", "u3"]})["groupId"]
+
+
+@pytest.fixture
+def new_item(group):
+    """Builds an item of `group`: u1 pays, u2 / u3 owe the amounts."""
+    def build(name="item", payer="u1", amounts=(10, 20), group_id=group):
+        return {"itemGroupId": group_id, "itemName": name, "itemPayer": [payer],
+                "itemSpliter": ["u2", "u3"][:len(amounts)], "itemSpliterValue": list(amounts)}
+    return build
+
+
+@pytest.fixture
+def create_items(repo, group, new_item):
+    """Creates `count` items one by one; returns the group's item ids, oldest first."""
+    def create(count):
+        for i in range(count):
+            assert repo.create_item_atomically(new_item(f"item{i}")) == (True, "item created")
+        return repo.get_group_item_ids(group)
+    return create
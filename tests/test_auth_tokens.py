@@ -0,0 +1,104 @@
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from auth_tokens import InvalidToken, SigningKeys, TokenVerifier
+
+PROJECT = "payplit-test"
+
+
+def rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def public_pem(private_key):
+    return private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                 serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+
+
+@pytest.fixture(scope="module")
+def signing_key():
+    return rsa_key()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fetches(signing_key):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {"kid-1": public_pem(signing_key)}, 3600
+    fetch.calls = calls
+    return fetch
+
+
+@pytest.fixture
+def verifier(fetches):
+    return TokenVerifier(PROJECT, SigningKeys(fetches, clock=FakeClock()), leeway=0)
+
+
+def token(private_key, kid="kid-1", **overrides):
+    now = int(time.time())
+    claims = {"iss": f"https://securetoken.google.com/{PROJECT}", "aud": PROJECT, "sub": "user-1",
+              "iat": now - 10, "exp": now + 3600, "auth_time": now - 10}
+    claims.update(overrides)
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+def test_valid_token(verifier, signing_key):
+    claims = verifier.verify(token(signing_key))
+    assert claims["uid"] == claims["sub"] == "user-1"
+    assert verifier.stats()["verified"] == 1
+
+
+def test_expired_token(verifier, signing_key):
+    now = int(time.time())
+    with pytest.raises(InvalidToken, match="expired"):
+        verifier.verify(token(signing_key, iat=now - 7200, exp=now - 3600))
+    assert verifier.stats()["rejected"] == 1
+
+
+def test_wrong_audience(verifier, signing_key):
+    with pytest.raises(InvalidToken, match="(?i)audience"):
+        verifier.verify(token(signing_key, aud="another-project"))
+
+
+def test_wrong_issuer(verifier, signing_key):
+    with pytest.raises(InvalidToken, match="issuer"):
+        verifier.verify(token(signing_key, iss="https://securetoken.google.com/another-project"))
+
+
+def test_unknown_kid_refetches_at_most_once(verifier, signing_key, fetches):
+    verifier.verify(token(signing_key))
+    for _ in range(3):
+        with pytest.raises(InvalidToken, match="unknown signing key"):
+            verifier.verify(token(signing_key, kid="kid-2"))
+    assert len(fetches.calls) == 1  # within min_refetch of the first fetch
+
+
+def test_signature_from_another_key(verifier):
+    with pytest.raises(InvalidToken, match="Signature"):
+        verifier.verify(token(rsa_key()))
+
+
+def test_non_rs256_token(verifier):
+    forged = jwt.encode({"sub": "user-1", "aud": PROJECT}, "a-shared-secret-of-at-least-32-bytes",
+                        algorithm="HS256", headers={"kid": "kid-1"})
+    with pytest.raises(InvalidToken, match="algorithm"):
+        verifier.verify(forged)
+
+
+def test_malformed_token(verifier):
+    with pytest.raises(InvalidToken):
+        verifier.verify("not-a-jwt")
@@ -0,0 +1,22 @@
+def test_bulk_create_reports_each_item(repo, group, new_item):
+    results = repo.create_items_atomically(group, [new_item("a"), {"itemPayer": []}, new_item("b")])
+    assert [r["success"] for r in results] == [True, False, True]
+    assert results[1]["message"].startswith("Invalid item")
+    assert repo.get_group_item_ids(group) == [results[0]["itemId"], results[2]["itemId"]]
+
+
+def test_bulk_create_sums_the_ledger_deltas(repo, group, new_item):
+    results = repo.create_items_atomically(group, [new_item(f"item{i}") for i in range(5)])
+    assert all(r["success"] for r in results)
+    stored_group = repo.get_group(group)
+    assert stored_group["rev"] == 6  # one rev per item, so the change log keeps one entry each
+    assert stored_group["groupBalance"] == {"u1": 150, "u2": -50, "u3": -100}
+
+
+def test_unknown_group_writes_nothing(repo, group, new_item):
+    # The group transaction writes {} (not None) for an unknown group and reports every mutation
+    assert repo.create_item_atomically(new_item("dinner", group_id="missing")) == (False, "Group not found")
+    results = repo.create_items_atomically("missing", [new_item("a", group_id="missing")])
+    assert results == [{"index": 0, "success": False, "message": "Group not found"}]
+    assert repo.get_all_items() == {}
+    assert repo._ref("groups/missing").get() is None
@@ -0,0 +1,40 @@
+def test_create_group_links_members_in_one_write(repo, group):
+    for uid in ("u1", "u2", "u3"):
+        assert repo._ref(f"users/{uid}/groupIds/{group}").get() is True
+        assert repo.get_user_groups(uid) == [group]
+    assert repo.get_group(group)["memberNames"] == {"u1": "Asha", "u2": "Bilal", "u3": "Chen"}
+
+
+def test_add_member_touches_only_members_names_and_link(repo, group):
+    repo.create_user("u4", {"name": "Dana", "email": "u4@example.com"})
+    before = repo.get_group(group)
+    assert repo.add_group_member(group, "u4")
+    assert repo.add_group_member(group, "u4")  # already a member: no second entry
+
+    after = repo.get_group(group)
+    assert after["groupMembers"] == ["u1", "u2", "u3", "u4"]
+    assert after["memberNames"]["u4"] == "Dana"
+    assert after["rev"] == before["rev"] + 1
+    assert repo.get_user_groups("u4") == [group]
+    assert [c["op"] for c in repo._ref(f"groupChanges/{group}").get().values()][-1] == "memberAdded"
+
+
+def test_add_member_repairs_a_missing_link(repo, group):
+    repo._ref(f"users/u2/groupIds/{group}").delete()
+    assert repo.add_group_member(group, "u2")
+    assert repo.get_user_groups("u2") == [group]
+    assert repo.get_group(group)["groupMembers"] == ["u1", "u2", "u3"]
+
+
+def test_add_member_to_unknown_group_writes_nothing(repo, group):
+    assert not repo.add_group_member("missing", "u1")
+    assert not repo.add_group_member(group, "nobody")
+    assert repo._ref("groups/missing").get() is None
+    assert repo.get_user("nobody") is None
+
+
+def test_listed_and_keyed_group_ids_are_read_together(repo, group):
+    repo._ref("users/u1/groupIds").set(["old-1", "old-2"])  # a user linked before keyed links
+    repo._ref(f"users/u1/groupIds/{group}").set(True)
+    assert repo.get_user_groups("u1") == ["old-1", "old-2", group]
+    assert repo.get_user("u1")["groupIds"] == ["old-1", "old-2", group]
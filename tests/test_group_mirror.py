@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+from group_mirror import GroupMirror
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def mirror(repo):
+    mirror = GroupMirror(repo, max_groups=2, promote_after=3, demote_below=2, window=60.0,
+                         verify_after=30.0, clock=FakeClock())
+    yield mirror
+    mirror.close()
+
+
+def promote(mirror, group_id):
+    """Reads the group until it is mirrored; returns its subscription once the snapshot is in."""
+    for _ in range(mirror.promote_after): mirror.get_group(group_id)
+    sub = mirror._mirrors[group_id]
+    wait_until(lambda: sub.ready)
+    return sub
+
+
+def new_group(repo, name):
+    return repo.create_group({"groupName": name, "groupMembers": ["u1", "u2", "u3"]})["groupId"]
+
+
+def test_hot_group_is_served_from_streamed_events(repo, group, mirror):
+    sub = promote(mirror, group)
+    assert mirror.stats()["promotions"] == 1
+
+    repo._ref(f"groups/{group}/groupName").set("renamed")  # put below the group
+    wait_until(lambda: mirror.get_group(group)["groupName"] == "renamed")
+    repo._ref(f"groups/{group}").update({"groupName": "patched", "currency": "EUR"})  # patch
+    wait_until(lambda: mirror.get_group(group).get("currency") == "EUR")
+    assert mirror.get_group(group) == repo.get_group(group)
+
+    fallbacks = mirror.fallbacks
+    mirror.get_group(group)
+    assert mirror.fallbacks == fallbacks and sub.seq >= 3
+
+
+def test_etags_match_between_mirror_and_database_reads(repo, group, mirror):
+    _, _, fallback_etag = mirror.get_group_with_etag(group)
+    promote(mirror, group)
+    hits = mirror.hits
+    assert mirror.get_group_with_etag(group, fallback_etag) == (False, None, None)
+    assert mirror.hits == hits + 1
+
+    repo._ref(f"groups/{group}/groupName").set("renamed")
+    wait_until(lambda: mirror.get_group_with_etag(group, fallback_etag)[0])
+    _, _, mirror_etag = mirror.get_group_with_etag(group)
+    mirror.close()  # every read now goes to the database
+    assert mirror.get_group_with_etag(group, mirror_etag) == (False, None, None)
+
+
+def test_deleted_group_reads_as_missing(repo, group, mirror):
+    promote(mirror, group)
+    repo.mark_group_deleted(group, 1)
+    wait_until(lambda: mirror.get_group(group) is None)
+    changed, value, etag = mirror.get_group_with_etag(group)
+    assert (changed, value) == (True, None)
+    mirror.close()
+    assert mirror.get_group_with_etag(group, etag) == (False, None, None)
+
+
+def test_cold_group_is_demoted_after_a_window(repo, group, mirror):
+    promote(mirror, group)
+    listeners = len(repo.database._listeners)
+
+    other = new_group(repo, "other")
+    mirror._clock.now += 60
+    mirror.get_group(other)  # the window it was promoted in: read often enough to stay
+    assert group in mirror._mirrors
+    mirror._clock.now += 60
+    mirror.get_group(other)
+    assert group not in mirror._mirrors
+    assert mirror.stats()["demotions"] == 1
+    assert len(repo.database._listeners) == listeners - 1
+
+
+def test_at_most_max_groups_are_mirrored(repo, group, mirror):
+    first, second = group, new_group(repo, "second")
+    promote(mirror, first)
+    promote(mirror, second)
+    mirror.get_group(first)  # second is now the least recently read
+
+    third = promote(mirror, new_group(repo, "third"))
+    assert list(mirror._mirrors.values())[1] is third
+    assert list(mirror._mirrors)[0] == first and second not in mirror._mirrors
+
+
+def test_dead_stream_falls_back_to_the_database(repo, group, mirror):
+    sub = promote(mirror, group)
+    sub.registration.close()  # the stream thread ends, as on a fatal stream error
+    repo._ref(f"groups/{group}/groupName").set("renamed")
+
+    fallbacks = mirror.fallbacks
+    assert mirror.get_group(group)["groupName"] == "renamed"
+    assert mirror.fallbacks == fallbacks + 1
+    assert group not in mirror._mirrors
+
+
+def test_own_write_is_read_back_at_once(repo, group, mirror):
+    promote(mirror, group)
+    mirror.update_group(group, {"groupName": "mine"})
+    assert mirror.get_group(group)["groupName"] == "mine"
+
+
+def test_refresh_keeps_newer_streamed_events(repo, group, mirror, monkeypatch):
+    sub = promote(mirror, group)
+    read = repo.get_group
+
+    def stale_read(group_id):
+        old = read(group_id)
+        seq = sub.seq
+        repo._ref(f"groups/{group_id}/rev").set(old["rev"] + 1)  # a newer write streams in mid-read
+        wait_until(lambda: sub.seq > seq)
+        return old
+    monkeypatch.setattr(repo, "get_group", stale_read)
+    rev = read(group)["rev"]
+
+    mirror._refresh(group, sub)
+    assert mirror.get_group(group)["rev"] == rev + 1
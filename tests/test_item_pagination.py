@@ -0,0 +1,41 @@
+def test_offset_pages_are_newest_first(repo, group, create_items):
+    newest_first = create_items(7)[::-1]
+
+    pages = [[i["itemId"] for i in repo.get_paginated_items(group, 3, offset)] for offset in (0, 3, 6, 9)]
+    assert pages == [newest_first[:3], newest_first[3:6], newest_first[6:], []]
+
+
+def test_cursor_pages_cover_every_item_once(repo, group, create_items):
+    ids = create_items(7)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        items, cursor = repo.get_items_page(group, 3, cursor)
+        seen += [i["itemId"] for i in items]
+        pages += 1
+        if cursor is None: break
+    assert seen == ids[::-1]
+    assert pages == 3
+
+
+def test_cursor_page_of_exact_multiple_ends_with_empty_page(repo, group, create_items):
+    ids = create_items(4)
+    items, cursor = repo.get_items_page(group, 2)
+    assert [i["itemId"] for i in items] == ids[:1:-1] and cursor == ids[2]
+    items, cursor = repo.get_items_page(group, 2, cursor)
+    assert [i["itemId"] for i in items] == ids[1::-1] and cursor == ids[0]
+    assert repo.get_items_page(group, 2, cursor) == ([], None)
+
+
+def test_unmigrated_group_items_are_paged_until_migrated(repo, group, create_items):
+    ids = create_items(4)
+    # An old group: ids listed in groups/{gid}/groupItems, no groupItemIndex yet
+    repo._ref("/").update({f"groupItemIndex/{group}": None, f"groups/{group}/groupItems": ids})
+
+    assert repo.get_group_item_ids(group) == ids
+    items, cursor = repo.get_items_page(group, 3)
+    assert [i["itemId"] for i in items] == ids[:0:-1] and cursor == ids[1]
+
+    assert repo.migrate_group_item_index(group) == 4
+    assert repo._ref(f"groups/{group}/groupItems").get() is None
+    assert [i["itemId"] for i in repo.get_paginated_items(group, 10, 0)] == ids[::-1]
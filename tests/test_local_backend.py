@@ -0,0 +1,52 @@
+from split_logic import SettlementLedger
+
+
+def test_create_item_writes_item_index_and_ledger(repo, group, new_item):
+    data = new_item("dinner")
+    assert repo.create_item_atomically(data) == (True, "item created")
+
+    assert repo.get_group_item_ids(group) == [data["itemId"]]
+    stored = repo.get_item(data["itemId"])
+    assert stored["itemPayerNames"] == ["Asha"]
+    assert stored["itemSpliterNames"] == ["Bilal", "Chen"]
+    stored_group = repo.get_group(group)
+    assert stored_group["rev"] == 2
+    assert stored_group["groupBalance"] == {"u1": 30, "u2": -10, "u3": -20}
+    assert SettlementLedger.from_group(stored_group).is_consistent()
+    assert repo.get_user_settlement("u2", group)["net"] == -10
+
+
+def test_invalid_item_is_rejected_without_writes(repo, group, new_item):
+    success, message = repo.create_item_atomically(new_item("bad", amounts=(10, "ten")))
+    assert not success and message.startswith("Invalid item")
+    assert repo.get_group_item_ids(group) == []
+    assert repo.get_group(group)["rev"] == 1
+
+
+def test_delete_item_reverses_the_ledger(repo, group, create_items):
+    first, second = create_items(2)
+    assert repo.delete_item_atomically(first) == (True, "Deleted")
+    assert repo.delete_item_atomically(first) == (False, "Not found")
+
+    assert repo.get_group_item_ids(group) == [second]
+    assert repo.get_group(group)["groupBalance"] == {"u1": 30, "u2": -10, "u3": -20}
+
+
+def test_transaction_retries_on_concurrent_change(repo, group):
+    ref = repo._ref(f"groups/{group}")
+    attempts = []
+
+    def bump(current):
+        attempts.append(current["rev"])
+        if len(attempts) == 1: repo._ref(f"groups/{group}/rev").set(current["rev"] + 10)  # a concurrent writer
+        current["rev"] += 1
+        return current
+    assert ref.transaction(bump)["rev"] == 12
+    assert attempts == [1, 11]
+
+
+def test_sqlite_backend_persists(tmp_path):
+    from local_repository import LocalRepository
+    path = str(tmp_path / "payplit.db")
+    LocalRepository(path).create_user("u1", {"name": "Asha", "email": "u1@example.com"})
+    assert LocalRepository(path).get_user("u1")["name"] == "Asha"
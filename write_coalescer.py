@@ -0,0 +1,129 @@
+import threading
+import time
+from database_interface import DelegatingRepository
+from firebase_repository import is_backend_error
+from split_logic import validate_item
+
+
+class _Pending:
+    __slots__ = ("mutation", "result", "error", "leads", "done")
+
+    def __init__(self, mutation):
+        self.mutation = mutation
+        self.result = None
+        self.error = None  # backend error, raised to the caller instead of a result
+        self.leads = False
+        self.done = threading.Event()
+
+
+class WriteCoalescer(DelegatingRepository):
+    """
+    Group commit for item writes. Concurrent create_item_atomically / delete_item_atomically
+    calls on the same group are queued per group. The first caller (the leader) waits up to
+    `window` seconds or until `max_batch` mutations are queued, applies them with a single
+    apply_item_mutations() (one group transaction, one ledger update) and hands every caller
+    its own result. Whatever queued meanwhile is led by its oldest caller.
+
+    Mutations are validated before they are queued, and a batch whose transaction fails is
+    retried one mutation at a time, so one bad item never fails its neighbours. A backend
+    error is not retried: it is raised to every caller of the batch.
+
+    Coalescing is per process; across gunicorn workers the group transaction still serializes.
+    """
+    def __init__(self, inner, window=0.005, max_batch=50):
+        super().__init__(inner)
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._queues = {}  # group_id -> [_Pending], present while the group has a leader
+        self.batches = 0
+        self.mutations = 0
+        self.largest_batch = 0
+        self.wait_seconds = 0.0
+        self.retried_batches = 0
+
+    def create_item_atomically(self, item_data):
+        try:
+            group_id = item_data["itemGroupId"]
+            validate_item(item_data, group_id)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return False, f"Invalid item: {e}"
+        return self._submit(group_id, ("create", item_data))
+
+    def delete_item_atomically(self, item_id):
+        item_data = self.inner.get_item(item_id)
+        if not item_data: return False, "Not found"
+        try:
+            validate_item(item_data, item_data["itemGroupId"])
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return False, f"Invalid item: {e}"
+        return self._submit(item_data["itemGroupId"], ("delete", item_data))
+
+    def _submit(self, group_id, mutation):
+        pending = _Pending(mutation)
+        with self._cond:
+            queue = self._queues.get(group_id)
+            if queue is None:
+                self._queues[group_id] = [pending]
+                pending.leads = True
+            else:
+                queue.append(pending)
+                if len(queue) >= self.max_batch: self._cond.notify_all()
+        if not pending.leads:
+            pending.done.wait()
+        if pending.leads:
+            self._lead(group_id)
+        if pending.error is not None: raise pending.error
+        return pending.result
+
+    def _lead(self, group_id):
+        started = time.monotonic()
+        with self._cond:
+            queue = self._queues[group_id]
+            deadline = started + self.window
+            while len(queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                self._cond.wait(remaining)
+            batch = queue[:self.max_batch]
+            del queue[:self.max_batch]
+            self.wait_seconds += time.monotonic() - started
+
+        results, errors = [None] * len(batch), [None] * len(batch)
+        try:
+            results = self.inner.apply_item_mutations(group_id, [p.mutation for p in batch])
+        except Exception as e:
+            if is_backend_error(e) or len(batch) == 1:
+                errors = [e] * len(batch)
+            else:
+                # Nothing was committed: apply each mutation on its own so only the culprit fails
+                for i, pending in enumerate(batch):
+                    try:
+                        results[i] = self.inner.apply_item_mutations(group_id, [pending.mutation])[0]
+                    except Exception as single:
+                        errors[i] = single
+                with self._cond: self.retried_batches += 1
+
+        with self._cond:
+            self.batches += 1
+            self.mutations += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            if queue:
+                queue[0].leads = True
+                queue[0].done.set()
+            else:
+                del self._queues[group_id]
+        for pending, result, error in zip(batch, results, errors):
+            if error is None: pending.result = tuple(result)
+            elif is_backend_error(error): pending.error = error
+            else: pending.result = (False, str(error))
+            pending.leads = False
+            pending.done.set()
+
+    def stats(self):
+        with self._cond:
+            return {"windowMs": self.window * 1000, "maxBatch": self.max_batch, "batches": self.batches,
+                    "mutations": self.mutations, "largestBatch": self.largest_batch,
+                    "avgBatch": round(self.mutations / self.batches, 2) if self.batches else 0,
+                    "avgWaitMs": round(self.wait_seconds * 1000 / self.batches, 3) if self.batches else 0,
+                    "retriedBatches": self.retried_batches, "activeGroups": len(self._queues)}